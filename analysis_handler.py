@@ -0,0 +1,193 @@
+from backend.answer_cache import answer_cache
+from backend.conversation import conversations, with_history
+from backend.image_handler import prepare_medical_image, stream_image_analysis
+from backend.lexical_index import BM25Index
+from backend.llm_gateway import llm
+from backend.metrics import span
+from backend.models.log_model import log_query
+from backend.pdf_handler import hash_pdf, cached_summary, read_pdf_passages, summary_prompt, stream_pdf_summary
+from backend.prompt_builder import build_rag_prompt, TEXT_RAG_TEMPLATE
+from backend.text_handler import retrieve_text
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# PDF chunks (most relevant to the question first) added to the answer's context
+ANALYZE_ATTACHMENT_PASSAGES = int(os.getenv("ANALYZE_ATTACHMENT_PASSAGES", "6"))
+
+ANALYZE_RAG_TEMPLATE = (
+    "Using the patient's own documents and the reference context below, answer the medical query:"
+    "\n\n{context}\n\nQuestion: {query}"
+)
+
+PART_TITLES = {"pdf": "PDF Summary", "image": "Image Analysis", "answer": "Answer"}
+
+# ------------------------------
+# Input stages
+# ------------------------------
+
+async def _read_pdf(stream, timings: dict):
+    pdf_hash = await hash_pdf(stream)
+    return pdf_hash, await read_pdf_passages(stream, pdf_hash, timings)
+
+def attachment_passages(query: str, passages: list, k: int = ANALYZE_ATTACHMENT_PASSAGES) -> list:
+    """
+    The PDF chunks that best match the question (BM25), or the first ones
+    when nothing matches.
+    """
+    if len(passages) <= k:
+        return passages
+    hits = BM25Index.build(enumerate(passages)).search(query, k)
+    return [passages[row] for row, _ in hits] or passages[:k]
+
+# ------------------------------
+# Answer parts (async token iterators; the LLM calls start on iteration)
+# ------------------------------
+
+async def _pdf_summary(pdf_hash: str, passages: list, timings: dict):
+    cached = await cached_summary(pdf_hash)
+    prompt = None if cached is not None else await summary_prompt(passages, timings)
+    async for token in stream_pdf_summary(pdf_hash, cached, prompt):
+        yield token
+
+async def _answer(query: str, prompt: str, query_embedding, namespace: str = None, user_id: str = None):
+    stream = llm.stream(prompt, route="text_rag")
+    async for token in stream:
+        yield token
+    if namespace is not None:
+        await answer_cache.store(namespace, query, stream.result.text, query_embedding)
+    if user_id:
+        await conversations.record(user_id, query, stream.result.text)
+
+async def _cached(text: str, query: str = None, user_id: str = None):
+    yield text
+    if user_id:
+        await conversations.record(user_id, query, text)
+
+async def _failed(error: Exception):
+    # A part whose input stage failed; merge_parts reports it like a failed generation
+    raise error
+    yield
+
+async def prepare_analysis(query: str = None, pdf_stream=None, image_file=None, user_id: str = None):
+    """
+    Runs the input stages of every given input concurrently: PDF hash and
+    parse, image OCR/BLIP and text retrieval. PDF chunks and the image's
+    OCR text or caption go into the answer's context, and with user_id
+    the conversation so far goes into its prompt. Returns (parts,
+    timings); parts maps "pdf" / "image" / "answer" to token iterators.
+    The uploads can be closed once this returns.
+    """
+    timings = {}
+    has_attachments = pdf_stream is not None or image_file is not None
+    session = await conversations.get(user_id) if user_id and query else None
+    has_history = session is not None and not session.is_empty()
+
+    stages = {}
+    if pdf_stream is not None:
+        stages["pdf"] = _read_pdf(pdf_stream, timings)
+    if image_file is not None:
+        stages["image"] = prepare_medical_image(image_file)
+    if query:
+        # Attachment- and history-aware answers are specific to this request; keep them out of the shared cache
+        retrieval_query = session.retrieval_query(query) if has_history else query
+        stages["text"] = retrieve_text(retrieval_query, use_cache=not (has_attachments or has_history))
+
+    start = time.perf_counter()
+    with span("analyze.inputs"):
+        # One bad input (a corrupt PDF, say) must not discard the stages that succeeded
+        results = dict(zip(stages, await asyncio.gather(*stages.values(), return_exceptions=True)))
+    timings["inputs_seconds"] = round(time.perf_counter() - start, 4)
+
+    parts, context = {}, []
+    for stage, part in (("pdf", "pdf"), ("image", "image"), ("text", "answer")):
+        error = results.get(stage)
+        if isinstance(error, BaseException):
+            if not isinstance(error, Exception):
+                raise error
+            parts[part] = _failed(error)
+            del results[stage]
+
+    if "pdf" in results:
+        pdf_hash, passages = results["pdf"]
+        parts["pdf"] = _pdf_summary(pdf_hash, passages, timings)
+        if query:
+            context += attachment_passages(query, passages)
+    if "image" in results:
+        method, summary_input, gpt_input, image_timings = results["image"]
+        parts["image"] = stream_image_analysis(gpt_input)
+        context.append(f"Patient image ({method}): {summary_input}")
+        timings["image_method"] = method
+        timings["image"] = image_timings
+    if "text" in results:
+        cached, docs, query_embedding, namespace = results["text"]
+        if cached is not None:
+            parts["answer"] = _cached(cached, query, user_id)
+        else:
+            template = ANALYZE_RAG_TEMPLATE if context else TEXT_RAG_TEMPLATE
+            fields = {}
+            if has_history:
+                template, fields = with_history(template), {"history": session.render()}
+            # Attachments first: pack_passages ranks by position, so they survive the budget
+            prompt, stats = build_rag_prompt(query, context + [doc.page_content for doc in docs], template, **fields)
+            timings["answer_context_tokens"] = stats["context_tokens"]
+            parts["answer"] = _answer(query, prompt, query_embedding, namespace, user_id)
+    # Same order as PART_TITLES whichever stages failed
+    return {name: parts[name] for name in PART_TITLES if name in parts}, timings
+
+# ------------------------------
+# Fan-in
+# ------------------------------
+
+async def merge_parts(parts: dict):
+    """
+    Runs every part concurrently and yields (part, token, error) as tokens
+    arrive; token None marks the end of a part, with `error` set if it
+    failed. One failing part does not stop the others.
+    """
+    queue = asyncio.Queue()
+
+    async def pump(name, tokens):
+        try:
+            async for token in tokens:
+                await queue.put((name, token, None))
+            await queue.put((name, None, None))
+        except Exception as e:
+            logger.warning("analyze part %s failed: %s", name, e)
+            await queue.put((name, None, e))
+
+    tasks = [asyncio.ensure_future(pump(name, tokens)) for name, tokens in parts.items()]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            name, token, error = await queue.get()
+            if token is None:
+                remaining -= 1
+            yield name, token, error
+    finally:
+        # Client went away mid-stream: stop the other generations too
+        for task in tasks:
+            task.cancel()
+
+async def collect_parts(parts: dict):
+    """
+    Returns ({part: text}, {part: error}) once every part has finished.
+    """
+    texts, errors = {name: [] for name in parts}, {}
+    async for name, token, error in merge_parts(parts):
+        if token is not None:
+            texts[name].append(token)
+        elif error is not None:
+            errors[name] = error
+    return {name: "".join(tokens).strip() for name, tokens in texts.items() if name not in errors}, errors
+
+async def log_analysis(user_id: str, query: str, pdf_name: str, image_name: str, texts: dict):
+    """
+    One log entry for the whole request; history shows the parts as sections.
+    """
+    inputs = [f"PDF: {pdf_name}" if pdf_name else None, f"Image: {image_name}" if image_name else None, query]
+    response = "\n\n".join(f"**{PART_TITLES[name]}**\n{text}" for name, text in texts.items())
+    await log_query(user_id, "analyze", " | ".join(item for item in inputs if item), response, extra={"parts": texts})
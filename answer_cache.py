@@ -0,0 +1,299 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# "memory" (per process), "mongo" (shared across workers) or "off"
+ANSWER_CACHE_BACKEND = os.getenv("ANSWER_CACHE_BACKEND", "memory")
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "86400"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+# Cosine similarity above which a different wording counts as the same question
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+# How often the mongo backend pulls embeddings other workers stored into its in-memory copy
+ANSWER_CACHE_SYNC_SECONDS = float(os.getenv("ANSWER_CACHE_SYNC_SECONDS", "30"))
+
+# ------------------------------
+# Keys
+# ------------------------------
+
+def normalize_query(query: str) -> str:
+    query = re.sub(r"\s+", " ", query.strip().lower())
+    return query.strip(" ?!.")
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def cache_key(namespace: str, text: str) -> str:
+    return hashlib.sha256(f"{namespace}:{text}".encode("utf-8")).hexdigest()
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype="float32")
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+# ------------------------------
+# Backends
+# ------------------------------
+
+class MemoryCacheBackend:
+    """
+    In-process LRU with per-entry expiry.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry["expires_at"] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    async def set(self, key: str, entry: dict):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def nearest(self, namespace: str, embedding: np.ndarray, threshold: float):
+        with self._lock:
+            now = time.time()
+            candidates = [
+                (key, entry) for key, entry in self._entries.items()
+                if entry["namespace"] == namespace and entry.get("embedding") is not None and entry["expires_at"] > now
+            ]
+            if not candidates:
+                return None
+
+            matrix = np.stack([entry["embedding"] for _, entry in candidates])
+            scores = matrix @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] < threshold:
+                return None
+
+            key, entry = candidates[best]
+            self._entries.move_to_end(key)
+            return entry
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MongoCacheBackend:
+    """
+    Shared cache in a MongoDB collection. Mongo's TTL monitor removes expired
+    entries; the least recently used ones are trimmed past `max_entries`.
+    Semantic lookups scan an in-memory copy of the embeddings, refreshed
+    from the collection every ANSWER_CACHE_SYNC_SECONDS.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES, collection_name: str = "answer_cache",
+                 sync_interval: float = ANSWER_CACHE_SYNC_SECONDS):
+        from backend.database import async_db
+
+        self.max_entries = max_entries
+        self.collection = async_db[collection_name]
+        self.sync_interval = sync_interval
+        self._indexes_ready = False
+        self._writes = 0
+        # key -> (namespace, unit embedding, expires_at), most recently stored last
+        self._vectors = OrderedDict()
+        self._synced_until = None
+        self._next_sync = 0.0
+
+    async def _ensure_indexes(self):
+        if not self._indexes_ready:
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+            await self.collection.create_index([("namespace", 1), ("last_access", -1)])
+            await self.collection.create_index("stored_at")
+            self._indexes_ready = True
+
+    def _remember(self, key: str, namespace: str, embedding: np.ndarray, expires_at: float):
+        self._vectors[key] = (namespace, embedding, expires_at)
+        self._vectors.move_to_end(key)
+        while len(self._vectors) > self.max_entries:
+            self._vectors.popitem(last=False)
+
+    async def _sync(self):
+        """
+        Pulls the embeddings stored since the last sync (by any worker).
+        """
+        now = time.time()
+        if now < self._next_sync:
+            return
+        self._next_sync = now + self.sync_interval
+        await self._ensure_indexes()
+
+        query = {"expires_at_ts": {"$gt": now}, "embedding": {"$ne": None}}
+        if self._synced_until is not None:
+            # Overlap one interval so writes from workers with slightly lagging clocks are not missed
+            query["stored_at"] = {"$gt": self._synced_until - self.sync_interval}
+        docs = await self.collection.find(
+            query, {"namespace": 1, "embedding": 1, "expires_at_ts": 1, "stored_at": 1},
+        ).sort("stored_at", -1).to_list(length=self.max_entries)
+
+        for doc in reversed(docs):
+            self._remember(doc["_id"], doc["namespace"], np.asarray(doc["embedding"], dtype="float32"), doc["expires_at_ts"])
+        self._synced_until = max([doc.get("stored_at", 0.0) for doc in docs] + [self._synced_until or 0.0])
+
+    async def get(self, key: str):
+        now = time.time()
+        entry = await self.collection.find_one_and_update(
+            {"_id": key, "expires_at_ts": {"$gt": now}},
+            {"$set": {"last_access": now}},
+        )
+        return self._decode(entry)
+
+    async def set(self, key: str, entry: dict):
+        await self._ensure_indexes()
+        doc = dict(entry)
+        if doc.get("embedding") is not None:
+            doc["embedding"] = doc["embedding"].tolist()
+        # Mongo's TTL index needs a datetime; comparisons use the float copy
+        doc["expires_at_ts"] = doc["expires_at"]
+        doc["expires_at"] = _to_datetime(doc["expires_at"])
+        doc["last_access"] = doc["stored_at"] = time.time()
+        await self.collection.replace_one({"_id": key}, doc, upsert=True)
+        if entry.get("embedding") is not None:
+            self._remember(key, entry["namespace"], entry["embedding"], entry["expires_at"])
+
+        self._writes += 1
+        if self._writes % 50 == 0:
+            await self._trim()
+
+    async def _trim(self):
+        overflow = await self.collection.estimated_document_count() - self.max_entries
+        if overflow <= 0:
+            return
+        stale = await self.collection.find({}, {"_id": 1}).sort("last_access", 1).to_list(length=overflow)
+        await self.collection.delete_many({"_id": {"$in": [doc["_id"] for doc in stale]}})
+
+    async def nearest(self, namespace: str, embedding: np.ndarray, threshold: float):
+        await self._sync()
+        now = time.time()
+        candidates = [
+            (key, vector) for key, (entry_namespace, vector, expires_at) in self._vectors.items()
+            if entry_namespace == namespace and expires_at > now
+        ]
+        if not candidates:
+            return None
+
+        matrix = np.stack([vector for _, vector in candidates])
+        scores = matrix @ embedding
+        best = int(np.argmax(scores))
+        if scores[best] < threshold:
+            return None
+        key = candidates[best][0]
+        entry = await self.get(key)
+        if entry is None:
+            # Trimmed or expired in Mongo since it was copied
+            self._vectors.pop(key, None)
+        return entry
+
+    @staticmethod
+    def _decode(entry):
+        if entry is None:
+            return None
+        entry["expires_at"] = entry.pop("expires_at_ts")
+        if entry.get("embedding") is not None:
+            entry["embedding"] = np.asarray(entry["embedding"], dtype="float32")
+        return entry
+
+
+def _to_datetime(ts: float):
+    from datetime import datetime
+    return datetime.utcfromtimestamp(ts)
+
+# ------------------------------
+# Answer cache
+# ------------------------------
+
+class AnswerCache:
+    """
+    Caches LLM answers by exact key (normalized query or content hash) and,
+    for text queries, by embedding similarity.
+    """
+
+    def __init__(self, backend, ttl: int = ANSWER_CACHE_TTL, similarity_threshold: float = ANSWER_CACHE_SIMILARITY):
+        self.backend = backend
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _count(self, attr: str):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    async def lookup(self, namespace: str, key_text: str, embed=None):
+        """
+        Returns (answer, embedding). `key_text` is a query (normalized here) or a
+        content hash. `embed` is an async callable, only awaited when the exact
+        key misses, so the caller can reuse the embedding for retrieval.
+        """
+        if self.backend is None:
+            return None, await embed() if embed is not None else None
+
+        entry = await self.backend.get(cache_key(namespace, normalize_query(key_text)))
+        if entry is not None:
+            self._count("hits")
+            return entry["answer"], None
+
+        embedding = await embed() if embed is not None else None
+        if embedding is not None:
+            entry = await self.backend.nearest(namespace, _unit(embedding), self.similarity_threshold)
+            if entry is not None:
+                self._count("semantic_hits")
+                return entry["answer"], embedding
+
+        self._count("misses")
+        return None, embedding
+
+    async def store(self, namespace: str, key_text: str, answer: str, embedding=None):
+        if self.backend is None:
+            return
+        await self.backend.set(cache_key(namespace, normalize_query(key_text)), {
+            "namespace": namespace,
+            "answer": answer,
+            "embedding": _unit(embedding) if embedding is not None else None,
+            "expires_at": time.time() + self.ttl,
+        })
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            "backend": type(self.backend).__name__ if self.backend is not None else None,
+            "entries": len(self.backend) if isinstance(self.backend, MemoryCacheBackend) else None,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+def create_answer_cache(backend_name: str = ANSWER_CACHE_BACKEND) -> AnswerCache:
+    if backend_name == "mongo":
+        backend = MongoCacheBackend()
+    elif backend_name == "off":
+        backend = None
+    else:
+        backend = MemoryCacheBackend()
+    return AnswerCache(backend)
+
+
+# Shared by the text RAG and PDF handlers
+answer_cache = create_answer_cache()
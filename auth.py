@@ -1,9 +1,16 @@
-from backend.database import users_collection
+from backend.database import async_users_collection
+from backend.executors import run_in_hash_pool, PASSWORD_HASH_WORKERS
 from passlib.context import CryptContext
 from jose import jwt, JWTError
+from pymongo.errors import DuplicateKeyError
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from bson import ObjectId
+import asyncio
+import hashlib
 import os
+import threading
+import time
 
 # Hashing context
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -12,6 +19,16 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
 ALGORITHM = "HS256"
 
+# Verified tokens remembered per process (0 disables the cache)
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+# How long a login/register waits for a bcrypt slot before answering 503
+PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", "5"))
+
+class AuthBusyError(Exception):
+    """
+    Raised when every bcrypt slot stayed busy for PASSWORD_HASH_QUEUE_TIMEOUT.
+    """
+
 # ------------------------------
 # Utility Functions
 # ------------------------------
@@ -22,6 +39,21 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+_hash_slots = asyncio.Semaphore(PASSWORD_HASH_WORKERS)
+
+async def _run_bcrypt(fn, *args):
+    """
+    Runs bcrypt on the dedicated pool, at most PASSWORD_HASH_WORKERS at a time.
+    """
+    try:
+        await asyncio.wait_for(_hash_slots.acquire(), PASSWORD_HASH_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise AuthBusyError("Too many concurrent logins, retry shortly")
+    try:
+        return await run_in_hash_pool(fn, *args)
+    finally:
+        _hash_slots.release()
+
 # ------------------------------
 # Token Management
 # ------------------------------
@@ -33,31 +65,109 @@ def create_access_token(user_id: str) -> str:
     }
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+class TokenCache:
+    """
+    LRU of already verified tokens, keyed by the token's SHA-256 so raw
+    tokens are not kept in memory. Entries are only served until the
+    token's own expiry.
+    """
+
+    def __init__(self, max_entries: int = TOKEN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str):
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            user_id, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return user_id
+
+    def set(self, token: str, user_id: str, expires_at: float):
+        if self.max_entries <= 0:
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (user_id, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+token_cache = TokenCache()
+
 def decode_access_token(token: str):
+    user_id = token_cache.get(token)
+    if user_id is not None:
+        return user_id
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload.get("sub")  # user_id
     except JWTError:
         return None
+    user_id = payload.get("sub")  # user_id
+    if user_id is not None and payload.get("exp") is not None:
+        token_cache.set(token, user_id, float(payload["exp"]))
+    return user_id
 
 # ------------------------------
 # Auth Workflows
 # ------------------------------
 
-def register_user(email: str, password: str):
-    if users_collection.find_one({"email": email}):
-        return False, "User already exists"
+# Set once the startup hook has created the unique email index
+unique_email_index = False
 
-    hashed = hash_password(password)
-    users_collection.insert_one({
-        "email": email,
-        "password": hashed
-    })
+async def ensure_user_indexes(collection=async_users_collection):
+    """
+    Unique emails are enforced by the database; register_user only reads
+    before inserting while this index is missing.
+    """
+    global unique_email_index
+    await collection.create_index("email", name="unique_email", unique=True, background=True)
+    unique_email_index = True
+
+async def register_user(email: str, password: str):
+    # Without the unique index (e.g. pre-existing duplicate emails) a read is the only guard
+    if not unique_email_index and await async_users_collection.find_one({"email": email}, {"_id": 1}):
+        return False, "User already exists"
+    hashed = await _run_bcrypt(hash_password, password)
+    try:
+        await async_users_collection.insert_one({
+            "email": email,
+            "password": hashed
+        })
+    except DuplicateKeyError:
+        return False, "User already exists"
     return True, "User registered successfully"
 
-def login_user(email: str, password: str):
-    user = users_collection.find_one({"email": email})
-    if not user or not verify_password(password, user["password"]):
+async def login_user(email: str, password: str):
+    user = await async_users_collection.find_one({"email": email}, {"password": 1})
+    if not user or not await _run_bcrypt(verify_password, password, user["password"]):
         return False, "Invalid credentials"
 
     token = create_access_token(user_id=str(user["_id"]))
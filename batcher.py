@@ -0,0 +1,102 @@
+import asyncio
+import contextvars
+import time
+from collections import Counter
+
+from backend.executors import run_in_thread
+
+# ------------------------------
+# Dynamic micro-batching
+# ------------------------------
+
+class MicroBatcher:
+    """
+    Collects concurrent requests into batches for one forward pass.
+
+    A batch is dispatched when it reaches `max_batch_size` or when the first
+    request in it has waited `max_wait_ms`. `batch_fn(items) -> results` is a
+    blocking function run on the thread pool; results are routed back to the
+    waiting coroutines in order.
+    """
+
+    def __init__(self, name: str, batch_fn, max_batch_size: int = 8, max_wait_ms: float = 10.0):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = None
+        self._worker = None
+
+        self.batches = 0
+        self.items = 0
+        self.batch_sizes = Counter()
+        self.batch_seconds = 0.0
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            # A fresh context so the long-lived worker holds no state of the request that started it
+            self._worker = contextvars.Context().run(asyncio.get_running_loop().create_task, self._run())
+
+    async def submit(self, item):
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Requests whose callers already gave up are dropped from the batch
+            batch = [(item, future) for item, future in batch if not future.cancelled()]
+            if not batch:
+                continue
+
+            start = time.perf_counter()
+            try:
+                results = await run_in_thread(self.batch_fn, [item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self.batch_seconds += time.perf_counter() - start
+                self.batches += 1
+                self.items += len(batch)
+                self.batch_sizes[len(batch)] += 1
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "mean_batch_ms": round(self.batch_seconds / self.batches * 1000, 2) if self.batches else 0.0,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+        }
@@ -0,0 +1,119 @@
+"""
+Recall@k and query latency of the ANN index types against exact (flat) search.
+
+Synthetic corpus:
+    python -m backend.benchmarks.bench_ann --vectors 200000 --dim 512
+
+Real corpora (the image embeddings memmap and/or the published text index):
+    python -m backend.benchmarks.bench_ann --real-image faiss_image_embeddings.npy --real-text faiss_text_index
+"""
+import argparse
+import json
+import os
+import time
+
+import faiss
+import numpy as np
+
+from backend.index_factory import INDEX_TYPES, build_index, reconstruct_all, set_search_params
+
+
+def synthetic_corpus(n_vectors, dim, n_clusters=256, seed=0):
+    # Clustered data: uniform random vectors make every ANN method look bad
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim)).astype("float32")
+    labels = rng.integers(0, n_clusters, size=n_vectors)
+    return centers[labels] + 0.3 * rng.normal(size=(n_vectors, dim)).astype("float32")
+
+
+def split_queries(vectors, n_queries, seed=1):
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(vectors), size=n_queries, replace=False)
+    # Perturbed copies so queries are close to, but not exactly, corpus points
+    return vectors[rows] + 0.05 * rng.normal(size=(n_queries, vectors.shape[1])).astype("float32")
+
+
+def recall_at_k(found, truth, k):
+    hits = sum(len(set(f[:k]) & set(t[:k])) for f, t in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def time_queries(index, queries, k):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+    return np.percentile(latencies, 50) * 1000, np.percentile(latencies, 99) * 1000
+
+
+def run_corpus(name, vectors, queries, k, nprobes, ef_searches):
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    flat = build_index("flat", vectors)
+    _, truth = flat.search(queries, k)
+    flat_p50, flat_p99 = time_queries(flat, queries, k)
+
+    results = [{"corpus": name, "index": "flat", "recall": 1.0, "p50_ms": round(flat_p50, 3), "p99_ms": round(flat_p99, 3)}]
+
+    for kind in INDEX_TYPES:
+        if kind == "flat":
+            continue
+        start = time.perf_counter()
+        index = build_index(kind, vectors)
+        build_seconds = time.perf_counter() - start
+
+        sweep = ef_searches if kind == "hnsw" else nprobes
+        for value in sweep:
+            if kind == "hnsw":
+                set_search_params(index, ef_search=value)
+            else:
+                set_search_params(index, nprobe=value)
+            _, found = index.search(queries, k)
+            p50, p99 = time_queries(index, queries, k)
+            results.append({
+                "corpus": name,
+                "index": kind,
+                "efSearch" if kind == "hnsw" else "nprobe": value,
+                "recall": round(recall_at_k(found, truth, k), 4),
+                "p50_ms": round(p50, 3),
+                "p99_ms": round(p99, 3),
+                "build_seconds": round(build_seconds, 2),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ANN recall/latency benchmark")
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--real-image", help="Path to faiss_image_embeddings.npy")
+    parser.add_argument("--real-text", help="Path to a flat text index directory (faiss_text_index, or faiss_text_index.build for ANN builds)")
+    parser.add_argument("--out", help="Also write the JSON report here")
+    args = parser.parse_args()
+
+    corpora = {}
+    if args.vectors:
+        corpora["synthetic"] = synthetic_corpus(args.vectors, args.dim)
+    if args.real_image:
+        corpora["image"] = np.load(args.real_image, mmap_mode="r")
+    if args.real_text:
+        corpora["text"] = reconstruct_all(faiss.read_index(os.path.join(args.real_text, "index.faiss")))
+
+    results = []
+    for name, vectors in corpora.items():
+        n_queries = min(args.queries, len(vectors))
+        queries = np.ascontiguousarray(split_queries(np.asarray(vectors), n_queries), dtype="float32")
+        results.extend(run_corpus(name, vectors, queries, args.k, args.nprobe, args.ef_search))
+
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Auth cost per request, in-process (no Mongo needed):
+
+- login bursts: bcrypt verify inline on the event loop (old) versus on the
+  capped bcrypt pool (new); reports throughput and the worst event-loop stall
+  a concurrent request would have seen
+- authenticated requests: full JWT verification every time (old) versus the
+  verified-token cache (new)
+
+    python -m backend.benchmarks.bench_auth --logins 64 --concurrency 16 --tokens 100 --verifications 100000
+
+For end-to-end numbers run load_test against /login on a live server.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")  # database.py requires it at import
+
+from jose import jwt
+
+from backend.auth import (
+    ALGORITHM, SECRET_KEY, _run_bcrypt, create_access_token, decode_access_token,
+    hash_password, token_cache, verify_password,
+)
+from backend.executors import PASSWORD_HASH_WORKERS, shutdown_executors
+
+PASSWORD = "correct horse battery staple"
+
+
+async def watch_loop(stop, interval=0.005):
+    """
+    Largest delay between when a 5 ms sleep should have woken and when it did.
+    """
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+async def login_burst(verify, hashed, logins, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            assert await verify(PASSWORD, hashed)
+
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(watch_loop(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(logins)))
+    wall = time.perf_counter() - start
+    stop.set()
+    worst_stall = await watcher
+    return {
+        "logins_per_second": round(logins / wall, 2),
+        "wall_seconds": round(wall, 3),
+        "max_loop_stall_ms": round(worst_stall * 1000, 1),
+    }
+
+
+async def inline_verify(password, hashed):
+    return verify_password(password, hashed)
+
+
+async def pooled_verify(password, hashed):
+    return await _run_bcrypt(verify_password, password, hashed)
+
+
+def verification_rate(verify, tokens, count):
+    start = time.perf_counter()
+    for i in range(count):
+        assert verify(tokens[i % len(tokens)]) is not None
+    return round(count / (time.perf_counter() - start), 1)
+
+
+def uncached_verify(token):
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+
+
+async def run(args):
+    hashed = hash_password(PASSWORD)
+    report = {"bcrypt_workers": PASSWORD_HASH_WORKERS, "logins": args.logins, "concurrency": args.concurrency}
+    report["login_inline"] = await login_burst(inline_verify, hashed, args.logins, args.concurrency)
+    report["login_pooled"] = await login_burst(pooled_verify, hashed, args.logins, args.concurrency)
+
+    tokens = [create_access_token(f"user_{i}") for i in range(args.tokens)]
+    report["verify_uncached_per_second"] = verification_rate(uncached_verify, tokens, args.verifications)
+    report["verify_cached_per_second"] = verification_rate(decode_access_token, tokens, args.verifications)
+    report["token_cache"] = token_cache.stats()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Auth benchmark")
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--tokens", type=int, default=100, help="Distinct users sending requests")
+    parser.add_argument("--verifications", type=int, default=100000)
+    parser.add_argument("--out", help="Also write the JSON report here")
+    args = parser.parse_args()
+
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        shutdown_executors()
+
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
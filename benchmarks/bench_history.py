@@ -0,0 +1,143 @@
+"""
+/history query cost at scale: the old unindexed, unprojected find + sort
+(paged with skip) versus the indexed, projected keyset query.
+
+Against a local mongod (meaningful timings, uses the real indexes):
+    python -m backend.benchmarks.bench_history --uri mongodb://localhost:27017 --rows 1000000
+
+Against mongomock (pip install mongomock; checks the paging logic, ignores indexes):
+    python -m backend.benchmarks.bench_history --mongomock --rows 100000
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")  # database.py requires it at import
+
+from backend.models.log_model import (
+    HISTORY_PROJECTION, HISTORY_SORT, LOG_INDEXES, encode_cursor, history_filter,
+)
+
+QUERY_TYPES = ("text", "pdf", "image", "image_rag")
+SEED_BATCH = 10000
+
+
+def get_collection(args):
+    if args.mongomock:
+        import mongomock
+        client = mongomock.MongoClient()
+    else:
+        from pymongo import MongoClient
+        client = MongoClient(args.uri)
+    return client[args.db]["query_logs"]
+
+
+def seed(collection, rows, users, seed=0):
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    batch = []
+    for i in range(rows):
+        batch.append({
+            "user_id": f"user_{rng.randrange(users)}",
+            "query_type": rng.choice(QUERY_TYPES),
+            "input_summary": "What does an HbA1c of 7.2% mean? " * 4,
+            "response": "An HbA1c of 7.2% indicates ... " * 40,
+            "model_used": "gpt-4",
+            "timestamp": start + timedelta(seconds=i * 7),
+        })
+        if len(batch) == SEED_BATCH:
+            collection.insert_many(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch)
+
+
+def old_page(collection, user_id, limit, page):
+    return list(collection.find({"user_id": user_id}).sort("timestamp", -1).skip(page * limit).limit(limit))
+
+
+def new_pages(collection, user_id, limit, pages, query_type=None):
+    cursor, timings = None, []
+    for _ in range(pages):
+        start = time.perf_counter()
+        entries = list(
+            collection.find(history_filter(user_id, cursor, query_type), HISTORY_PROJECTION)
+            .sort(HISTORY_SORT)
+            .limit(limit + 1)
+        )
+        timings.append(time.perf_counter() - start)
+        if len(entries) <= limit:
+            break
+        cursor = encode_cursor(entries[limit - 1])
+    return timings
+
+
+def ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/history query benchmark")
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="history_benchmark")
+    parser.add_argument("--mongomock", action="store_true")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=20, help="Users sampled per measurement")
+    parser.add_argument("--keep", action="store_true", help="Reuse an already seeded collection")
+    parser.add_argument("--out", help="Also write the JSON report here")
+    args = parser.parse_args()
+
+    collection = get_collection(args)
+    if not args.keep or collection.estimated_document_count() == 0:
+        collection.drop()
+        start = time.perf_counter()
+        seed(collection, args.rows, args.users)
+        print(f"✅ Seeded {args.rows} rows in {time.perf_counter() - start:.1f}s")
+
+    users = [f"user_{i}" for i in random.Random(1).sample(range(args.users), min(args.queries, args.users))]
+    report = {"rows": args.rows, "users": args.users, "limit": args.limit, "backend": "mongomock" if args.mongomock else "mongod"}
+
+    def run_old():
+        first, deep = [], []
+        for user_id in users:
+            start = time.perf_counter()
+            old_page(collection, user_id, args.limit, 0)
+            first.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            old_page(collection, user_id, args.limit, args.pages - 1)
+            deep.append(time.perf_counter() - start)
+        return {"first_page_ms": ms(sum(first) / len(first)), f"page_{args.pages}_ms": ms(sum(deep) / len(deep))}
+
+    def run_new(query_type=None):
+        first, deep = [], []
+        for user_id in users:
+            timings = new_pages(collection, user_id, args.limit, args.pages, query_type)
+            first.append(timings[0])
+            deep.append(timings[-1])
+        return {"first_page_ms": ms(sum(first) / len(first)), "last_page_ms": ms(sum(deep) / len(deep))}
+
+    for name in LOG_INDEXES:
+        if name in collection.index_information():
+            collection.drop_index(name)
+    report["old_unindexed"] = run_old()
+
+    for name, keys in LOG_INDEXES.items():
+        collection.create_index(keys, name=name)
+    report["old_indexed"] = run_old()
+    report["keyset"] = run_new()
+    report["keyset_filtered"] = run_new(query_type="pdf")
+
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
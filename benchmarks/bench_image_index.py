@@ -0,0 +1,67 @@
+"""
+CPU throughput of image index embedding: the old one-image-at-a-time loop
+versus the batched, multi-process pipeline.
+
+    python -m backend.benchmarks.bench_image_index --images 256 --batch-sizes 1 16 32 64 --workers 4
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")  # multimodel_index builds an embeddings client at import
+
+
+def make_images(folder, count, size=(640, 480)):
+    rng = np.random.default_rng(0)
+    for i in range(count):
+        pixels = rng.integers(0, 255, size=(size[1], size[0], 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(os.path.join(folder, f"img_{i:05d}.jpg"), quality=85)
+
+
+def sequential_baseline(paths, clip_model, clip_processor):
+    start = time.perf_counter()
+    for path in paths:
+        image = Image.open(path).convert("RGB")
+        inputs = clip_processor(images=image, return_tensors="pt")
+        clip_model.get_image_features(**inputs).detach().numpy()[0]
+    return len(paths) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CLIP image embedding throughput")
+    parser.add_argument("--images", type=int, default=128)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16, 32, 64])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--skip-baseline", action="store_true")
+    args = parser.parse_args()
+
+    from backend import multimodel_index
+    from backend.image_pipeline import list_images
+    from backend.model_registry import models
+
+    results = {"images": args.images, "workers": args.workers, "images_per_sec": {}}
+    with tempfile.TemporaryDirectory() as folder:
+        make_images(folder, args.images)
+        paths = list_images(folder)
+
+        if not args.skip_baseline:
+            results["images_per_sec"]["sequential"] = round(
+                sequential_baseline(paths, *models.get("clip")), 2
+            )
+
+        for batch_size in args.batch_sizes:
+            out_path = os.path.join(folder, "embeddings.npy")
+            start = time.perf_counter()
+            multimodel_index.embed_images(paths, batch_size=batch_size, workers=args.workers, out_path=out_path)
+            results["images_per_sec"][f"batched_{batch_size}"] = round(len(paths) / (time.perf_counter() - start), 2)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
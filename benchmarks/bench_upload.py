@@ -0,0 +1,112 @@
+"""
+Peak memory and latency of PDF upload handling: the old temp-file round trip
+(read the whole upload, write it to disk, parse, delete) versus parsing the
+upload's spooled buffer in place.
+
+    python -m backend.benchmarks.bench_upload --sizes-mb 1 10 50 100
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from pypdf import PdfWriter
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")  # pdf_handler builds a client at import
+
+from backend.pdf_ingest import load_pdf_chunks, pdf_sha256
+from backend.utils import UPLOAD_SPOOL_BYTES, generate_unique_filename, is_in_memory
+
+COPY_CHUNK = 1024 * 1024
+
+
+def make_pdf(path, size_mb, pages=20):
+    """
+    A few blank pages plus an incompressible attachment to reach the target size
+    (real clinical PDFs are mostly embedded scans).
+    """
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=612, height=792)
+    writer.add_attachment("padding.bin", os.urandom(size_mb * 1024 * 1024))
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+def spool(path, spool_bytes):
+    """
+    What Starlette hands the route: the body streamed into a SpooledTemporaryFile.
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=spool_bytes, mode="w+b")
+    with open(path, "rb") as f:
+        shutil.copyfileobj(f, buffer, COPY_CHUNK)
+    buffer.seek(0)
+    return buffer
+
+
+def old_path(buffer):
+    data = buffer.read()
+    temp_path = os.path.join(tempfile.gettempdir(), generate_unique_filename("upload.pdf"))
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    try:
+        with open(temp_path, "rb") as f:
+            chunks = load_pdf_chunks(f)
+    finally:
+        os.remove(temp_path)
+    return chunks
+
+
+def new_path(buffer):
+    pdf_sha256(buffer)
+    return load_pdf_chunks(buffer.read() if is_in_memory(buffer) else buffer)
+
+
+def measure(fn, path, spool_bytes, repeats):
+    latencies, peaks = [], []
+    for _ in range(repeats):
+        buffer = spool(path, spool_bytes)
+        tracemalloc.start()
+        start = time.perf_counter()
+        fn(buffer)
+        latencies.append(time.perf_counter() - start)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        buffer.close()
+    return {
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+        "peak_mb": round(max(peaks) / (1024 * 1024), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF upload handling benchmark")
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--spool-bytes", type=int, default=UPLOAD_SPOOL_BYTES)
+    parser.add_argument("--out", help="Also write the JSON report here")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for size_mb in args.sizes_mb:
+            path = os.path.join(folder, f"sample_{size_mb}mb.pdf")
+            make_pdf(path, size_mb)
+            results.append({
+                "size_mb": size_mb,
+                "spooled_in_memory": size_mb * 1024 * 1024 <= args.spool_bytes,
+                "temp_file": measure(old_path, path, args.spool_bytes, args.repeats),
+                "in_place": measure(new_path, path, args.spool_bytes, args.repeats),
+            })
+
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
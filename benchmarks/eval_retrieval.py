@@ -0,0 +1,89 @@
+"""
+Offline retrieval eval for the text index: hit rate, MRR and latency of
+vector-only, lexical-only and hybrid (RRF) retrieval over a query set.
+
+Query set: JSONL, one {"query": ..., "expected": ["text a relevant chunk contains", ...]} per line.
+
+    python -m backend.benchmarks.eval_retrieval --queries queries.jsonl --index faiss_text_index --k 3
+
+Set RERANKER_MODEL to include the cross-encoder in every mode.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from backend.index_manager import TextIndexManager
+from backend.model_registry import RERANKER_MODEL
+from backend.retrieval import RETRIEVAL_CANDIDATES, search
+from backend.text_handler import embedding_model
+
+MODES = ("vector", "lexical", "hybrid")
+
+
+def load_queries(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def first_hit_rank(docs, expected):
+    expected = [text.lower() for text in expected]
+    for rank, doc in enumerate(docs, start=1):
+        content = doc.page_content.lower()
+        if any(text in content for text in expected):
+            return rank
+    return None
+
+
+def evaluate(payload, queries, embeddings, mode, k, candidates):
+    ranks, latencies = [], []
+    for item, embedding in zip(queries, embeddings):
+        start = time.perf_counter()
+        docs = search(payload, item["query"], None if mode == "lexical" else embedding, k=k, mode=mode, candidates=candidates)
+        latencies.append(time.perf_counter() - start)
+        ranks.append(first_hit_rank(docs, item["expected"]))
+
+    hits = [rank for rank in ranks if rank is not None]
+    return {
+        "mode": mode,
+        f"hit@{k}": round(len(hits) / len(queries), 4),
+        "mrr": round(sum(1.0 / rank for rank in hits) / len(queries), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Text retrieval eval")
+    parser.add_argument("--queries", required=True)
+    parser.add_argument("--index", default="faiss_text_index")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--candidates", type=int, default=RETRIEVAL_CANDIDATES)
+    parser.add_argument("--out", help="Also write the JSON report here")
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries)
+    payload = TextIndexManager(args.index, embedding_model).get()
+
+    # Embedding time is reported apart: the lexical path never pays it
+    start = time.perf_counter()
+    embeddings = embedding_model.embed_documents([item["query"] for item in queries])
+    embed_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+    report = {
+        "queries": len(queries),
+        "chunks": len(payload[1]),
+        "reranker": RERANKER_MODEL or None,
+        "mean_embed_ms": round(embed_ms, 3),
+        "results": [evaluate(payload, queries, embeddings, mode, args.k, args.candidates) for mode in MODES],
+    }
+
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
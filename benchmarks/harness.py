@@ -0,0 +1,357 @@
+"""
+Offline benchmark harness: boots the backend with local stand-ins and
+replays a workload at a fixed concurrency, so two builds can be compared
+without OpenAI, MongoDB or model downloads.
+
+Stand-ins:
+    LLM          benchmarks/openai_stub.py, reached through LLM_BASE_URL
+    MongoDB      mongomock (MONGO_URI=mongomock://, pip install mongomock-motor)
+                 or a real mongod with --mongo-uri mongodb://localhost:27017
+    Embeddings   EMBEDDING_PROVIDER=hash over a seeded synthetic text index
+    BLIP / CLIP  tiny deterministic functions swapped into the micro-batchers
+
+    python -m backend.benchmarks.harness --concurrency 16 --requests 500 --label baseline --out base.json
+    python -m backend.benchmarks.harness --workload workload.jsonl --label candidate --out new.json
+
+Workload file, one JSON object per line (same shape as the default below):
+    {"endpoint": "/query-text-rag", "fields": {"query": ["normal HbA1c", "E11.9"]}, "weight": 6}
+    {"endpoint": "/upload-pdf", "file": "@pdf", "weight": 1}
+
+"{token}" in a field becomes the benchmark user's token and a list picks one
+value per request. "file" (or "files": {"pdf": ..., "image": ...} for
+/analyze) is a path, or "@pdf" / "@image" for a freshly generated sample
+(unique per request, so the answer cache misses).
+
+The backend runs in its own process; its peak RSS is read from /proc.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from backend.benchmarks.load_test import summarize
+
+BENCH_EMAIL = "bench@example.com"
+BENCH_PASSWORD = "bench-password"
+
+DEFAULT_WORKLOAD = [
+    {"endpoint": "/query-text-rag", "weight": 6, "fields": {"token": "{token}", "query": [
+        "What does an HbA1c of 7.2% mean?",
+        "normal TSH range",
+        "E11.9",
+        "first-line treatment for stage 1 hypertension",
+        "symptoms of iron deficiency anaemia",
+        "LDL target after myocardial infarction",
+    ]}},
+    {"endpoint": "/upload-pdf", "weight": 1, "file": "@pdf", "fields": {"token": "{token}"}},
+    {"endpoint": "/upload-image", "weight": 1, "file": "@image", "fields": {"token": "{token}"}},
+    {"endpoint": "/history", "weight": 2, "fields": {"token": "{token}", "limit": "10"}},
+    {"endpoint": "/login", "weight": 1, "fields": {"email": BENCH_EMAIL, "password": BENCH_PASSWORD}},
+    {"endpoint": "/analyze", "weight": 1, "files": {"pdf": "@pdf", "image": "@image"},
+     "fields": {"token": "{token}", "query": "Is the HbA1c in this report within target?"}},
+]
+
+CONDITIONS = ["type 2 diabetes", "hypothyroidism", "hypertension", "iron deficiency anaemia",
+              "chronic kidney disease", "hyperlipidaemia", "asthma", "atrial fibrillation"]
+MARKERS = ["HbA1c", "TSH", "blood pressure", "ferritin", "eGFR", "LDL cholesterol", "FEV1", "INR"]
+
+# ------------------------------
+# Stand-ins and sample inputs
+# ------------------------------
+
+def synthetic_corpus(size: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    return [
+        f"In {rng.choice(CONDITIONS)}, {rng.choice(MARKERS)} is checked every {rng.randint(1, 12)} months; "
+        f"a value above {rng.randint(5, 200)} suggests {rng.choice(['poor control', 'progression', 'a dose change', 'referral'])}. "
+        f"Case note {i}."
+        for i in range(size)
+    ]
+
+def sample_pdf(seed: int, pages: int = 3) -> bytes:
+    """
+    A small text PDF written by hand, so no PDF library is needed to make one.
+    """
+    rng = random.Random(seed)
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for _ in range(pages):
+        lines = [f"Report {seed}: " + line for line in synthetic_corpus(30, rng.random())]
+        text = " T* ".join(f"({line[:90]}) Tj" for line in lines)
+        stream = f"BT /F1 9 Tf 12 TL 40 800 Td {text} ET".encode("latin-1")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n".encode("latin-1") + stream + b"\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Contents {len(objects)} 0 R "
+                       f"/Resources << /Font << /F1 3 0 R >> >> >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+
+    out, offsets = io.BytesIO(), []
+    out.write(b"%PDF-1.4\n")
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        body = body if isinstance(body, bytes) else body.encode("latin-1")
+        out.write(f"{number} 0 obj\n".encode("latin-1") + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1"))
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode("latin-1"))
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1"))
+    return out.getvalue()
+
+def sample_image(seed: int) -> bytes:
+    """
+    A dark, flat, saturated photo stand-in: the OCR pre-check routes it to BLIP.
+    """
+    from PIL import Image
+
+    rng = random.Random(seed)
+    colour = (rng.randint(60, 120), rng.randint(0, 40), rng.randint(0, 40))
+    out = io.BytesIO()
+    Image.new("RGB", (320, 240), colour).save(out, format="PNG")
+    return out.getvalue()
+
+def fake_blip_captions(images: list) -> list:
+    time.sleep(0.002 * len(images))
+    return [f"a medical photograph of {image.size[0]}x{image.size[1]} pixels" for image in images]
+
+def fake_clip_embeddings(images: list) -> list:
+    import numpy as np
+
+    time.sleep(0.001 * len(images))
+    rng = np.random.default_rng(len(images))
+    return list(rng.standard_normal((len(images), 512)).astype("float32"))
+
+def serve(port: int, workdir: str, corpus_docs: int):
+    """
+    Runs the backend in this process with the stand-ins installed.
+    """
+    import uvicorn
+    from langchain_community.vectorstores import FAISS
+
+    from backend.main import app
+    from backend.image_handler import blip_batcher
+    from backend.index_manager import TEXT_INDEX_PATH, publish_text_index
+    from backend.rag_query import clip_batcher
+    from backend.text_handler import embedding_model
+
+    # Index paths are relative; keep the seeded index out of the real one
+    os.chdir(workdir)
+    if not os.path.exists(os.path.join(TEXT_INDEX_PATH, "index.faiss")):
+        store = FAISS.from_texts(synthetic_corpus(corpus_docs), embedding_model)
+        publish_text_index(store, TEXT_INDEX_PATH)
+
+    blip_batcher.batch_fn = fake_blip_captions
+    clip_batcher.batch_fn = fake_clip_embeddings
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+# ------------------------------
+# Processes
+# ------------------------------
+
+def free_port():
+    import socket
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_until_ready(url: str, process, timeout: float = 120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready in {timeout}s")
+
+def peak_rss_bytes(pid: int):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except FileNotFoundError:
+        pass
+    return None
+
+def start_processes(args, workdir):
+    stub_port, app_port = free_port(), free_port()
+    stub = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.benchmarks.openai_stub:app",
+         "--port", str(stub_port), "--log-level", "warning"],
+        env={**os.environ, "STUB_LATENCY_MS": str(args.llm_latency_ms)},
+    )
+    env = {
+        **os.environ,
+        "MONGO_URI": args.mongo_uri,
+        "EMBEDDING_PROVIDER": "hash",
+        "LLM_BASE_URL": f"http://127.0.0.1:{stub_port}/v1",
+        "OPENAI_API_KEY": "stub",
+        "PRELOAD_MODELS": "",
+        "SLOW_REQUEST_MS": "0",
+    }
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "backend.benchmarks.harness", "--serve",
+         "--port", str(app_port), "--workdir", workdir, "--corpus-docs", str(args.corpus_docs)],
+        env=env,
+    )
+    wait_until_ready(f"http://127.0.0.1:{stub_port}/v1/models", stub)
+    wait_until_ready(f"http://127.0.0.1:{app_port}/ready", backend)
+    return stub, backend, f"http://127.0.0.1:{app_port}"
+
+# ------------------------------
+# Workload replay
+# ------------------------------
+
+def load_workload(path: str) -> list:
+    if not path:
+        return DEFAULT_WORKLOAD
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def plan_requests(workload: list, total: int, seed: int) -> list:
+    """
+    Draws every request up front as (endpoint, fields, files), with list
+    fields already picked and a seed fixed for each generated sample, so
+    a --seed replays the same requests however the responses interleave.
+    """
+    rng = random.Random(seed)
+    entries = rng.choices(workload, weights=[entry.get("weight", 1) for entry in workload], k=total)
+    plan = []
+    for entry in entries:
+        fields = {
+            name: rng.choice(value) if isinstance(value, list) else value
+            for name, value in entry.get("fields", {}).items()
+        }
+        sources = dict(entry.get("files", {}))
+        if entry.get("file"):
+            sources["file"] = entry["file"]
+        files = {
+            name: (source, rng.randrange(1 << 30)) if source in ("@pdf", "@image") else (source, None)
+            for name, source in sources.items()
+        }
+        plan.append((entry["endpoint"], fields, files))
+    return plan
+
+def build_request(planned: tuple, token: str, files_cache: dict):
+    _, planned_fields, planned_files = planned
+    fields = {name: str(value).replace("{token}", token) for name, value in planned_fields.items()}
+
+    files = {}
+    for name, (source, sample_seed) in planned_files.items():
+        if source == "@pdf":
+            files[name] = ("sample.pdf", sample_pdf(sample_seed), "application/pdf")
+        elif source == "@image":
+            files[name] = ("sample.png", sample_image(sample_seed), "image/png")
+        else:
+            if source not in files_cache:
+                with open(source, "rb") as f:
+                    files_cache[source] = f.read()
+            files[name] = (os.path.basename(source), files_cache[source], "application/octet-stream")
+    return fields, files or None
+
+async def get_token(client: httpx.AsyncClient) -> str:
+    await client.post("/register", data={"email": BENCH_EMAIL, "password": BENCH_PASSWORD})
+    resp = await client.post("/login", data={"email": BENCH_EMAIL, "password": BENCH_PASSWORD})
+    resp.raise_for_status()
+    return resp.json()["access_token"]
+
+async def replay(base_url: str, workload: list, concurrency: int, total: int, timeout: float, seed: int):
+    schedule = iter(plan_requests(workload, total, seed))
+    latencies = {entry["endpoint"]: [] for entry in workload}
+    errors = {endpoint: 0 for endpoint in latencies}
+    files_cache = {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        token = await get_token(client)
+
+        async def worker():
+            for planned in schedule:
+                endpoint = planned[0]
+                fields, files = build_request(planned, token, files_cache)
+                start = time.perf_counter()
+                try:
+                    ok = (await client.post(endpoint, data=fields, files=files)).status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies[endpoint].append(time.perf_counter() - start)
+                else:
+                    errors[endpoint] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+
+        server_stats = {}
+        for name in ("latency-stats", "llm-stats", "log-stats", "batch-stats", "cache-stats"):
+            server_stats[name] = (await client.get(f"/{name}")).json()
+
+    return latencies, errors, wall, server_stats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workload", help="JSONL workload file (default: built-in mix)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mongo-uri", default="mongomock://localhost")
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0)
+    parser.add_argument("--corpus-docs", type=int, default=2000)
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--out")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.workdir, args.corpus_docs)
+        return
+
+    workload = load_workload(args.workload)
+    with tempfile.TemporaryDirectory(prefix="bench_") as workdir:
+        stub, backend, base_url = start_processes(args, workdir)
+        try:
+            latencies, errors, wall, server_stats = asyncio.run(
+                replay(base_url, workload, args.concurrency, args.requests, args.timeout, args.seed)
+            )
+            peak_rss = peak_rss_bytes(backend.pid)
+        finally:
+            for process in (backend, stub):
+                process.terminate()
+                process.wait(timeout=10)
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    report = summarize(args.label, all_latencies, sum(errors.values()), wall, args.concurrency)
+    report["peak_rss_bytes"] = peak_rss
+    report["mongo"] = "mongomock" if args.mongo_uri.startswith("mongomock://") else args.mongo_uri
+    report["endpoints"] = {
+        endpoint: summarize(endpoint, values, errors[endpoint], wall, args.concurrency)
+        for endpoint, values in latencies.items()
+    }
+    report["server"] = server_stats
+
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 Report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Concurrent load generator for a running backend.
+
+Run it once against the old build and once against the new one with the same
+arguments, then compare the JSON reports:
+
+    python -m backend.benchmarks.load_test --endpoint /query-text-rag --token $TOKEN \
+        --field query="what is normal HbA1c" --concurrency 16 --requests 200 \
+        --label async --out bench_async.json
+"""
+import argparse
+import asyncio
+import json
+import mimetypes
+import os
+import time
+
+import httpx
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(label, latencies, errors, wall_seconds, concurrency):
+    return {
+        "label": label,
+        "concurrency": concurrency,
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(len(latencies) / wall_seconds, 2) if wall_seconds else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "max": round(max(latencies) * 1000, 1) if latencies else 0.0,
+        },
+    }
+
+
+async def run_load(url, fields, file_path, concurrency, total, timeout):
+    file_bytes = None
+    if file_path:
+        with open(file_path, "rb") as f:
+            file_bytes = f.read()
+        file_name = os.path.basename(file_path)
+        file_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+
+    latencies = []
+    errors = 0
+    remaining = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        async def worker():
+            nonlocal errors
+            for _ in remaining:
+                files = {"file": (file_name, file_bytes, file_type)} if file_bytes is not None else None
+                start = time.perf_counter()
+                try:
+                    resp = await client.post(url, data=fields, files=files)
+                    ok = resp.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+
+    return latencies, errors, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent throughput benchmark for the FastAPI backend")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--endpoint", default="/query-text-rag")
+    parser.add_argument("--token", default=os.getenv("BENCH_TOKEN"))
+    parser.add_argument("--field", action="append", default=[], help="Extra form field as key=value")
+    parser.add_argument("--file", help="File to upload as the `file` form field")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--out", help="Write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    fields = dict(item.split("=", 1) for item in args.field)
+    if args.token:
+        fields["token"] = args.token
+
+    latencies, errors, wall = asyncio.run(run_load(
+        args.base_url + args.endpoint, fields, args.file, args.concurrency, args.requests, args.timeout
+    ))
+    report = summarize(args.label, latencies, errors, wall, args.concurrency)
+    report["endpoint"] = args.endpoint
+
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Minimal OpenAI-compatible server for offline runs of the LLM gateway,
+load tests and the benchmark harness. Answers are canned; latency is
+simulated.
+
+    uvicorn backend.benchmarks.openai_stub:app --port 8001
+    LLM_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=stub uvicorn backend.main:app
+
+Prompt directives (for exercising error paths):
+    [[sleep:2.5]]       wait this many seconds before answering
+    [[fail:gpt-4]]      answer 503 when this model is requested
+    [[flaky:2]]         answer 503 to the first 2 requests carrying this prompt
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "50"))
+STUB_TOKEN_MS = float(os.getenv("STUB_TOKEN_MS", "5"))
+STUB_REPLY_TOKENS = int(os.getenv("STUB_REPLY_TOKENS", "40"))
+STUB_ERROR_RATE = float(os.getenv("STUB_ERROR_RATE", "0"))
+STUB_EMBEDDING_DIM = int(os.getenv("STUB_EMBEDDING_DIM", "1536"))
+
+app = FastAPI()
+counters = {"chat": 0, "embeddings": 0, "errors": 0}
+# Requests seen per [[flaky:N]] prompt
+_flaky_attempts = {}
+
+
+def _prompt_text(messages):
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        parts.append(content or "")
+    return "\n".join(parts)
+
+
+def _reply_tokens(prompt, model, max_tokens):
+    words = re.findall(r"\w+", prompt)[:8]
+    base = f"Stub answer from {model} about {' '.join(words) or 'nothing'}."
+    filler = " The findings are within the expected range for this context."
+    text = base + filler * 4
+    tokens = [token + " " for token in text.split()]
+    return tokens[:max(1, min(max_tokens or STUB_REPLY_TOKENS, STUB_REPLY_TOKENS))]
+
+
+def _error(status, message):
+    counters["errors"] += 1
+    return JSONResponse({"error": {"message": message, "type": "stub_error"}}, status_code=status)
+
+
+@app.get("/v1/models")
+def list_models():
+    return {"object": "list", "data": [{"id": "gpt-4", "object": "model"}, {"id": "gpt-4o-mini", "object": "model"}]}
+
+
+@app.get("/stub-stats")
+def stub_stats():
+    return counters
+
+
+@app.post("/stub-reset")
+def stub_reset():
+    for key in counters:
+        counters[key] = 0
+    _flaky_attempts.clear()
+    return counters
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    counters["chat"] += 1
+    model = body.get("model", "gpt-4")
+    prompt = _prompt_text(body.get("messages", []))
+
+    sleep = re.search(r"\[\[sleep:([\d.]+)\]\]", prompt)
+    await asyncio.sleep(float(sleep.group(1)) if sleep else STUB_LATENCY_MS / 1000)
+    if f"[[fail:{model}]]" in prompt:
+        return _error(503, f"{model} is unavailable")
+    flaky = re.search(r"\[\[flaky:(\d+)\]\]", prompt)
+    if flaky:
+        _flaky_attempts[prompt] = _flaky_attempts.get(prompt, 0) + 1
+        if _flaky_attempts[prompt] <= int(flaky.group(1)):
+            return _error(503, "temporarily unavailable")
+    if STUB_ERROR_RATE and random.random() < STUB_ERROR_RATE:
+        return _error(500, "injected failure")
+
+    tokens = _reply_tokens(prompt, model, body.get("max_tokens"))
+    usage = {
+        "prompt_tokens": len(prompt.split()),
+        "completion_tokens": len(tokens),
+        "total_tokens": len(prompt.split()) + len(tokens),
+    }
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+
+    if not body.get("stream"):
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens).strip()}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+
+    include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+    async def events():
+        for token in tokens:
+            chunk = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(STUB_TOKEN_MS / 1000)
+        final = {
+            "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }
+        yield f"data: {json.dumps(final)}\n\n"
+        if include_usage:
+            yield f"data: {json.dumps({'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model, 'choices': [], 'usage': usage})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    counters["embeddings"] += 1
+    inputs = body.get("input", [])
+    if isinstance(inputs, (str, int)) or (inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+    await asyncio.sleep(STUB_LATENCY_MS / 1000)
+
+    data = []
+    for i, text in enumerate(inputs):
+        # Deterministic per input so identical texts embed identically
+        seed = int.from_bytes(hashlib.sha256(str(text).encode("utf-8")).digest()[:8], "little")
+        rng = random.Random(seed)
+        vector = [rng.gauss(0, 1) for _ in range(STUB_EMBEDDING_DIM)]
+        norm = sum(value * value for value in vector) ** 0.5
+        data.append({"object": "embedding", "index": i, "embedding": [value / norm for value in vector]})
+
+    return {
+        "object": "list",
+        "data": data,
+        "model": body.get("model", "text-embedding-ada-002"),
+        "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+    }
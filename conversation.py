@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+
+from backend.llm_gateway import llm
+from backend.models.log_model import fetch_history
+from backend.prompt_builder import truncate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Recent turns kept verbatim; older ones are folded into the running summary
+CONVERSATION_TURNS = int(os.getenv("CONVERSATION_TURNS", "4"))
+CONVERSATION_TURN_MAX_TOKENS = int(os.getenv("CONVERSATION_TURN_MAX_TOKENS", "150"))
+CONVERSATION_MEMORY_TOKENS = int(os.getenv("CONVERSATION_MEMORY_TOKENS", "250"))
+# A question after this much silence starts a new conversation
+CONVERSATION_IDLE_SECONDS = float(os.getenv("CONVERSATION_IDLE_SECONDS", "1800"))
+# Sessions kept in this process (LRU); evicted ones are rebuilt from the logs
+CONVERSATION_SESSIONS = int(os.getenv("CONVERSATION_SESSIONS", "1000"))
+CONVERSATION_SUMMARY_MODEL = os.getenv("CONVERSATION_SUMMARY_MODEL", "") or None
+
+# Logged query types that count as conversation turns
+CONVERSATION_QUERY_TYPES = ("text", "analyze")
+
+FOLD_PROMPT = (
+    "Update the running summary of a conversation between a clinician and a medical assistant "
+    "with the exchanges below. Keep patient details, lab values, diagnoses, medications and open "
+    "questions; drop pleasantries. Answer with the updated summary only, at most {words} words.\n\n"
+    "Summary so far:\n{memory}\n\nNew exchanges:\n{turns}"
+)
+
+HISTORY_TEMPLATE_PREFIX = "Conversation so far (for resolving follow-up questions):\n{history}\n\n"
+
+def with_history(template: str) -> str:
+    """
+    A RAG template that also takes a `history` field.
+    """
+    return HISTORY_TEMPLATE_PREFIX + template
+
+def _format_turns(turns) -> str:
+    return "\n".join(f"Q: {question}\nA: {answer}" for question, answer in turns)
+
+# ------------------------------
+# Sessions
+# ------------------------------
+
+class ConversationSession:
+    """
+    One user's conversation: a summary of older turns (`memory`) plus the
+    last CONVERSATION_TURNS turns verbatim, each cut to a token cap, so the
+    rendered history never exceeds a fixed number of tokens.
+    """
+
+    def __init__(self, user_id: str, turns=(), memory: str = ""):
+        self.user_id = user_id
+        self.turns = deque(turns)
+        self.memory = memory
+        self.last_active = time.monotonic()
+        # Fold of evicted turns still running; awaited before the next render
+        self.pending = None
+
+    def is_empty(self) -> bool:
+        return not self.turns and not self.memory
+
+    def render(self) -> str:
+        parts = []
+        if self.memory:
+            parts.append(f"Summary of earlier turns: {self.memory}")
+        if self.turns:
+            parts.append(_format_turns(self.turns))
+        return "\n\n".join(parts)
+
+    def retrieval_query(self, question: str) -> str:
+        """
+        Follow-ups ("and the second value?") retrieve poorly on their own;
+        the previous question carries the topic.
+        """
+        if not self.turns:
+            return question
+        return f"{self.turns[-1][0]} {question}"
+
+
+class ConversationStore:
+    """
+    Per-user sessions cached in process with LRU eviction. A missing session
+    is rebuilt from the user's recent question logs.
+    """
+
+    def __init__(self, max_sessions: int = CONVERSATION_SESSIONS, window: int = CONVERSATION_TURNS):
+        self.max_sessions = max_sessions
+        self.window = window
+        self._sessions = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.folds = 0
+        self.fold_failures = 0
+
+    async def _load(self, user_id: str) -> ConversationSession:
+        # Over-fetch a little: PDF and image logs in between are skipped
+        entries, _ = await fetch_history(user_id, limit=self.window * 2)
+        cutoff = datetime.utcnow() - timedelta(seconds=CONVERSATION_IDLE_SECONDS)
+        recent = [
+            entry for entry in entries
+            if entry.get("query_type") in CONVERSATION_QUERY_TYPES and entry["timestamp"] >= cutoff
+        ][:self.window]
+        turns = [
+            (truncate_tokens(entry.get("input_summary", ""), CONVERSATION_TURN_MAX_TOKENS),
+             truncate_tokens(entry.get("response", ""), CONVERSATION_TURN_MAX_TOKENS))
+            for entry in reversed(recent)
+        ]
+        return ConversationSession(user_id, turns)
+
+    async def get(self, user_id: str) -> ConversationSession:
+        session = self._sessions.get(user_id)
+        if session is not None and time.monotonic() - session.last_active > CONVERSATION_IDLE_SECONDS:
+            self.expired += 1
+            session = None
+            del self._sessions[user_id]
+
+        if session is None:
+            self.misses += 1
+            session = await self._load(user_id)
+            self._sessions[user_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+        else:
+            self.hits += 1
+            self._sessions.move_to_end(user_id)
+
+        if session.pending is not None:
+            await session.pending
+        return session
+
+    async def record(self, user_id: str, question: str, answer: str):
+        """
+        Adds a finished turn. Turns pushed out of the window are summarized
+        in the background; the next `get` waits for that.
+        """
+        session = self._sessions.get(user_id)
+        if session is None:
+            session = await self.get(user_id)
+        session.turns.append((
+            truncate_tokens(question, CONVERSATION_TURN_MAX_TOKENS),
+            truncate_tokens(answer, CONVERSATION_TURN_MAX_TOKENS),
+        ))
+        session.last_active = time.monotonic()
+
+        overflow = []
+        while len(session.turns) > self.window:
+            overflow.append(session.turns.popleft())
+        if overflow:
+            session.pending = asyncio.ensure_future(self._fold(session, overflow, session.pending))
+
+    async def _fold(self, session: ConversationSession, turns: list, previous):
+        if previous is not None:
+            await previous
+        prompt = FOLD_PROMPT.format(
+            words=int(CONVERSATION_MEMORY_TOKENS * 0.75),
+            memory=session.memory or "(none)",
+            turns=_format_turns(turns),
+        )
+        try:
+            result = await llm.complete(prompt, route="conversation", model=CONVERSATION_SUMMARY_MODEL,
+                                        max_tokens=CONVERSATION_MEMORY_TOKENS, temperature=0.0)
+            memory = result.text
+            self.folds += 1
+        except Exception as e:
+            # Keep the gist rather than lose the turns: append them and cut to budget below
+            logger.warning("Conversation summary for %s failed: %s", session.user_id, e)
+            self.fold_failures += 1
+            memory = f"{session.memory} {_format_turns(turns)}".strip()
+        session.memory = truncate_tokens(memory, CONVERSATION_MEMORY_TOKENS)
+        if session.pending is asyncio.current_task():
+            session.pending = None
+
+    def reset(self, user_id: str):
+        """
+        Starts a new conversation; earlier logs are not reloaded for it.
+        """
+        self._sessions[user_id] = ConversationSession(user_id)
+        self._sessions.move_to_end(user_id)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "window": self.window,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "folds": self.folds,
+            "fold_failures": self.fold_failures,
+        }
+
+
+conversations = ConversationStore()
@@ -3,14 +3,33 @@ load_dotenv()
 
 import os
 from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 
 # Fail fast if MONGO_URI is not set
 MONGO_URI = os.getenv("MONGO_URI")
 if not MONGO_URI:
     raise ValueError("❌ MONGO_URI environment variable not set. Please set it in your .env file.")
 
-client = MongoClient(MONGO_URI)
+if MONGO_URI.startswith("mongomock://"):
+    # In-memory stand-in for offline benchmarks (pip install mongomock-motor).
+    # The sync and async clients do not share data; the request path is async only.
+    import mongomock
+    from mongomock_motor import AsyncMongoMockClient
+
+    client = mongomock.MongoClient()
+    async_client = AsyncMongoMockClient()
+else:
+    client = MongoClient(MONGO_URI)
+    # Async (Motor) handles for the FastAPI request path
+    async_client = AsyncIOMotorClient(MONGO_URI)
+
 db = client["medical_bot"]
 
 users_collection = db["users"]
 logs_collection = db["query_logs"]
+
+async_db = async_client["medical_bot"]
+
+async_users_collection = async_db["users"]
+async_logs_collection = async_db["query_logs"]
+
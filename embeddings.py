@@ -0,0 +1,208 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from backend.executors import run_in_thread
+from backend.model_registry import models, LOCAL_EMBEDDING_MODEL, LOCAL_EMBEDDING_BACKEND, LOCAL_EMBEDDING_FILE
+
+# "openai" (remote), "local" (sentence-transformers on CPU) or "hash" (offline, no model)
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai")
+OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-ada-002")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+# Per-process LRU of query text -> float32 vector (0 disables); ~6 KB per entry at 1536 dims
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2000"))
+HASH_EMBEDDING_DIM = int(os.getenv("HASH_EMBEDDING_DIM", "384"))
+
+# What indexes published before model ids were recorded were built with
+LEGACY_EMBEDDING_MODEL = "openai:text-embedding-ada-002"
+
+class EmbeddingMismatchError(ValueError):
+    """
+    Raised when an index was built with a different embedding model.
+    """
+
+# ------------------------------
+# Provider interface
+# ------------------------------
+
+class EmbeddingProvider(Embeddings):
+    """
+    LangChain-compatible embeddings with batching and a query cache.
+    Subclasses implement `_embed_batch(texts) -> list of vectors` and set
+    `model_id`, which is recorded in index metadata. Document embeddings
+    (index builds) bypass the cache so they cannot push out query vectors.
+    """
+
+    model_id = "unknown"
+
+    def __init__(self, batch_size: int = EMBEDDING_BATCH_SIZE, cache_size: int = EMBEDDING_CACHE_SIZE):
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _embed_batch(self, texts: list) -> list:
+        raise NotImplementedError
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _cache_get(self, key: str):
+        """
+        The cached vector as a list, or None. Counts the hit or miss.
+        """
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+        return vector.tolist()
+
+    def _cache_put(self, key: str, vector):
+        if self.cache_size <= 0:
+            return
+        # float32 array: ~8x smaller than a list of Python floats
+        vector = np.asarray(vector, dtype="float32")
+        with self._lock:
+            self._cache[key] = vector
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def embed_documents(self, texts: list) -> list:
+        # Duplicates within one call are embedded once
+        rows = {}
+        for i, text in enumerate(texts):
+            rows.setdefault(text, []).append(i)
+
+        vectors = [None] * len(texts)
+        unique = list(rows)
+        for offset in range(0, len(unique), self.batch_size):
+            batch_texts = unique[offset:offset + self.batch_size]
+            for text, vector in zip(batch_texts, self._embed_batch(batch_texts)):
+                for i in rows[text]:
+                    vectors[i] = vector
+        return vectors
+
+    def embed_query(self, text: str) -> list:
+        key = self._key(text)
+        vector = self._cache_get(key)
+        if vector is None:
+            vector = self._embed_batch([text])[0]
+            self._cache_put(key, vector)
+        return vector
+
+    async def aembed_documents(self, texts: list) -> list:
+        return await run_in_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> list:
+        return await run_in_thread(self.embed_query, text)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "model_id": self.model_id,
+            "cache_entries": len(self._cache),
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+            "cache_hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+# ------------------------------
+# Providers
+# ------------------------------
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    def __init__(self, model: str = OPENAI_EMBEDDING_MODEL, **kwargs):
+        super().__init__(**kwargs)
+        from langchain_openai import OpenAIEmbeddings
+
+        self.client = OpenAIEmbeddings(model=model)
+        self.model_id = f"openai:{model}"
+
+    def _embed_batch(self, texts: list) -> list:
+        return self.client.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> list:
+        # Network-bound: use the async client rather than a pool thread
+        key = self._key(text)
+        vector = self._cache_get(key)
+        if vector is None:
+            vector = await self.client.aembed_query(text)
+            self._cache_put(key, vector)
+        return vector
+
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """
+    sentence-transformers on CPU, loaded lazily through the model registry
+    (LOCAL_EMBEDDING_MODEL; LOCAL_EMBEDDING_BACKEND=onnx for ONNX Runtime).
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        suffix = f"+{LOCAL_EMBEDDING_BACKEND}" if LOCAL_EMBEDDING_BACKEND != "torch" else ""
+        suffix += f"/{LOCAL_EMBEDDING_FILE}" if LOCAL_EMBEDDING_FILE else ""
+        self.model_id = f"local:{LOCAL_EMBEDDING_MODEL}{suffix}"
+
+    def _embed_batch(self, texts: list) -> list:
+        encoder = models.get("embedder")
+        return encoder.encode(texts, batch_size=self.batch_size, normalize_embeddings=True, convert_to_numpy=True).tolist()
+
+
+class HashEmbeddingProvider(EmbeddingProvider):
+    """
+    Feature-hashed bag of words. No model and no network; for offline
+    builds, smoke tests and load-test harnesses, not for answer quality.
+    """
+
+    def __init__(self, dim: int = HASH_EMBEDDING_DIM, **kwargs):
+        super().__init__(**kwargs)
+        self.dim = dim
+        self.model_id = f"hash:{dim}"
+
+    def _embed_batch(self, texts: list) -> list:
+        vectors = np.zeros((len(texts), self.dim), dtype="float32")
+        for row, text in enumerate(texts):
+            for token in re.findall(r"\w+", text.lower()):
+                bucket = int.from_bytes(hashlib.md5(token.encode("utf-8")).digest()[:4], "little")
+                vectors[row, bucket % self.dim] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return (vectors / np.maximum(norms, 1e-9)).tolist()
+
+
+PROVIDERS = {
+    "openai": OpenAIEmbeddingProvider,
+    "local": LocalEmbeddingProvider,
+    "hash": HashEmbeddingProvider,
+}
+
+def create_embedding_provider(name: str = EMBEDDING_PROVIDER) -> EmbeddingProvider:
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown embedding provider '{name}', expected one of {tuple(PROVIDERS)}")
+    return PROVIDERS[name]()
+
+def embedding_model_id(embeddings) -> str:
+    return getattr(embeddings, "model_id", None) or LEGACY_EMBEDDING_MODEL
+
+def check_embedding_model(recorded: str, embeddings, where: str):
+    """
+    Rejects an index built with another model; its vectors live in a
+    different space and every search would silently return noise.
+    """
+    expected = embedding_model_id(embeddings)
+    recorded = recorded or LEGACY_EMBEDDING_MODEL
+    if recorded != expected:
+        raise EmbeddingMismatchError(
+            f"{where} was built with '{recorded}' but the configured embedding model is '{expected}'; "
+            "rebuild the index or change EMBEDDING_PROVIDER"
+        )
+
@@ -0,0 +1,74 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Blocking I/O and GIL-releasing work (FAISS, torch, tesseract subprocess)
+THREAD_POOL_SIZE = int(os.getenv("THREAD_POOL_SIZE", str(min(32, (os.cpu_count() or 1) + 4))))
+# Pure-Python CPU work (PDF parsing) that would otherwise hold the GIL
+PROCESS_POOL_SIZE = int(os.getenv("PROCESS_POOL_SIZE", str(max(1, (os.cpu_count() or 2) // 2))))
+# "spawn" avoids forking a worker that already holds torch/OpenMP state
+PROCESS_POOL_START_METHOD = os.getenv("PROCESS_POOL_START_METHOD", "spawn")
+# bcrypt gets its own threads so login bursts cannot starve everything else
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, min(4, (os.cpu_count() or 1) // 2)))))
+
+_thread_pool = None
+_process_pool = None
+_hash_pool = None
+
+def get_thread_pool() -> ThreadPoolExecutor:
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(max_workers=THREAD_POOL_SIZE, thread_name_prefix="blocking")
+    return _thread_pool
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        context = multiprocessing.get_context(PROCESS_POOL_START_METHOD)
+        _process_pool = ProcessPoolExecutor(max_workers=PROCESS_POOL_SIZE, mp_context=context)
+    return _process_pool
+
+def get_hash_pool() -> ThreadPoolExecutor:
+    global _hash_pool
+    if _hash_pool is None:
+        _hash_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+    return _hash_pool
+
+# ------------------------------
+# Offloading helpers
+# ------------------------------
+
+async def run_in_thread(fn, *args, **kwargs):
+    """
+    Runs a blocking call on the bounded thread pool without stalling the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_thread_pool(), functools.partial(fn, *args, **kwargs))
+
+async def run_in_process(fn, *args, **kwargs):
+    """
+    Runs a CPU-bound call on the process pool. `fn` and its arguments must be picklable.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), functools.partial(fn, *args, **kwargs))
+
+async def run_in_hash_pool(fn, *args, **kwargs):
+    """
+    Runs password hashing on its dedicated pool (bcrypt releases the GIL).
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_hash_pool(), functools.partial(fn, *args, **kwargs))
+
+def shutdown_executors():
+    global _thread_pool, _process_pool, _hash_pool
+    if _thread_pool is not None:
+        _thread_pool.shutdown(wait=False, cancel_futures=True)
+        _thread_pool = None
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+    if _hash_pool is not None:
+        _hash_pool.shutdown(wait=False, cancel_futures=True)
+        _hash_pool = None
@@ -1,45 +1,108 @@
 from PIL import Image
-import pytesseract
-from transformers import BlipProcessor, BlipForConditionalGeneration
-from openai import OpenAI
-import torch
+from backend.executors import run_in_thread, run_in_process
+from backend.ocr import text_likelihood, ocr_image_bytes, is_meaningful_text, OCR_TEXT_THRESHOLD, OCR_TIMEOUT
+from backend.llm_gateway import llm
+from backend.metrics import metrics
+from backend.model_registry import models
+from backend.batcher import MicroBatcher
 import io
+import logging
 import os
+import time
 
-# Setup
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-device = "cuda" if torch.cuda.is_available() else "cpu"
+logger = logging.getLogger(__name__)
 
-# Load BLIP model
-processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
-model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base").to(device)
+BLIP_MAX_BATCH = int(os.getenv("BLIP_MAX_BATCH", "8"))
+BLIP_MAX_WAIT_MS = float(os.getenv("BLIP_MAX_WAIT_MS", "20"))
 
-# Main function used in main.py
-async def analyze_medical_image(file):
+# BLIP is loaded on first use through the shared model registry
+
+def _decode_image(image_bytes: bytes) -> Image.Image:
+    return Image.open(io.BytesIO(image_bytes)).convert("RGB")
+
+def _blip_caption_batch(images: list) -> list:
+    import torch
+
+    processor, model, device = models.get("blip")
+    inputs = processor(images=images, return_tensors="pt").to(device)
+    with torch.inference_mode():
+        output = model.generate(**inputs)
+    return processor.batch_decode(output, skip_special_tokens=True)
+
+# Concurrent requests share one BLIP forward pass
+blip_batcher = MicroBatcher("blip", _blip_caption_batch, BLIP_MAX_BATCH, BLIP_MAX_WAIT_MS)
+
+async def _run_ocr(image_bytes: bytes) -> str:
+    try:
+        # The worker enforces OCR_TIMEOUT itself; an outer wait_for would only stop
+        # waiting while the job kept its pool slot
+        return await run_in_process(ocr_image_bytes, image_bytes, OCR_TIMEOUT)
+    except RuntimeError as e:
+        # pytesseract raises RuntimeError when its timeout kills Tesseract
+        logger.warning("OCR gave up, falling back to BLIP: %s", e)
+        return ""
+
+async def prepare_medical_image(file):
+    """
+    OCR for document-like images, BLIP for photos. A cheap pre-check routes
+    photos straight to BLIP. Returns (method, summary_input, gpt_input,
+    timings); timings also record the routing decision.
+    """
+    timings = {}
+    start = time.perf_counter()
     image_bytes = await file.read()
-    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    image = await run_in_thread(_decode_image, image_bytes)
+    timings["decode_ms"] = (time.perf_counter() - start) * 1000
 
-    extracted_text = pytesseract.image_to_string(image)
+    start = time.perf_counter()
+    score = await run_in_thread(text_likelihood, image)
+    timings["precheck_ms"] = (time.perf_counter() - start) * 1000
 
-    if extracted_text.strip():
-        gpt_input = f"Analyze this medical text:\n{extracted_text}"
+    extracted_text = ""
+    if score >= OCR_TEXT_THRESHOLD:
+        start = time.perf_counter()
+        extracted_text = await _run_ocr(image_bytes)
+        timings["ocr_ms"] = (time.perf_counter() - start) * 1000
+
+    if is_meaningful_text(extracted_text):
         method = "OCR"
+        summary_input = extracted_text.strip()
+        gpt_input = f"Analyze this medical text:\n{extracted_text}"
     else:
-        inputs = processor(image, return_tensors="pt").to(device)
-        output = model.generate(**inputs)
-        caption = processor.decode(output[0], skip_special_tokens=True)
-        gpt_input = f"Analyze this medical image caption:\n{caption}"
+        start = time.perf_counter()
+        summary_input = await blip_batcher.submit(image)
+        timings["blip_ms"] = (time.perf_counter() - start) * 1000
         method = "BLIP"
+        gpt_input = f"Analyze this medical image caption:\n{summary_input}"
 
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[{"role": "user", "content": gpt_input}],
-        temperature=0.3,
-        max_tokens=500
-    )
+    for stage, ms in timings.items():
+        metrics.observe(f"image.{stage[:-len('_ms')]}", ms / 1000)
+    timings = {stage: round(ms, 1) for stage, ms in timings.items()}
+    timings.update({
+        "method": method,
+        "text_score": score,
+        "ocr_threshold": OCR_TEXT_THRESHOLD,
+        # Scored as a document but OCR found too little (or timed out)
+        "ocr_fallback": score >= OCR_TEXT_THRESHOLD and method == "BLIP",
+    })
+    logger.info("image routed to %s %s", method, timings)
+    return method, summary_input, gpt_input, timings
+
+# Main function used in main.py
+async def analyze_medical_image(file):
+    method, summary_input, gpt_input, timings = await prepare_medical_image(file)
+
+    result = await llm.complete(gpt_input, route="image")
 
     return {
         "method": method,
-        "summary_input": extracted_text.strip() if method == "OCR" else caption,
-        "response": response.choices[0].message.content.strip()
+        "summary_input": summary_input,
+        "response": result.text,
+        "timings": timings
     }
+
+def stream_image_analysis(gpt_input: str):
+    """
+    Yields the GPT-4 analysis of a prepared image token by token.
+    """
+    return llm.stream(gpt_input, route="image")
@@ -0,0 +1,74 @@
+import multiprocessing
+import os
+
+import numpy as np
+from PIL import Image
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+IMAGE_BATCH_SIZE = int(os.getenv("IMAGE_BATCH_SIZE", "32"))
+IMAGE_DECODE_WORKERS = int(os.getenv("IMAGE_DECODE_WORKERS", str(os.cpu_count() or 1)))
+
+# Kept free of torch/transformers imports: spawned decode workers import this module
+
+def list_images(img_dir: str) -> list:
+    return [
+        os.path.join(img_dir, fname)
+        for fname in sorted(os.listdir(img_dir))
+        if fname.lower().endswith(IMAGE_EXTENSIONS)
+    ]
+
+def preprocess_clip_image(path: str, size: int, mean: tuple, std: tuple):
+    """
+    Decode, resize (shortest side), center-crop and normalize one image the way
+    CLIPProcessor does. Returns a (3, size, size) float32 array, or None if the
+    file cannot be decoded.
+    """
+    try:
+        with Image.open(path) as image:
+            image = image.convert("RGB")
+            width, height = image.size
+            scale = size / min(width, height)
+            image = image.resize((max(size, round(width * scale)), max(size, round(height * scale))), Image.BICUBIC)
+    except (OSError, ValueError):
+        return None
+
+    width, height = image.size
+    left, top = (width - size) // 2, (height - size) // 2
+    image = image.crop((left, top, left + size, top + size))
+
+    pixels = np.asarray(image, dtype="float32") / 255.0
+    pixels = (pixels - np.asarray(mean, dtype="float32")) / np.asarray(std, dtype="float32")
+    return pixels.transpose(2, 0, 1)
+
+def _preprocess_task(args):
+    return preprocess_clip_image(*args)
+
+def iter_image_batches(paths: list, size: int, mean: tuple, std: tuple,
+                       batch_size: int = IMAGE_BATCH_SIZE, workers: int = IMAGE_DECODE_WORKERS):
+    """
+    Decodes images across worker processes and yields (paths, pixel_batch) in
+    input order. Undecodable images are skipped.
+    """
+    tasks = [(path, size, tuple(mean), tuple(std)) for path in paths]
+
+    def batches(results):
+        batch_paths, batch_pixels = [], []
+        for path, pixels in zip(paths, results):
+            if pixels is None:
+                print(f"⚠️ Skipping unreadable image: {path}")
+                continue
+            batch_paths.append(path)
+            batch_pixels.append(pixels)
+            if len(batch_pixels) == batch_size:
+                yield batch_paths, np.stack(batch_pixels)
+                batch_paths, batch_pixels = [], []
+        if batch_pixels:
+            yield batch_paths, np.stack(batch_pixels)
+
+    if workers <= 1:
+        yield from batches(map(_preprocess_task, tasks))
+        return
+
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(workers) as pool:
+        yield from batches(pool.imap(_preprocess_task, tasks, chunksize=max(1, batch_size // workers)))
@@ -0,0 +1,138 @@
+import math
+import os
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+
+TEXT_INDEX_TYPE = os.getenv("TEXT_INDEX_TYPE", "flat")
+IMAGE_INDEX_TYPE = os.getenv("IMAGE_INDEX_TYPE", "flat")
+
+# Build-time parameters (0 = pick from corpus size)
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+PQ_M = int(os.getenv("PQ_M", "64"))
+INDEX_TRAIN_SAMPLE = int(os.getenv("INDEX_TRAIN_SAMPLE", "100000"))
+
+# Query-time knobs: recall vs latency
+INDEX_NPROBE = int(os.getenv("INDEX_NPROBE", "16"))
+INDEX_EF_SEARCH = int(os.getenv("INDEX_EF_SEARCH", "64"))
+
+# FAISS wants roughly this many training points per IVF list
+MIN_POINTS_PER_LIST = 39
+# Bits per PQ code; each sub-quantizer trains 2**PQ_NBITS centroids
+PQ_NBITS = 8
+ADD_SLICE = 10000
+
+# ------------------------------
+# Construction
+# ------------------------------
+
+def _nlist_for(n_vectors: int) -> int:
+    if IVF_NLIST:
+        return IVF_NLIST
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // MIN_POINTS_PER_LIST))
+
+def _pq_m_for(dim: int) -> int:
+    # PQ needs the sub-quantizer count to divide the dimension
+    for m in range(min(PQ_M, dim), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+def min_training_vectors(kind: str, n_vectors: int) -> int:
+    """
+    Fewest vectors `kind` can be trained on at this corpus size (0 = no training).
+    """
+    if kind not in ("ivf_flat", "ivf_pq"):
+        return 0
+    needed = max(MIN_POINTS_PER_LIST * 2, _nlist_for(n_vectors) * MIN_POINTS_PER_LIST)
+    if kind == "ivf_pq":
+        needed = max(needed, 2 ** PQ_NBITS)
+    return needed
+
+def make_index(kind: str, dim: int, n_vectors: int):
+    """
+    Returns an empty (possibly untrained) L2 index of the requested type.
+    Falls back to a flat index when the corpus is too small to train IVF.
+    """
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{kind}', expected one of {INDEX_TYPES}")
+
+    needed = min_training_vectors(kind, n_vectors)
+    if n_vectors < needed:
+        print(f"⚠️ {n_vectors} vectors is too few to train {kind} (needs {needed}); using a flat index")
+        kind = "flat"
+
+    if kind == "flat":
+        return faiss.IndexFlatL2(dim)
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return index
+
+    quantizer = faiss.IndexFlatL2(dim)
+    nlist = _nlist_for(n_vectors)
+    if kind == "ivf_flat":
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+    else:
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_m_for(dim), PQ_NBITS)
+    return index
+
+def train_index(index, vectors, sample_size: int = INDEX_TRAIN_SAMPLE, seed: int = 0):
+    if index.is_trained:
+        return
+    n_vectors = len(vectors)
+    if n_vectors > sample_size:
+        rows = np.sort(np.random.default_rng(seed).choice(n_vectors, sample_size, replace=False))
+        sample = np.ascontiguousarray(vectors[rows], dtype="float32")
+    else:
+        sample = np.ascontiguousarray(vectors, dtype="float32")
+    index.train(sample)
+
+def build_index(kind: str, vectors):
+    """
+    Builds and fills an index from a (n, dim) float32 array or memmap,
+    training on a sample first when the index type needs it.
+    """
+    n_vectors, dim = vectors.shape
+    index = make_index(kind, dim, n_vectors)
+    train_index(index, vectors)
+    for offset in range(0, n_vectors, ADD_SLICE):
+        index.add(np.ascontiguousarray(vectors[offset:offset + ADD_SLICE], dtype="float32"))
+    set_search_params(index)
+    return index
+
+# ------------------------------
+# Query-time parameters
+# ------------------------------
+
+def set_search_params(index, nprobe: int = INDEX_NPROBE, ef_search: int = INDEX_EF_SEARCH):
+    """
+    Applies nprobe (IVF) or efSearch (HNSW); a no-op for flat indexes.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    hnsw = getattr(faiss.downcast_index(index), "hnsw", None)
+    if hnsw is not None:
+        hnsw.efSearch = ef_search
+    return index
+
+def index_kind(index) -> str:
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+def reconstruct_all(index) -> np.ndarray:
+    """
+    Exact vectors back out of a flat index (used to derive ANN indexes).
+    """
+    return index.reconstruct_n(0, index.ntotal)
@@ -0,0 +1,360 @@
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+
+from backend.utils import current_rss_bytes
+from backend.index_factory import set_search_params, index_kind
+from backend.lexical_index import BM25Index, LEXICAL_FILE, build_lexical_index
+from backend.embeddings import check_embedding_model, embedding_model_id
+
+TEXT_INDEX_PATH = "faiss_text_index"
+VERSION_FILE = "version.json"
+# Written by the incremental builder: file hashes and the chunk ids they produced
+MANIFEST_FILE = "manifest.json"
+
+# How often running servers look for a newly published index (seconds)
+INDEX_CHECK_INTERVAL = float(os.getenv("INDEX_CHECK_INTERVAL", "10"))
+# Memory-map the FAISS file so every worker shares the same page cache
+INDEX_USE_MMAP = os.getenv("INDEX_USE_MMAP", "1") == "1"
+
+# ------------------------------
+# Publishing (used by the index builders)
+# ------------------------------
+
+def _write_json_atomic(path: str, data: dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def read_index_version(path: str = TEXT_INDEX_PATH):
+    try:
+        with open(os.path.join(path, VERSION_FILE)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def read_index_manifest(path: str = TEXT_INDEX_PATH):
+    try:
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def publish_text_index(vectorstore: FAISS, path: str = TEXT_INDEX_PATH, manifest: dict = None, **extra) -> dict:
+    """
+    Saves a LangChain FAISS store, plus a BM25 index over the same chunks,
+    into `path` and bumps its version file, which is what running servers
+    watch to hot-swap.
+    """
+    os.makedirs(path, exist_ok=True)
+    staging = f"{path}.staging"
+    shutil.rmtree(staging, ignore_errors=True)
+    vectorstore.save_local(staging)
+    # Rebuilt in full each publish: tokenizing is cheap next to embedding
+    build_lexical_index(vectorstore).save(staging)
+    if manifest is not None:
+        _write_json_atomic(os.path.join(staging, MANIFEST_FILE), manifest)
+
+    # os.replace keeps the old inode alive for readers that still map it
+    for name in os.listdir(staging):
+        os.replace(os.path.join(staging, name), os.path.join(path, name))
+    shutil.rmtree(staging, ignore_errors=True)
+
+    version = {
+        "version": time.time_ns(),
+        "ntotal": int(vectorstore.index.ntotal),
+        "published_at": time.time(),
+        # Servers refuse to load an index built with a different embedding model
+        "embedding_model": embedding_model_id(vectorstore.embeddings),
+        **extra,
+    }
+    _write_json_atomic(os.path.join(path, VERSION_FILE), version)
+    return version
+
+# ------------------------------
+# Process-wide index managers
+# ------------------------------
+
+def read_faiss(index_file: str, use_mmap: bool = INDEX_USE_MMAP):
+    """
+    Reads a FAISS index, memory-mapped when the index type allows it.
+    Returns (index, mmapped).
+    """
+    if use_mmap:
+        try:
+            index = faiss.read_index(index_file, faiss.IO_FLAG_MMAP)
+            mmapped = True
+        except RuntimeError:
+            # Not every index type supports mmap; fall back to a normal read
+            index, mmapped = faiss.read_index(index_file), False
+    else:
+        index, mmapped = faiss.read_index(index_file), False
+    # nprobe / efSearch are not persisted with the index
+    set_search_params(index)
+    return index, mmapped
+
+
+class IndexNotBuiltError(RuntimeError):
+    """
+    Raised when an index is needed but nothing has been published yet.
+    """
+
+
+class ReloadingIndex:
+    """
+    Loads an on-disk index once per process and hot-swaps it when the
+    on-disk version changes. Subclasses say how to read the version and
+    the payload.
+    """
+
+    name = "index"
+
+    def __init__(self, check_interval: float = INDEX_CHECK_INTERVAL, use_mmap: bool = INDEX_USE_MMAP):
+        self.check_interval = check_interval
+        self.use_mmap = use_mmap
+
+        self._payload = None
+        self._version = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+
+        self.load_seconds = 0.0
+        self.rss_delta_bytes = 0
+        self.index_bytes = 0
+        self.mmapped = False
+        self.swap_count = 0
+
+    def _disk_version(self):
+        raise NotImplementedError
+
+    def _exists(self) -> bool:
+        raise NotImplementedError
+
+    def _load_payload(self):
+        """
+        Returns (payload, mmapped, size_in_bytes).
+        """
+        raise NotImplementedError
+
+    def _faiss_index(self, payload):
+        raise NotImplementedError
+
+    def load(self):
+        """
+        Loads (or reloads) the index from disk and swaps it in.
+        """
+        with self._lock:
+            if not self._exists():
+                raise IndexNotBuiltError(f"{self.name} has not been built yet")
+            version = self._disk_version()
+            rss_before = current_rss_bytes()
+            start = time.perf_counter()
+
+            payload, mmapped, size = self._load_payload()
+
+            self.load_seconds = time.perf_counter() - start
+            self.rss_delta_bytes = current_rss_bytes() - rss_before
+            self.index_bytes = size
+            self.mmapped = mmapped
+
+            if self._payload is not None:
+                self.swap_count += 1
+            self._payload = payload
+            self._version = version
+
+        ntotal = self._faiss_index(payload).ntotal
+        print(f"✅ {self.name} loaded in {self.load_seconds:.2f}s ({ntotal} vectors, mmap={mmapped})")
+        return payload
+
+    def available(self) -> bool:
+        """
+        True when the index is loaded or can be loaded from disk.
+        """
+        return self._payload is not None or self._exists()
+
+    def get(self):
+        payload = self._payload
+        if payload is None:
+            payload = self.load()
+        return payload
+
+    def get_versioned(self):
+        """
+        Returns (payload, version) of the same load, loading it if needed.
+        """
+        with self._lock:
+            payload, version = self._payload, self._version
+        if payload is None:
+            self.load()
+            with self._lock:
+                payload, version = self._payload, self._version
+        return payload, version
+
+    def refresh(self) -> bool:
+        """
+        Swaps in a newer on-disk version if one was published. Returns True on swap.
+        """
+        version = self._disk_version()
+        if version is None or version == self._version:
+            return False
+        try:
+            self.load()
+        except (RuntimeError, FileNotFoundError, EOFError, ValueError, pickle.UnpicklingError) as e:
+            print(f"⚠️ {self.name} refresh skipped: {e}")
+            return False
+        return True
+
+    def _watch(self):
+        while not self._stop.wait(self.check_interval):
+            self.refresh()
+
+    def start(self):
+        """
+        Loads the index eagerly and starts the background version watcher.
+        """
+        if self._payload is None and self._exists():
+            self.load()
+        if self._watcher is None:
+            self._stop.clear()
+            self._watcher = threading.Thread(target=self._watch, name=f"{self.name}-watcher", daemon=True)
+            self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=1)
+            self._watcher = None
+
+    def stats(self) -> dict:
+        payload = self._payload
+        index = self._faiss_index(payload) if payload is not None else None
+        return {
+            "loaded": payload is not None,
+            "version": self._version,
+            "vectors": int(index.ntotal) if index is not None else 0,
+            "index_type": index_kind(index) if index is not None else None,
+            "load_seconds": round(self.load_seconds, 4),
+            "index_bytes": self.index_bytes,
+            "rss_delta_bytes": self.rss_delta_bytes,
+            "mmapped": self.mmapped,
+            "swap_count": self.swap_count,
+        }
+
+
+class TextIndexManager(ReloadingIndex):
+    """
+    The LangChain text store and its BM25 index, hot-swapped together when
+    `publish_text_index` writes a new version to disk. `get()` returns
+    (store, lexical).
+    """
+
+    name = "text-index"
+
+    def __init__(self, path: str, embeddings, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.embeddings = embeddings
+
+    def _disk_version(self):
+        version = read_index_version(self.path)
+        return version["version"] if version else None
+
+    def _exists(self) -> bool:
+        return os.path.exists(os.path.join(self.path, "index.faiss"))
+
+    def _faiss_index(self, payload):
+        return payload[0].index
+
+    def _load_payload(self):
+        index_file = os.path.join(self.path, "index.faiss")
+        docstore_file = os.path.join(self.path, "index.pkl")
+
+        version = read_index_version(self.path) or {}
+        check_embedding_model(version.get("embedding_model"), self.embeddings, self.path)
+
+        index, mmapped = read_faiss(index_file, self.use_mmap)
+        with open(docstore_file, "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+
+        if index.ntotal != len(index_to_docstore_id):
+            # Caught the files mid-publish; the next check will retry
+            raise RuntimeError("Text index and docstore are out of sync")
+
+        store = FAISS(self.embeddings, index, docstore, index_to_docstore_id)
+        size = os.path.getsize(index_file) + os.path.getsize(docstore_file)
+
+        lexical_file = os.path.join(self.path, LEXICAL_FILE)
+        if os.path.exists(lexical_file):
+            lexical = BM25Index.load(self.path)
+            size += os.path.getsize(lexical_file)
+        else:
+            # Published before lexical indexes existed; build it once in memory
+            lexical = build_lexical_index(store)
+        if lexical.doc_ids != list(index_to_docstore_id.values()):
+            raise RuntimeError("Text index and lexical index are out of sync")
+
+        return (store, lexical), mmapped, size
+
+    def stats(self) -> dict:
+        report = super().stats()
+        payload = self._payload
+        report["lexical_terms"] = len(payload[1].postings) if payload is not None else 0
+        return report
+
+
+class ImageIndexManager(ReloadingIndex):
+    """
+    The CLIP image index plus its path column, both memory-mapped.
+    `get()` returns (index, paths) where `paths[i]` is the image for row i.
+    """
+
+    name = "image-index"
+
+    def __init__(self, index_path: str, paths_path: str, legacy_meta_path: str = None, **kwargs):
+        super().__init__(**kwargs)
+        self.index_path = index_path
+        self.paths_path = paths_path
+        self.legacy_meta_path = legacy_meta_path
+
+    def _meta_file(self):
+        if os.path.exists(self.paths_path) or not self.legacy_meta_path:
+            return self.paths_path
+        return self.legacy_meta_path
+
+    def _disk_version(self):
+        try:
+            return (os.stat(self.index_path).st_mtime_ns, os.stat(self._meta_file()).st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+    def _exists(self) -> bool:
+        return os.path.exists(self.index_path) and os.path.exists(self._meta_file())
+
+    def _faiss_index(self, payload):
+        return payload[0]
+
+    def _load_payload(self):
+        index, mmapped = read_faiss(self.index_path, self.use_mmap)
+        meta_file = self._meta_file()
+        if meta_file == self.paths_path:
+            # Fixed-width string column: mmap-able and no pickle
+            paths = np.load(meta_file, mmap_mode="r" if self.use_mmap else None)
+        else:
+            legacy = np.load(meta_file, allow_pickle=True)
+            paths = np.array([entry["image_path"] for entry in legacy])
+
+        if index.ntotal != len(paths):
+            # Caught the files mid-publish; the next check will retry
+            raise RuntimeError("Image index and path column are out of sync")
+
+        size = os.path.getsize(self.index_path) + os.path.getsize(meta_file)
+        return (index, paths), mmapped, size
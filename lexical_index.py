@@ -0,0 +1,140 @@
+import math
+import os
+import pickle
+import re
+from collections import Counter, defaultdict
+
+import numpy as np
+
+LEXICAL_FILE = "lexical.pkl"
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+# Words joined by . - / stay one token so "E11.9", "HbA1c" and "5-FU" survive
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[./\-][a-z0-9]+)*")
+# Codes and lab/drug abbreviations: a letter and a digit, or a short all-caps word
+CODE_PATTERN = re.compile(r"\b(?:[A-Za-z]+\d[\w.\-/]*|\d+[A-Za-z][\w.\-/]*|[A-Z]{2,6})\b")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how i in is it its me my of on or "
+    "should that the this to was what when which who why will with you your".split()
+)
+
+# ------------------------------
+# Tokenization
+# ------------------------------
+
+def tokenize(text: str) -> list:
+    """
+    Lowercased terms. Compound tokens ("e11.9") also emit their parts
+    ("e11", "9") so a query for the parent code still matches.
+    """
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        terms.append(token)
+        if not token.isalnum():
+            terms.extend(part for part in re.split(r"[./\-]", token) if part and part not in STOPWORDS)
+    return terms
+
+def is_code_query(query: str, max_terms: int = 4) -> bool:
+    """
+    Short queries that look like a code or abbreviation ("E11.9", "HbA1c
+    range", "LDL") are answered from the lexical index alone.
+    """
+    return len(tokenize(query)) <= max_terms and CODE_PATTERN.search(query) is not None
+
+# ------------------------------
+# BM25 inverted index
+# ------------------------------
+
+class BM25Index:
+    """
+    In-memory inverted index over the text chunks, keyed by the same
+    docstore ids as the FAISS store so results can be fused.
+    """
+
+    def __init__(self, doc_ids: list, postings: dict, doc_lengths: np.ndarray):
+        self.doc_ids = doc_ids
+        # term -> (doc rows int32, term frequencies float32)
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.avg_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    @classmethod
+    def build(cls, docs):
+        """
+        `docs` is an iterable of (doc_id, text).
+        """
+        doc_ids, lengths = [], []
+        rows, freqs = defaultdict(list), defaultdict(list)
+        for row, (doc_id, text) in enumerate(docs):
+            counts = Counter(tokenize(text))
+            doc_ids.append(doc_id)
+            lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                rows[term].append(row)
+                freqs[term].append(count)
+        postings = {
+            term: (np.asarray(rows[term], dtype="int32"), np.asarray(freqs[term], dtype="float32"))
+            for term in rows
+        }
+        return cls(doc_ids, postings, np.asarray(lengths, dtype="float32"))
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def search(self, query: str, k: int = 10) -> list:
+        """
+        Returns up to k (doc_id, score) pairs, best first.
+        """
+        n_docs = len(self.doc_ids)
+        if not n_docs:
+            return []
+        scores = np.zeros(n_docs, dtype="float32")
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths / max(self.avg_length, 1e-9))
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            rows, tf = posting
+            idf = math.log(1 + (n_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+            scores[rows] += idf * tf * (BM25_K1 + 1) / (tf + norm[rows])
+
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        top = matched[np.argsort(-scores[matched])[:k]]
+        return [(self.doc_ids[row], float(scores[row])) for row in top]
+
+    def save(self, path: str):
+        with open(os.path.join(path, LEXICAL_FILE), "wb") as f:
+            pickle.dump((self.doc_ids, self.postings, self.doc_lengths), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: str):
+        with open(os.path.join(path, LEXICAL_FILE), "rb") as f:
+            return cls(*pickle.load(f))
+
+def build_lexical_index(vectorstore) -> BM25Index:
+    """
+    BM25 over every chunk in a LangChain FAISS store, in index order.
+    """
+    ids = list(vectorstore.index_to_docstore_id.values())
+    return BM25Index.build((doc_id, vectorstore.docstore.search(doc_id).page_content) for doc_id in ids)
+
+# ------------------------------
+# Fusion
+# ------------------------------
+
+def reciprocal_rank_fusion(rankings, k: int = 60) -> list:
+    """
+    Merges ranked lists of doc ids; returns ids ordered by sum of 1/(k + rank).
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
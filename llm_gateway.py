@@ -0,0 +1,332 @@
+import asyncio
+import contextvars
+import hashlib
+import logging
+import os
+import time
+from typing import NamedTuple
+
+import httpx
+from openai import AsyncOpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+from backend.metrics import metrics
+from backend.summarizer import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Any OpenAI-compatible endpoint, e.g. the bundled stub at http://127.0.0.1:8001/v1
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or None
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4")
+# Cheaper model for short prompts and, when the primary keeps failing, as a last resort (unset = off)
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "")
+LLM_FALLBACK_MAX_PROMPT_TOKENS = int(os.getenv("LLM_FALLBACK_MAX_PROMPT_TOKENS", "300"))
+LLM_FALLBACK_ON_ERROR = os.getenv("LLM_FALLBACK_ON_ERROR", "1") == "1"
+
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "50"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+# Token buckets (0 = unlimited); capacity allows short bursts above the rate
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+LLM_BURST_SECONDS = float(os.getenv("LLM_BURST_SECONDS", "5"))
+
+# Seconds per route; override one with LLM_TIMEOUT_<ROUTE>, e.g. LLM_TIMEOUT_PDF=120
+ROUTE_TIMEOUTS = {
+    "default": 60.0,
+    "text_rag": 30.0,
+    "image": 30.0,
+    "image_rag": 30.0,
+    "pdf": 90.0,
+    "conversation": 30.0,
+}
+
+RETRYABLE_ERRORS = (APIConnectionError, APITimeoutError, InternalServerError, RateLimitError)
+
+def route_timeout(route: str) -> float:
+    default = ROUTE_TIMEOUTS.get(route, ROUTE_TIMEOUTS["default"])
+    return float(os.getenv(f"LLM_TIMEOUT_{route.upper()}", default))
+
+class LLMResult(NamedTuple):
+    text: str
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+
+# ------------------------------
+# Per-request usage accounting
+# ------------------------------
+
+_request_usage = contextvars.ContextVar("llm_request_usage", default=None)
+
+def track_usage() -> dict:
+    """
+    Starts a token tally for the current request; every completion made
+    from this context (including streams) is added to it.
+    """
+    usage = {"llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "model": None}
+    _request_usage.set(usage)
+    return usage
+
+def current_usage():
+    return _request_usage.get()
+
+def _account(result: LLMResult):
+    usage = _request_usage.get()
+    if usage is None:
+        return
+    usage["llm_calls"] += 1
+    usage["prompt_tokens"] += result.prompt_tokens
+    usage["completion_tokens"] += result.completion_tokens
+    # The model of the last call is the one that wrote the answer
+    usage["model"] = result.model
+
+class UsageTrackingMiddleware:
+    """
+    Gives every HTTP request its own token tally.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            track_usage()
+        await self.app(scope, receive, send)
+
+# ------------------------------
+# Rate limiting
+# ------------------------------
+
+class TokenBucket:
+    """
+    Allows `rate` units per second with bursts up to `capacity`.
+    A rate of 0 disables the bucket.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.waited_seconds = 0.0
+
+    async def acquire(self, amount: float = 1.0):
+        if self.rate <= 0:
+            return
+        # Requests bigger than the bucket still go through, they just drain it
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                delay = (amount - self._tokens) / self.rate
+                self.waited_seconds += delay
+                await asyncio.sleep(delay)
+
+# ------------------------------
+# Gateway
+# ------------------------------
+
+class LLMStream:
+    """
+    Async iterator over the tokens of one streamed completion. `result`
+    holds the full LLMResult once iteration finishes.
+    """
+
+    def __init__(self, gateway, prompt: str, route: str, model: str, max_tokens: int, temperature: float):
+        self._gateway = gateway
+        self._args = (prompt, route, model, max_tokens, temperature)
+        self.result = None
+
+    def __aiter__(self):
+        return self._gateway._stream_tokens(self, *self._args)
+
+
+class LLMGateway:
+    """
+    One pooled client for every chat completion in the process, with
+    per-route timeouts, retries, token-bucket rate limiting, coalescing of
+    identical in-flight prompts and a cheaper model for short prompts.
+    """
+
+    def __init__(self, base_url: str = LLM_BASE_URL, model: str = LLM_MODEL, fallback_model: str = LLM_FALLBACK_MODEL):
+        self.base_url = base_url
+        self.model = model
+        self.fallback_model = fallback_model
+        self._client = None
+        self._inflight = {}
+
+        self.request_bucket = TokenBucket(LLM_REQUESTS_PER_MINUTE / 60, LLM_REQUESTS_PER_MINUTE / 60 * LLM_BURST_SECONDS)
+        self.token_bucket = TokenBucket(LLM_TOKENS_PER_MINUTE / 60, LLM_TOKENS_PER_MINUTE / 60 * LLM_BURST_SECONDS)
+
+        self.requests = 0
+        self.coalesced = 0
+        self.fallbacks = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.request_seconds = 0.0
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        # Created on first use so it binds to the serving event loop
+        if self._client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+                timeout=httpx.Timeout(ROUTE_TIMEOUTS["default"], connect=LLM_CONNECT_TIMEOUT),
+            )
+            self._client = AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                base_url=self.base_url,
+                max_retries=LLM_MAX_RETRIES,
+                http_client=http_client,
+            )
+        return self._client
+
+    def choose_model(self, prompt_tokens: int, model: str = None) -> str:
+        # Only the default model is swapped for short prompts; an explicit choice stands
+        if model is None and self.fallback_model and prompt_tokens <= LLM_FALLBACK_MAX_PROMPT_TOKENS:
+            return self.fallback_model
+        return model or self.model
+
+    async def _admit(self, prompt_tokens: int, max_tokens: int):
+        await self.request_bucket.acquire()
+        await self.token_bucket.acquire(prompt_tokens + max_tokens)
+
+    def _record(self, result: LLMResult, seconds: float):
+        self.requests += 1
+        self.prompt_tokens += result.prompt_tokens
+        self.completion_tokens += result.completion_tokens
+        self.request_seconds += seconds
+
+    async def _create(self, prompt: str, route: str, model: str, max_tokens: int, temperature: float, **kwargs):
+        client = self.client.with_options(timeout=httpx.Timeout(route_timeout(route), connect=LLM_CONNECT_TIMEOUT))
+        try:
+            return model, await client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **kwargs
+            )
+        except RETRYABLE_ERRORS as e:
+            # The SDK already retried; one last attempt on the cheaper model
+            if not (LLM_FALLBACK_ON_ERROR and self.fallback_model and model != self.fallback_model):
+                self.errors += 1
+                raise
+            logger.warning("LLM %s failed on %s (%s); falling back to %s", route, model, e, self.fallback_model)
+            self.fallbacks += 1
+            return self.fallback_model, await client.chat.completions.create(
+                model=self.fallback_model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **kwargs
+            )
+
+    async def _complete(self, prompt, route, model, max_tokens, temperature, prompt_tokens) -> LLMResult:
+        await self._admit(prompt_tokens, max_tokens)
+        start = time.perf_counter()
+        model, response = await self._create(prompt, route, model, max_tokens, temperature)
+        usage = response.usage
+        result = LLMResult(
+            text=response.choices[0].message.content.strip(),
+            model=response.model or model,
+            prompt_tokens=usage.prompt_tokens if usage else prompt_tokens,
+            completion_tokens=usage.completion_tokens if usage else 0,
+        )
+        elapsed = time.perf_counter() - start
+        self._record(result, elapsed)
+        metrics.observe(f"llm.{route}", elapsed)
+        return result
+
+    async def complete(self, prompt: str, route: str = "default", model: str = None,
+                       max_tokens: int = 500, temperature: float = 0.3) -> LLMResult:
+        """
+        One chat completion. Concurrent calls with the same prompt and
+        parameters share a single upstream request.
+        """
+        prompt_tokens = count_tokens(prompt)
+        model = self.choose_model(prompt_tokens, model)
+        key = hashlib.sha256(f"{model}|{max_tokens}|{temperature}|{prompt}".encode("utf-8")).hexdigest()
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._complete(prompt, route, model, max_tokens, temperature, prompt_tokens))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so one caller disconnecting does not cancel the others' request
+        result = await asyncio.shield(task)
+        _account(result)
+        return result
+
+    def stream(self, prompt: str, route: str = "default", model: str = None,
+               max_tokens: int = 500, temperature: float = 0.3) -> LLMStream:
+        """
+        Streams a chat completion token by token (`async for token in ...`).
+        """
+        return LLMStream(self, prompt, route, model, max_tokens, temperature)
+
+    async def _stream_tokens(self, handle: LLMStream, prompt, route, model, max_tokens, temperature):
+        prompt_tokens = count_tokens(prompt)
+        model = self.choose_model(prompt_tokens, model)
+        await self._admit(prompt_tokens, max_tokens)
+
+        start = time.perf_counter()
+        model, stream = await self._create(
+            prompt, route, model, max_tokens, temperature,
+            stream=True, stream_options={"include_usage": True},
+        )
+        parts, usage = [], None
+        async for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                if not parts:
+                    metrics.observe(f"llm.{route}.first_token", time.perf_counter() - start)
+                parts.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+
+        text = "".join(parts).strip()
+        handle.result = LLMResult(
+            text=text,
+            model=model,
+            prompt_tokens=usage.prompt_tokens if usage else prompt_tokens,
+            completion_tokens=usage.completion_tokens if usage else count_tokens(text),
+        )
+        elapsed = time.perf_counter() - start
+        self._record(handle.result, elapsed)
+        metrics.observe(f"llm.{route}", elapsed)
+        _account(handle.result)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    def stats(self) -> dict:
+        return {
+            "base_url": self.base_url or "https://api.openai.com/v1",
+            "model": self.model,
+            "fallback_model": self.fallback_model or None,
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "fallbacks": self.fallbacks,
+            "errors": self.errors,
+            "inflight": len(self._inflight),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "mean_request_ms": round(self.request_seconds / self.requests * 1000, 2) if self.requests else 0.0,
+            "rate_limit_wait_seconds": round(self.request_bucket.waited_seconds + self.token_bucket.waited_seconds, 3),
+        }
+
+
+# Shared by every handler in this process
+llm = LLMGateway()
@@ -1,15 +1,248 @@
-from backend.database import logs_collection
+from backend.database import async_logs_collection
+from backend.llm_gateway import current_usage
+from backend.metrics import current_request_id, metrics, span
+from bson import ObjectId
 from datetime import datetime
+from pymongo import ASCENDING, DESCENDING
+import asyncio
+import base64
+import contextvars
+import logging
+import os
+import time
 
-def log_query(user_id: str, query_type: str, input_content: str, output_content: str, model_used: str = "gpt-4"):
+logger = logging.getLogger(__name__)
+
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "200"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))
+# When the queue is full: "block" (backpressure, up to LOG_BLOCK_TIMEOUT), "drop_newest" or "drop_oldest"
+LOG_QUEUE_POLICY = os.getenv("LOG_QUEUE_POLICY", "drop_oldest")
+LOG_BLOCK_TIMEOUT = float(os.getenv("LOG_BLOCK_TIMEOUT", "1.0"))
+
+LOG_QUEUE_POLICIES = ("block", "drop_newest", "drop_oldest")
+
+HISTORY_MAX_LIMIT = int(os.getenv("HISTORY_MAX_LIMIT", "100"))
+
+_STOP = object()
+
+# ------------------------------
+# Buffered log writer
+# ------------------------------
+
+class LogWriter:
+    """
+    Buffers log documents in a bounded in-memory queue and writes them with
+    `insert_many`, once `batch_size` are waiting or `flush_interval` seconds
+    after the first one arrived. Requests only pay for an enqueue.
+    """
+
+    def __init__(self, collection, max_queue: int = LOG_QUEUE_SIZE, batch_size: int = LOG_BATCH_SIZE,
+                 flush_interval: float = LOG_FLUSH_INTERVAL, policy: str = LOG_QUEUE_POLICY,
+                 block_timeout: float = LOG_BLOCK_TIMEOUT):
+        if policy not in LOG_QUEUE_POLICIES:
+            raise ValueError(f"Unknown log queue policy '{policy}', expected one of {LOG_QUEUE_POLICIES}")
+        self.collection = collection
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+
+        self._queue = None
+        self._worker = None
+
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+        self.flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            # A fresh context: the worker outlives the request that started it and must
+            # not keep appending to that request's spans
+            self._worker = contextvars.Context().run(asyncio.get_running_loop().create_task, self._run())
+
+    async def put(self, document: dict):
+        self._ensure_worker()
+
+        if self.policy == "block":
+            try:
+                await asyncio.wait_for(self._queue.put(document), self.block_timeout)
+            except asyncio.TimeoutError:
+                self.dropped += 1
+                return
+        else:
+            if self._queue.full():
+                self.dropped += 1
+                if self.policy == "drop_newest":
+                    return
+                self._queue.get_nowait()
+            self._queue.put_nowait(document)
+        self.enqueued += 1
+
+    async def _collect(self):
+        """
+        Returns (batch, stopping).
+        """
+        first = await self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _flush(self, batch: list):
+        start = time.perf_counter()
+        try:
+            await self.collection.insert_many(batch, ordered=False)
+            self.written += len(batch)
+        except Exception as e:
+            # Logging must never take a request down; count the loss and move on
+            self.failed += len(batch)
+            logger.warning("Failed to write %d query logs: %s", len(batch), e)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.observe("mongo.log_flush", elapsed)
+            self.flushes += 1
+            self.flush_seconds += elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+
+    async def _run(self):
+        while True:
+            batch, stopping = await self._collect()
+            if batch:
+                await self._flush(batch)
+            if stopping:
+                return
+
+    async def stop(self):
+        """
+        Flushes everything still queued, then stops the worker.
+        """
+        if self._worker is None or self._worker.done():
+            return
+        await self._queue.put(_STOP)
+        await self._worker
+        self._worker = None
+
+    def stats(self) -> dict:
+        return {
+            "policy": self.policy,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "flushes": self.flushes,
+            "mean_batch_size": round(self.written / self.flushes, 2) if self.flushes else 0.0,
+            "mean_flush_ms": round(self.flush_seconds / self.flushes * 1000, 2) if self.flushes else 0.0,
+            "max_flush_ms": round(self.max_flush_seconds * 1000, 2),
+        }
+
+
+log_writer = LogWriter(async_logs_collection)
+
+async def log_query(user_id: str, query_type: str, input_content: str, output_content: str, model_used: str = None,
+                    extra: dict = None):
+    """
+    Queues a user's query for the MongoDB logs collection, with the LLM
+    token usage tallied for the current request. `extra` adds fields to
+    the document (e.g. the per-part answers of /analyze).
+    """
+    usage = current_usage() or {}
+    with span("log.enqueue"):
+        await log_writer.put({
+            "user_id": user_id,                  # Can be user_id (str) or email, depending on your flow
+            "query_type": query_type,            # e.g., "text", "image", "pdf"
+            "input_summary": input_content,      # what was asked / uploaded
+            "response": output_content,          # what LLM responded
+            "model_used": model_used or usage.get("model") or "cache",
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "llm_calls": usage.get("llm_calls", 0),
+            "request_id": current_request_id(),
+            "timestamp": datetime.utcnow(),
+            **(extra or {}),
+        })
+
+# ------------------------------
+# History reads
+# ------------------------------
+
+# Newest first; _id breaks ties between entries logged in the same millisecond
+HISTORY_SORT = [("timestamp", DESCENDING), ("_id", DESCENDING)]
+HISTORY_PROJECTION = {"_id": 1, "timestamp": 1, "query_type": 1, "input_summary": 1, "response": 1}
+
+LOG_INDEXES = {
+    "user_history": [("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+    "user_type_history": [("user_id", ASCENDING), ("query_type", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+}
+
+async def ensure_log_indexes(collection=async_logs_collection):
+    """
+    Creates the history indexes if missing (idempotent, run at startup).
+    """
+    for name, keys in LOG_INDEXES.items():
+        await collection.create_index(keys, name=name, background=True)
+
+def encode_cursor(entry: dict) -> str:
+    raw = f"{entry['timestamp'].isoformat()}|{entry['_id']}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str):
+    """
+    Returns (timestamp, _id); raises ValueError for a malformed cursor.
+    """
+    try:
+        timestamp, object_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(timestamp), ObjectId(object_id)
+    except Exception as e:
+        raise ValueError(f"Invalid history cursor: {e}")
+
+def history_filter(user_id: str, cursor: str = None, query_type: str = None) -> dict:
+    """
+    Keyset filter: everything strictly older than the cursor's (timestamp, _id).
+    """
+    query = {"user_id": user_id}
+    if query_type:
+        query["query_type"] = query_type
+    if cursor:
+        timestamp, object_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"timestamp": {"$lt": timestamp}},
+            {"timestamp": timestamp, "_id": {"$lt": object_id}},
+        ]
+    return query
+
+async def fetch_history(user_id: str, limit: int = 10, cursor: str = None, query_type: str = None, collection=async_logs_collection):
     """
-    Logs a user's query into the MongoDB logs collection.
+    One page of a user's logs, newest first. Returns (entries, next_cursor);
+    next_cursor is None on the last page.
     """
-    logs_collection.insert_one({
-        "user_id": user_id,                  # Can be user_id (str) or email, depending on your flow
-        "query_type": query_type,            # e.g., "text", "image", "pdf"
-        "input_summary": input_content,      # what was asked / uploaded
-        "response": output_content,          # what LLM responded
-        "model_used": model_used,
-        "timestamp": datetime.utcnow()
-    })
+    limit = max(1, min(limit, HISTORY_MAX_LIMIT))
+    # One extra row tells us whether another page exists
+    entries = await (
+        collection.find(history_filter(user_id, cursor, query_type), HISTORY_PROJECTION)
+        .sort(HISTORY_SORT)
+        .limit(limit + 1)
+        .to_list(length=limit + 1)
+    )
+    next_cursor = encode_cursor(entries[limit - 1]) if len(entries) > limit else None
+    return entries[:limit], next_cursor
@@ -1,17 +1,32 @@
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from starlette.background import BackgroundTask
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import Query
-from backend.database import logs_collection
-from backend.auth import register_user, login_user, decode_access_token
+from backend.auth import register_user, login_user, decode_access_token, ensure_user_indexes, token_cache, AuthBusyError
 from backend.models.user_model import LoginRequest
-from backend.models.log_model import log_query
-from backend.pdf_handler import process_pdf
-from backend.image_handler import analyze_medical_image
-from backend.text_handler import process_text_rag
-from backend.utils import save_upload_file
+from backend.models.log_model import log_query, log_writer, ensure_log_indexes, fetch_history
+from backend.pdf_handler import process_pdf, prepare_pdf, stream_pdf_summary
+from backend.image_handler import analyze_medical_image, prepare_medical_image, stream_image_analysis, blip_batcher
+from backend.rag_query import clip_batcher, image_index, query_image_rag
+from backend.index_manager import IndexNotBuiltError
+from backend.text_handler import process_text_rag, stream_text_rag, text_index, embedding_model
+from backend.conversation import conversations
+from backend.analysis_handler import prepare_analysis, merge_parts, collect_parts, log_analysis
+from backend.utils import UploadLimitMiddleware, open_upload, sse_event, load_image_pil
+from backend.answer_cache import answer_cache
+from backend.llm_gateway import llm, UsageTrackingMiddleware
+from backend.executors import run_in_thread, shutdown_executors
+from backend.metrics import metrics, span, RequestContextMiddleware
+from backend.model_registry import models, PRELOAD_MODELS
 from pydantic import EmailStr
-import os
+from contextlib import AsyncExitStack
+import time
+
+# Cold-start reference point: everything after this is import + startup cost
+_process_started = time.perf_counter()
+startup_seconds = None
 
 app = FastAPI()
 
@@ -23,21 +38,73 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Oversized uploads are refused while streaming in, not after being buffered
+app.add_middleware(UploadLimitMiddleware)
+# Per-request LLM token tally, written into each query log
+app.add_middleware(UsageTrackingMiddleware)
+# Added last so it wraps everything: request IDs, end-to-end timing, slow-request profiles
+app.add_middleware(RequestContextMiddleware)
+
+# --------------------------
+# Startup / Shutdown
+# --------------------------
+
+@app.on_event("startup")
+def load_indexes():
+    global startup_seconds
+    # Load the FAISS indexes once per worker instead of per request
+    text_index.start()
+    image_index.start()
+    # Models load lazily; PRELOAD_MODELS warms them without delaying liveness
+    models.preload()
+    models.start_reaper()
+    startup_seconds = time.perf_counter() - _process_started
+
+@app.on_event("startup")
+async def create_db_indexes():
+    try:
+        await ensure_log_indexes()
+    except Exception as e:
+        # History still works without the index, just slower
+        print(f"⚠️ Could not create query log indexes: {e}")
+    try:
+        await ensure_user_indexes()
+    except Exception as e:
+        # Usually pre-existing duplicate emails; registration then reads before every insert
+        print(f"⚠️ Could not create the unique email index: {e}")
+
+@app.on_event("shutdown")
+async def stop_indexes():
+    text_index.stop()
+    image_index.stop()
+    models.stop()
+    await blip_batcher.stop()
+    await clip_batcher.stop()
+    # Write out any query logs still buffered
+    await log_writer.stop()
+    await llm.aclose()
+    shutdown_executors()
 
 # --------------------------
 # AUTH ROUTES
 # --------------------------
 
 @app.post("/register")
-def register(email: EmailStr = Form(...), password: str = Form(...)):
-    success, message = register_user(email, password)
+async def register(email: EmailStr = Form(...), password: str = Form(...)):
+    try:
+        success, message = await register_user(email, password)
+    except AuthBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     if not success:
         raise HTTPException(status_code=400, detail=message)
     return {"message": message}
 
 @app.post("/login")
-def login(email: EmailStr = Form(...), password: str = Form(...)):
-    success, token_or_msg = login_user(email, password)
+async def login(email: EmailStr = Form(...), password: str = Form(...)):
+    try:
+        success, token_or_msg = await login_user(email, password)
+    except AuthBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     if not success:
         raise HTTPException(status_code=401, detail=token_or_msg)
     return {"access_token": token_or_msg}
@@ -47,11 +114,54 @@ def login(email: EmailStr = Form(...), password: str = Form(...)):
 # --------------------------
 
 def get_current_user(token: str = Form(...)):
-    user_id = decode_access_token(token)
+    with span("auth.jwt"):
+        user_id = decode_access_token(token)
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
     return user_id
 
+# --------------------------
+# SSE STREAMING
+# --------------------------
+
+def sse_response(tokens, on_complete, meta: dict = None):
+    """
+    Streams tokens as Server-Sent Events and runs `on_complete(answer)` once
+    the full answer has been sent (used to log it).
+    """
+    answer = {}
+
+    async def events():
+        if meta:
+            yield sse_event(meta, event="meta")
+        parts = []
+        start, ttft = time.perf_counter(), None
+        try:
+            async for token in tokens:
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                parts.append(token)
+                yield sse_event({"token": token})
+        except Exception:
+            yield sse_event({"detail": "Generation failed"}, event="error")
+            return
+        answer["text"] = "".join(parts).strip()
+        yield sse_event({
+            "response": answer["text"],
+            "ttft_ms": round(ttft * 1000, 1) if ttft is not None else None,
+        }, event="done")
+
+    async def finish():
+        if "text" in answer:
+            await on_complete(answer["text"])
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(finish),
+    )
+
 # --------------------------
 # PDF Upload Handler
 # --------------------------
@@ -60,12 +170,25 @@ def get_current_user(token: str = Form(...)):
 async def upload_pdf(file: UploadFile = File(...), token: str = Form(...)):
     user_id = get_current_user(token)
 
-    path = await save_upload_file(file)
-    response = process_pdf(path)
-    os.remove(path)
+    # The upload's spooled buffer is parsed in place; no temp-file round trip
+    async with open_upload(file) as stream:
+        response, timings = await process_pdf(stream)
 
-    log_query(user_id, "pdf", f"PDF: {file.filename}", response)
-    return {"response": response}
+    await log_query(user_id, "pdf", f"PDF: {file.filename}", response)
+    return {"response": response, "timings": timings}
+
+@app.post("/upload-pdf/stream")
+async def upload_pdf_stream(file: UploadFile = File(...), token: str = Form(...)):
+    user_id = get_current_user(token)
+
+    # Parse before streaming so the upload can be released and parse errors are plain HTTP errors
+    async with open_upload(file) as stream:
+        pdf_hash, cached, prompt, timings = await prepare_pdf(stream)
+
+    async def on_complete(summary):
+        await log_query(user_id, "pdf", f"PDF: {file.filename}", summary)
+
+    return sse_response(stream_pdf_summary(pdf_hash, cached, prompt), on_complete, meta={"timings": timings})
 
 # --------------------------
 # Image Upload Handler (OCR + BLIP)
@@ -77,42 +200,170 @@ async def upload_image(file: UploadFile = File(...), token: str = Form(...)):
 
     result = await analyze_medical_image(file)
 
-    log_query(user_id, "image", result["summary_input"], result["response"])
-    return {"response": result["response"]}
+    await log_query(user_id, "image", result["summary_input"], result["response"])
+    return {"response": result["response"], "timings": result["timings"]}
+
+@app.post("/upload-image/stream")
+async def upload_image_stream(file: UploadFile = File(...), token: str = Form(...)):
+    user_id = get_current_user(token)
+
+    method, summary_input, gpt_input, timings = await prepare_medical_image(file)
+
+    async def on_complete(analysis):
+        await log_query(user_id, "image", summary_input, analysis)
+
+    return sse_response(stream_image_analysis(gpt_input), on_complete, meta={"method": method, "timings": timings})
+
+# --------------------------
+# Image RAG Query Handler (CLIP + FAISS)
+# --------------------------
+
+@app.post("/query-image-rag")
+async def query_image_rag_route(file: UploadFile = File(...), question: str = Form(...), token: str = Form(...)):
+    user_id = get_current_user(token)
+
+    with span("image.decode"):
+        image = await run_in_thread(load_image_pil, await file.read())
+    try:
+        response = await query_image_rag(image, question)
+    except IndexNotBuiltError:
+        raise HTTPException(status_code=503, detail="Image index not built; run build_image_index first")
+
+    await log_query(user_id, "image_rag", question, response)
+    return {"response": response}
 
 # --------------------------
 # Text RAG Query Handler
 # --------------------------
 
 @app.post("/query-text-rag")
-def query_text_rag(query: str = Form(...), token: str = Form(...)):
+async def query_text_rag(query: str = Form(...), token: str = Form(...)):
     user_id = get_current_user(token)
 
-    response = process_text_rag(query)
+    response = await process_text_rag(query, user_id)
 
-    log_query(user_id, "text", query, response)
+    await log_query(user_id, "text", query, response)
     return {"response": response}
 
+@app.post("/query-text-rag/stream")
+async def query_text_rag_stream(query: str = Form(...), token: str = Form(...)):
+    user_id = get_current_user(token)
+
+    async def on_complete(answer):
+        await log_query(user_id, "text", query, answer)
+
+    return sse_response(stream_text_rag(query, user_id), on_complete)
+
+# --------------------------
+# Combined Analysis (any of PDF, image and question in one request)
+# --------------------------
+
+async def _prepare_analysis_request(user_id, query, pdf, image):
+    query = (query or "").strip() or None
+    if not (query or pdf is not None or image is not None):
+        raise HTTPException(status_code=400, detail="Send a PDF, an image and/or a query")
+
+    # Inputs are read concurrently and the uploads released before any generation starts
+    async with AsyncExitStack() as uploads:
+        pdf_stream = await uploads.enter_async_context(open_upload(pdf)) if pdf is not None else None
+        parts, timings = await prepare_analysis(query, pdf_stream, image, user_id)
+    return query, parts, timings
+
+@app.post("/analyze")
+async def analyze(
+    token: str = Form(...),
+    query: str = Form(None),
+    pdf: UploadFile = File(None),
+    image: UploadFile = File(None),
+):
+    user_id = get_current_user(token)
+    query, parts, timings = await _prepare_analysis_request(user_id, query, pdf, image)
+
+    texts, errors = await collect_parts(parts)
+    if not texts:
+        raise HTTPException(status_code=502, detail="Generation failed")
+
+    await log_analysis(user_id, query, pdf and pdf.filename, image and image.filename, texts)
+    return {"parts": texts, "errors": {name: "Generation failed" for name in errors}, "timings": timings}
+
+@app.post("/analyze/stream")
+async def analyze_stream(
+    token: str = Form(...),
+    query: str = Form(None),
+    pdf: UploadFile = File(None),
+    image: UploadFile = File(None),
+):
+    user_id = get_current_user(token)
+    query, parts, timings = await _prepare_analysis_request(user_id, query, pdf, image)
+    answers = {}
+
+    async def events():
+        yield sse_event({"parts": list(parts)}, event="meta")
+        tokens = {name: [] for name in parts}
+        # Tokens of all parts interleave as they arrive; each event names its part
+        async for name, token, error in merge_parts(parts):
+            if token is not None:
+                tokens[name].append(token)
+                yield sse_event({"part": name, "token": token})
+            elif error is not None:
+                yield sse_event({"part": name, "detail": "Generation failed"}, event="part_error")
+            else:
+                answers[name] = "".join(tokens[name]).strip()
+                yield sse_event({"part": name, "response": answers[name]}, event="part_done")
+        yield sse_event({"parts": answers, "timings": timings}, event="done")
+
+    async def finish():
+        if answers:
+            await log_analysis(user_id, query, pdf and pdf.filename, image and image.filename, answers)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(finish),
+    )
+
+# --------------------------
+# Conversation
+# --------------------------
+
+@app.post("/conversation/reset")
+async def reset_conversation(token: str = Form(...)):
+    user_id = get_current_user(token)
+    # Follow-up questions stop seeing earlier turns; the history logs are kept
+    conversations.reset(user_id)
+    return {"message": "Conversation reset"}
+
 # --------------------------
 # User History 
 # --------------------------
 
 @app.post("/history")
-def get_user_history(token: str = Form(...), limit: int = Form(10)):
-    user_id = decode_access_token(token)
+async def get_user_history(
+    token: str = Form(...),
+    limit: int = Form(10),
+    cursor: str = Form(None),
+    query_type: str = Form(None),
+):
+    with span("auth.jwt"):
+        user_id = decode_access_token(token)
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    # Fetch logs for the user from MongoDB
-    history = logs_collection.find({"user_id": user_id}).sort("timestamp", -1).limit(limit)
+    # Fetch one page of logs for the user from MongoDB; pass next_cursor back for the next page
+    try:
+        with span("mongo.history"):
+            history, next_cursor = await fetch_history(user_id, limit, cursor, query_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     results = []
     for entry in history:
-        question = entry.get("input", "")
-        response = entry.get("output", "")
+        question = entry.get("input_summary", "")
+        response = entry.get("response", "")
         results.append((question, response))
 
-    return {"history": results}
+    return {"history": results, "next_cursor": next_cursor}
 
 # --------------------------
 # Health Check Route
@@ -121,3 +372,68 @@ def get_user_history(token: str = Form(...), limit: int = Form(10)):
 @app.get("/")
 def root():
     return {"message": "✅ Multimodal Medical Assistant backend is running"}
+
+@app.get("/ready")
+def ready():
+    # Liveness is "/"; readiness waits for the index and any preloaded models
+    pending = [name for name in PRELOAD_MODELS if not models.is_loaded(name)]
+    index_ready = text_index.stats()["loaded"]
+    is_ready = index_ready and not pending
+    body = {
+        "ready": is_ready,
+        "text_index_loaded": index_ready,
+        "pending_models": pending,
+        "startup_seconds": round(startup_seconds, 3) if startup_seconds is not None else None,
+        "models": models.stats(),
+    }
+    return JSONResponse(body, status_code=200 if is_ready else 503)
+
+@app.get("/index-stats")
+def index_stats():
+    return {"text_index": text_index.stats(), "image_index": image_index.stats()}
+
+@app.get("/cache-stats")
+def cache_stats():
+    return {"answer_cache": answer_cache.stats(), "embeddings": embedding_model.stats()}
+
+@app.get("/batch-stats")
+def batch_stats():
+    return {"blip": blip_batcher.stats(), "clip": clip_batcher.stats()}
+
+@app.get("/log-stats")
+def log_stats():
+    return {"log_writer": log_writer.stats()}
+
+@app.get("/llm-stats")
+def llm_stats():
+    return {"llm": llm.stats()}
+
+@app.get("/auth-stats")
+def auth_stats():
+    return {"token_cache": token_cache.stats()}
+
+@app.get("/conversation-stats")
+def conversation_stats():
+    return {"conversations": conversations.stats()}
+
+@app.get("/latency-stats")
+def latency_stats():
+    # Per-stage count, mean and recent p50/p95/p99 in milliseconds
+    return {"stages": metrics.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    # Prometheus text format: stage histograms plus the numeric fields of every *-stats endpoint
+    return metrics.render_prometheus({
+        "answer_cache": answer_cache.stats(),
+        "embeddings": embedding_model.stats(),
+        "blip": blip_batcher.stats(),
+        "clip": clip_batcher.stats(),
+        "log_writer": log_writer.stats(),
+        "llm": llm.stats(),
+        "token_cache": token_cache.stats(),
+        "text_index": text_index.stats(),
+        "image_index": image_index.stats(),
+        "models": models.stats(),
+        "conversations": conversations.stats(),
+    })
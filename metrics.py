@@ -0,0 +1,262 @@
+import bisect
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Requests slower than this are logged with their stage breakdown (0 = off)
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "2000"))
+# Opt-in pyinstrument profiling: fraction of requests sampled (0 = off)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+# Prometheus-style upper bounds in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Recent samples kept per stage for percentiles
+RESERVOIR_SIZE = 2048
+
+REQUEST_ID_HEADER = b"x-request-id"
+
+# ------------------------------
+# Histograms
+# ------------------------------
+
+class LatencyHistogram:
+    """
+    Cumulative bucket counts for Prometheus plus a window of recent
+    samples for p50/p95/p99.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS, reservoir_size: int = RESERVOIR_SIZE):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=reservoir_size)
+
+    def observe(self, seconds: float):
+        position = bisect.bisect_left(self.buckets, seconds)
+        if position < len(self.buckets):
+            self.bucket_counts[position] += 1
+        self.count += 1
+        self.sum += seconds
+        self.recent.append(seconds)
+
+    def percentiles(self) -> dict:
+        ordered = sorted(self.recent)
+        if not ordered:
+            return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+
+        def pick(pct):
+            return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+        return {"p50": pick(50), "p95": pick(95), "p99": pick(99)}
+
+
+class MetricsRegistry:
+    """
+    Per-stage latency histograms for the whole process. Stages are dotted
+    names such as "pdf.parse" or "llm.text_rag".
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = LatencyHistogram()
+            histogram.observe(seconds)
+        spans = _request_spans.get()
+        if spans is not None and spans.active:
+            spans.append((stage, seconds))
+
+    @contextmanager
+    def span(self, stage: str):
+        """
+        Times the enclosed block (sync or async code) under `stage`.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def stats(self) -> dict:
+        with self._lock:
+            items = list(self._histograms.items())
+        report = {}
+        for stage, histogram in sorted(items):
+            report[stage] = {
+                "count": histogram.count,
+                "mean_ms": round(histogram.sum / histogram.count * 1000, 2) if histogram.count else 0.0,
+                **{name: round(value * 1000, 2) for name, value in histogram.percentiles().items()},
+            }
+        return report
+
+    def render_prometheus(self, extra_stats: dict = None) -> str:
+        """
+        Text exposition format: stage histograms, their percentiles as
+        gauges, and every numeric field of `extra_stats` as a gauge.
+        """
+        lines = [
+            "# HELP app_stage_seconds Time spent per request stage.",
+            "# TYPE app_stage_seconds histogram",
+        ]
+        with self._lock:
+            items = sorted(self._histograms.items())
+        for stage, histogram in items:
+            label = _escape_label(stage)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.bucket_counts):
+                cumulative += count
+                lines.append(f'app_stage_seconds_bucket{{stage="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'app_stage_seconds_bucket{{stage="{label}",le="+Inf"}} {histogram.count}')
+            lines.append(f'app_stage_seconds_sum{{stage="{label}"}} {histogram.sum:.6f}')
+            lines.append(f'app_stage_seconds_count{{stage="{label}"}} {histogram.count}')
+
+        lines.append("# HELP app_stage_seconds_quantile Recent-window latency percentiles per stage.")
+        lines.append("# TYPE app_stage_seconds_quantile gauge")
+        for stage, histogram in items:
+            for name, value in histogram.percentiles().items():
+                quantile = int(name[1:]) / 100
+                lines.append(f'app_stage_seconds_quantile{{stage="{_escape_label(stage)}",quantile="{quantile}"}} {value:.6f}')
+
+        for component, stats in (extra_stats or {}).items():
+            for name, value in _flatten(stats, f"{component}_"):
+                metric = f"app_{name}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label(value: str) -> str:
+    # Label values are quoted; the request path can contain any of these
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _flatten(stats: dict, prefix: str = ""):
+    """
+    Numeric leaves of a nested stats dict as (metric_name, value).
+    """
+    for key, value in stats.items():
+        name = f"{prefix}{key}".replace("-", "_").replace(".", "_")
+        if isinstance(value, bool):
+            yield name, int(value)
+        elif isinstance(value, (int, float)):
+            yield name, value
+        elif isinstance(value, dict):
+            yield from _flatten(value, f"{name}_")
+
+
+metrics = MetricsRegistry()
+span = metrics.span
+
+# ------------------------------
+# Request context
+# ------------------------------
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+_request_spans = contextvars.ContextVar("request_spans", default=None)
+
+def current_request_id():
+    return _request_id.get()
+
+class _RequestSpans(list):
+    """
+    The (stage, seconds) spans of one request. Background tasks started
+    during the request share this list; it stops collecting once the
+    request ends so they cannot grow it for the life of the process.
+    """
+
+    active = True
+
+_profiling = threading.Lock()
+
+def _start_profiler():
+    """
+    Starts a pyinstrument profiler for a sampled request. Only one request is
+    profiled at a time: pyinstrument allows a single profiler per thread.
+    """
+    if PROFILE_SAMPLE_RATE <= 0 or random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        logger.warning("PROFILE_SAMPLE_RATE is set but pyinstrument is not installed")
+        return None
+    if not _profiling.acquire(blocking=False):
+        return None
+    profiler = Profiler(async_mode="enabled")
+    profiler.start()
+    return profiler
+
+def _save_profile(profiler, request_id: str, path: str):
+    from pyinstrument.renderers import SpeedscopeRenderer
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    out_path = os.path.join(PROFILE_DIR, f"{int(time.time())}_{request_id}.speedscope.json")
+    with open(out_path, "w") as f:
+        f.write(profiler.output(SpeedscopeRenderer()))
+    logger.warning("Saved profile of slow request %s %s to %s", request_id, path, out_path)
+
+
+class RequestContextMiddleware:
+    """
+    Assigns each HTTP request an id (reusing an incoming X-Request-ID),
+    echoes it in the response, times the whole request, and logs or
+    profiles the slow ones.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        incoming = dict(scope["headers"]).get(REQUEST_ID_HEADER)
+        request_id = incoming.decode("latin-1")[:64] if incoming else uuid.uuid4().hex
+        _request_id.set(request_id)
+        spans = _RequestSpans()
+        _request_spans.set(spans)
+        status = {"code": 500}
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(REQUEST_ID_HEADER, request_id.encode("latin-1"))]
+            await send(message)
+
+        profiler = _start_profiler()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            elapsed = time.perf_counter() - start
+            spans.active = False
+            # Streaming responses are included: the app returns once the body is sent.
+            # Unknown paths share one series so scanners cannot blow up the label set
+            route = "unmatched" if status["code"] == 404 else f"{scope['method']} {scope['path']}"
+            metrics.observe(f"http.{route}", elapsed)
+            if profiler is not None:
+                profiler.stop()
+                _profiling.release()
+            if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+                logger.warning(
+                    "Slow request %s %s %s took %.0f ms (status %s): %s",
+                    request_id, scope["method"], scope["path"], elapsed * 1000, status["code"],
+                    " ".join(f"{stage}={seconds * 1000:.0f}" for stage, seconds in spans),
+                )
+                if profiler is not None:
+                    _save_profile(profiler, request_id, scope["path"])
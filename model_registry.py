@@ -0,0 +1,178 @@
+import gc
+import os
+import threading
+import time
+
+from backend.utils import current_rss_bytes
+
+# Comma-separated models to load in the background at startup, e.g. "blip,clip"
+PRELOAD_MODELS = [name for name in os.getenv("PRELOAD_MODELS", "").split(",") if name.strip()]
+# Unload a model after this many idle seconds (0 keeps models forever)
+MODEL_IDLE_TIMEOUT = float(os.getenv("MODEL_IDLE_TIMEOUT", "0"))
+
+BLIP_MODEL_NAME = os.getenv("BLIP_MODEL_NAME", "Salesforce/blip-image-captioning-base")
+CLIP_MODEL_NAME = os.getenv("CLIP_MODEL_NAME", "openai/clip-vit-base-patch32")
+# Optional cross-encoder for text retrieval, e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2" (unset = off)
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "")
+# Local text embedder (EMBEDDING_PROVIDER=local); backend "torch", "onnx" or "openvino"
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+LOCAL_EMBEDDING_BACKEND = os.getenv("LOCAL_EMBEDDING_BACKEND", "torch")
+# Optional exported/quantized model file for the onnx backend, e.g. "onnx/model_qint8_avx512.onnx"
+LOCAL_EMBEDDING_FILE = os.getenv("LOCAL_EMBEDDING_FILE", "")
+
+# ------------------------------
+# Registry
+# ------------------------------
+
+class ModelRegistry:
+    """
+    One lazily loaded instance per model per process, with optional
+    background preloading and idle unloading.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._locks = {}
+        self._stats = {}
+        self._reaper = None
+        self._stop = threading.Event()
+
+    def register(self, name: str, loader):
+        self._loaders[name] = loader
+        self._locks[name] = threading.Lock()
+        self._stats[name] = {"loads": 0, "load_seconds": 0.0, "rss_delta_bytes": 0, "last_used": None}
+
+    def get(self, name: str):
+        """
+        Returns the model, loading it on first use. Concurrent callers wait for one load.
+        """
+        model = self._models.get(name)
+        if model is None:
+            with self._locks[name]:
+                model = self._models.get(name)
+                if model is None:
+                    model = self._load(name)
+        self._stats[name]["last_used"] = time.monotonic()
+        return model
+
+    def _load(self, name: str):
+        rss_before = current_rss_bytes()
+        start = time.perf_counter()
+        model = self._loaders[name]()
+        stats = self._stats[name]
+        stats["load_seconds"] = round(time.perf_counter() - start, 3)
+        stats["rss_delta_bytes"] = current_rss_bytes() - rss_before
+        stats["loads"] += 1
+        self._models[name] = model
+        print(f"✅ Loaded model '{name}' in {stats['load_seconds']}s")
+        return model
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def unload(self, name: str):
+        with self._locks[name]:
+            if self._models.pop(name, None) is None:
+                return
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+        print(f"💤 Unloaded idle model '{name}'")
+
+    def preload(self, names=None, background: bool = True):
+        names = list(names if names is not None else PRELOAD_MODELS)
+        if not names:
+            return None
+
+        def run():
+            for name in names:
+                self.get(name)
+
+        if not background:
+            run()
+            return None
+        thread = threading.Thread(target=run, name="model-preload", daemon=True)
+        thread.start()
+        return thread
+
+    def _reap(self, idle_timeout: float):
+        while not self._stop.wait(max(1.0, idle_timeout / 4)):
+            now = time.monotonic()
+            for name in list(self._models):
+                last_used = self._stats[name]["last_used"]
+                if last_used is not None and now - last_used > idle_timeout:
+                    self.unload(name)
+
+    def start_reaper(self, idle_timeout: float = MODEL_IDLE_TIMEOUT):
+        if idle_timeout <= 0 or self._reaper is not None:
+            return
+        self._stop.clear()
+        self._reaper = threading.Thread(target=self._reap, args=(idle_timeout,), name="model-reaper", daemon=True)
+        self._reaper.start()
+
+    def stop(self):
+        self._stop.set()
+        self._reaper = None
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        report = {}
+        for name, stats in self._stats.items():
+            last_used = stats["last_used"]
+            report[name] = {
+                "loaded": name in self._models,
+                "loads": stats["loads"],
+                "load_seconds": stats["load_seconds"],
+                "rss_delta_bytes": stats["rss_delta_bytes"],
+                "idle_seconds": round(now - last_used, 1) if last_used is not None else None,
+            }
+        return report
+
+# ------------------------------
+# Model loaders (heavy imports stay inside)
+# ------------------------------
+
+def get_device() -> str:
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+def load_blip():
+    from transformers import BlipProcessor, BlipForConditionalGeneration
+
+    device = get_device()
+    processor = BlipProcessor.from_pretrained(BLIP_MODEL_NAME)
+    model = BlipForConditionalGeneration.from_pretrained(BLIP_MODEL_NAME).to(device).eval()
+    return processor, model, device
+
+def load_clip():
+    from transformers import CLIPModel, CLIPProcessor
+
+    model = CLIPModel.from_pretrained(CLIP_MODEL_NAME).eval()
+    processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
+    return model, processor
+
+def load_reranker():
+    from sentence_transformers import CrossEncoder
+
+    # Small cross-encoders are fast enough on CPU and keep the GPU for BLIP/CLIP
+    return CrossEncoder(RERANKER_MODEL, device="cpu")
+
+def load_embedder():
+    from sentence_transformers import SentenceTransformer
+
+    if LOCAL_EMBEDDING_BACKEND == "torch":
+        return SentenceTransformer(LOCAL_EMBEDDING_MODEL, device="cpu")
+    model_kwargs = {"file_name": LOCAL_EMBEDDING_FILE} if LOCAL_EMBEDDING_FILE else None
+    return SentenceTransformer(LOCAL_EMBEDDING_MODEL, device="cpu", backend=LOCAL_EMBEDDING_BACKEND, model_kwargs=model_kwargs)
+
+
+models = ModelRegistry()
+models.register("blip", load_blip)
+models.register("clip", load_clip)
+models.register("reranker", load_reranker)
+models.register("embedder", load_embedder)
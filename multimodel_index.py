@@ -1,78 +1,92 @@
 import os
+import time
 import numpy as np
 import faiss
-from transformers import CLIPModel, CLIPProcessor
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS as TextFAISS
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
-from PIL import Image
+import torch
 from dotenv import load_dotenv
+from backend.text_indexer import build_text_index_incremental
+from backend.image_pipeline import list_images, iter_image_batches, IMAGE_BATCH_SIZE, IMAGE_DECODE_WORKERS
+from backend.index_factory import IMAGE_INDEX_TYPE, build_index
+from backend.model_registry import models
+from backend.embeddings import create_embedding_provider
 
 # Load API keys
 load_dotenv()
 
-# Init models
-clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
-openai_embed = OpenAIEmbeddings()
+# Init models (CLIP comes from the shared registry on first use)
+text_embeddings = create_embedding_provider()
 
 TEXT_INDEX_PATH = "faiss_text_index"
 IMAGE_INDEX_PATH = "faiss_image_index"
-IMAGE_META_PATH = "faiss_image_metadata.npy"
+IMAGE_META_PATH = "faiss_image_metadata.npy"  # legacy pickled list of dicts
+IMAGE_PATHS_PATH = "faiss_image_paths.npy"
+IMAGE_EMB_PATH = "faiss_image_embeddings.npy"
 
 # 🧠 TEXT VECTOR INDEX
-def build_text_index(pdf_dir="data"):
+def build_text_index(pdf_dir="data", rebuild=False):
     print("🔍 Building text index...")
-    
-    docs = []
-    for fname in os.listdir(pdf_dir):
-        if fname.endswith(".pdf"):
-            print(f"📄 Loading PDF: {fname}")
-            loader = PyPDFLoader(os.path.join(pdf_dir, fname))
-            docs.extend(loader.load())
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    chunks = splitter.split_documents(docs)
+    # Only new or changed PDFs are re-embedded; pass rebuild=True to start from scratch.
+    # Publishing bumps the version file so running servers hot-swap to it.
+    build_text_index_incremental(pdf_dir, text_embeddings, TEXT_INDEX_PATH, rebuild=rebuild)
 
-    print(f"✂️ Split into {len(chunks)} chunks")
+# 🧠 IMAGE VECTOR INDEX
+def embed_images(paths, batch_size=IMAGE_BATCH_SIZE, workers=IMAGE_DECODE_WORKERS, out_path=IMAGE_EMB_PATH):
+    """
+    Embeds images in batches into a preallocated float32 memmap at `out_path`.
+    Returns (embeddings_memmap, embedded_paths).
+    """
+    clip_model, clip_processor = models.get("clip")
+    image_processor = clip_processor.image_processor
+    size = image_processor.crop_size["height"]
+    dim = clip_model.config.projection_dim
 
-    vectorstore = TextFAISS.from_documents(chunks, openai_embed)
-    vectorstore.save_local(TEXT_INDEX_PATH)
+    # Rows for undecodable images stay unused; the result is sliced to what was written
+    embeddings = np.lib.format.open_memmap(out_path, mode="w+", dtype="float32", shape=(len(paths), dim))
+    embedded_paths = []
 
-    print(f"✅ Text index built and saved to: {TEXT_INDEX_PATH}")
+    start = time.perf_counter()
+    batches = iter_image_batches(paths, size, image_processor.image_mean, image_processor.image_std, batch_size, workers)
+    for batch_paths, pixels in batches:
+        with torch.inference_mode():
+            features = clip_model.get_image_features(pixel_values=torch.from_numpy(pixels))
 
-# 🧠 IMAGE VECTOR INDEX
-def build_image_index(img_dir="data/medical_images"):
+        row = len(embedded_paths)
+        embeddings[row:row + len(batch_paths)] = features.numpy()
+        embedded_paths.extend(batch_paths)
+        print(f"📸 Embedded {len(embedded_paths)}/{len(paths)} images")
+
+    elapsed = time.perf_counter() - start
+    embeddings.flush()
+    if elapsed > 0:
+        print(f"⚡ {len(embedded_paths) / elapsed:.1f} images/sec (batch={batch_size}, workers={workers})")
+    return embeddings[:len(embedded_paths)], embedded_paths
+
+def build_image_index(img_dir="data/medical_images", batch_size=IMAGE_BATCH_SIZE, workers=IMAGE_DECODE_WORKERS,
+                      kind=IMAGE_INDEX_TYPE):
     print("🖼️ Building image index...")
-    
-    embeddings = []
-    metadata = []
-
-    for i, fname in enumerate(os.listdir(img_dir)):
-        if fname.endswith((".png", ".jpg", ".jpeg")):
-            print(f"📸 Processing image [{i + 1}]: {fname}")
-            img_path = os.path.join(img_dir, fname)
-            image = Image.open(img_path).convert("RGB")
-            inputs = clip_processor(images=image, return_tensors="pt")
-            image_emb = clip_model.get_image_features(**inputs).detach().numpy()[0]
-
-            embeddings.append(image_emb)
-            metadata.append({"image_path": img_path})
-
-    if embeddings:
-        embeddings = np.array(embeddings).astype("float32")
-        index = faiss.IndexFlatL2(embeddings.shape[1])
-        index.add(embeddings)
-
-        faiss.write_index(index, IMAGE_INDEX_PATH)
-        np.save(IMAGE_META_PATH, metadata)
-
-        print(f"✅ Image index built and saved to: {IMAGE_INDEX_PATH}")
+
+    paths = list_images(img_dir)
+    embeddings, embedded_paths = embed_images(paths, batch_size, workers) if paths else (None, [])
+
+    if embedded_paths:
+        # Trains on a sample, then adds from the memmap in slices
+        index = build_index(kind, embeddings)
+
+        # Row i of the index is embedded_paths[i]; stored as a fixed-width
+        # string column so servers can mmap it. Paths first, index last, so a
+        # watcher never sees a new index with old paths for long.
+        np.save(IMAGE_PATHS_PATH + ".tmp.npy", np.array(embedded_paths))
+        os.replace(IMAGE_PATHS_PATH + ".tmp.npy", IMAGE_PATHS_PATH)
+        faiss.write_index(index, IMAGE_INDEX_PATH + ".tmp")
+        os.replace(IMAGE_INDEX_PATH + ".tmp", IMAGE_INDEX_PATH)
+
+        print(f"✅ Image index ({kind}) built and saved to: {IMAGE_INDEX_PATH}")
     else:
         print(f"⚠️ No valid images found in {img_dir}")
 
 # 🔁 Run from terminal
 if __name__ == "__main__":
-    build_text_index(pdf_dir="data")
+    import sys
+    build_text_index(pdf_dir="data", rebuild="--rebuild" in sys.argv)
     build_image_index(img_dir="data")
@@ -0,0 +1,85 @@
+import io
+import logging
+import os
+import re
+import time
+
+import numpy as np
+import pytesseract
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Images scoring below this go straight to BLIP
+OCR_TEXT_THRESHOLD = float(os.getenv("OCR_TEXT_THRESHOLD", "0.5"))
+# Tesseract gets a downscaled copy; text stays legible well below camera resolution
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "2000"))
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", "15"))
+# OCR output with fewer alphanumerics than this is treated as noise
+OCR_MIN_CHARS = int(os.getenv("OCR_MIN_CHARS", "20"))
+
+PRECHECK_SIDE = 256
+
+# ------------------------------
+# Cheap pre-check
+# ------------------------------
+
+def text_likelihood(image: Image.Image) -> float:
+    """
+    Scores 0..1 how much an image looks like a document: light background,
+    dense sharp edges (glyph strokes) and little colour. Runs on a 256px
+    thumbnail, so it costs a few milliseconds.
+    """
+    thumb = image.copy()
+    thumb.thumbnail((PRECHECK_SIDE, PRECHECK_SIDE))
+    rgb = np.asarray(thumb.convert("RGB"), dtype="float32")
+    gray = rgb.mean(axis=2)
+
+    light_ratio = float((gray > 200).mean())
+    gradient = np.abs(np.diff(gray, axis=0))[:, :-1] + np.abs(np.diff(gray, axis=1))[:-1, :]
+    edge_ratio = float((gradient > 60).mean())
+    saturation = float((rgb.max(axis=2) - rgb.min(axis=2)).mean() / 255.0)
+
+    score = (
+        0.4 * min(1.0, light_ratio / 0.5)
+        + 0.4 * min(1.0, edge_ratio / 0.08)
+        + 0.2 * (1.0 - min(1.0, saturation / 0.25))
+    )
+    return round(score, 3)
+
+# ------------------------------
+# OCR worker (runs in the process pool)
+# ------------------------------
+
+def prepare_for_ocr(image: Image.Image) -> Image.Image:
+    """
+    Downscale, grayscale and binarize so Tesseract does less work.
+    """
+    image = ImageOps.exif_transpose(image)
+    if max(image.size) > OCR_MAX_SIDE:
+        image.thumbnail((OCR_MAX_SIDE, OCR_MAX_SIDE))
+    gray = ImageOps.autocontrast(image.convert("L"))
+    # Mean-based global threshold; good enough for printed reports
+    threshold = int(np.asarray(gray).mean() * 0.9)
+    return gray.point(lambda value: 255 if value > threshold else 0, mode="1")
+
+def ocr_image_bytes(image_bytes: bytes, timeout: float = OCR_TIMEOUT) -> str:
+    """
+    Decodes, preprocesses and OCRs an image. Takes bytes so it pickles cheaply
+    into a worker process. The whole job gets `timeout` seconds: Tesseract is
+    killed when they run out, so the worker is free again either way.
+    Raises RuntimeError on timeout.
+    """
+    deadline = time.monotonic() + timeout
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        # JPEGs decode straight at reduced scale
+        image.draft("RGB", (OCR_MAX_SIDE, OCR_MAX_SIDE))
+        prepared = prepare_for_ocr(image)
+    remaining = deadline - time.monotonic()
+    # pytesseract treats 0 as "no timeout"
+    if remaining <= 0:
+        raise RuntimeError("OCR timeout spent before Tesseract started")
+    return pytesseract.image_to_string(prepared, timeout=remaining)
+
+def is_meaningful_text(text: str) -> bool:
+    return len(re.findall(r"[A-Za-z0-9]", text)) >= OCR_MIN_CHARS
@@ -1,28 +1,108 @@
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from openai import OpenAI
-import os
+from backend.answer_cache import answer_cache
+from backend.executors import run_in_thread, run_in_process
+from backend.utils import is_in_memory, spool_path
+from backend.llm_gateway import llm
+from backend.metrics import span
+from backend.pdf_ingest import has_cached_pages, load_pdf_chunks, pdf_sha256
+from backend.prompt_builder import dedupe_passages
+from backend.summarizer import build_summary_prompt, SUMMARY_MODEL
+import time
 from dotenv import load_dotenv
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+async def _complete(prompt: str, max_tokens: int = 500) -> str:
+    return (await llm.complete(prompt, route="pdf", model=SUMMARY_MODEL, max_tokens=max_tokens)).text
 
-def process_pdf(file_path: str):
-    loader = PyPDFLoader(file_path)
-    documents = loader.load()
+async def _parse(stream, pdf_hash: str) -> list:
+    if has_cached_pages(pdf_hash):
+        # Seen this PDF before: the page text is on disk, only chunking is left
+        return await run_in_thread(load_pdf_chunks, None, pdf_hash)
+    # pypdf is pure Python and holds the GIL, so every parse goes to a worker process
+    if is_in_memory(stream):
+        # Small uploads are already in RAM: ship the bytes
+        return await run_in_process(load_pdf_chunks, stream.read(), pdf_hash)
+    path = spool_path(stream)
+    if path is not None:
+        # Spilled to a named file: the worker opens it itself
+        return await run_in_process(load_pdf_chunks, path, pdf_hash)
+    # Spilled to an unnamed temp file: read it off the event loop, then ship the bytes
+    return await run_in_process(load_pdf_chunks, await run_in_thread(stream.read), pdf_hash)
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    chunks = splitter.split_documents(documents)
+async def hash_pdf(stream) -> str:
+    with span("pdf.hash"):
+        return await run_in_thread(pdf_sha256, stream)
 
-    top_text = "\n\n".join([doc.page_content for doc in chunks[:3]])
+async def cached_summary(pdf_hash: str):
+    # Identical uploads (same bytes) reuse the earlier summary
+    with span("pdf.cache_lookup"):
+        cached, _ = await answer_cache.lookup("pdf", pdf_hash)
+    return cached
 
-    prompt = f"Summarize this medical PDF:\n\n{top_text}"
+async def read_pdf_passages(stream, pdf_hash: str, timings: dict) -> list:
+    """
+    Parses an upload into deduplicated chunk texts.
+    """
+    start = time.perf_counter()
+    with span("pdf.parse"):
+        chunks = await _parse(stream, pdf_hash)
+    timings["parse_seconds"] = round(time.perf_counter() - start, 4)
 
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.3,
-        max_tokens=500
-    )
+    # Neighbouring chunks share the splitter's 50-character overlap; don't pay for it twice
+    passages, timings["duplicates_dropped"] = dedupe_passages(chunks, window=1)
+    return [text for _, text in passages]
 
-    return response.choices[0].message.content.strip()
\ No newline at end of file
+async def summary_prompt(passages: list, timings: dict) -> str:
+    """
+    Map-reduce over the passages; returns the final summary prompt.
+    """
+    with span("pdf.map_reduce"):
+        prompt, summary_timings = await build_summary_prompt(passages, _complete)
+    timings.update(summary_timings)
+    return prompt
+
+async def prepare_pdf(stream):
+    """
+    Cache lookup, parsing and the map-reduce stages over every chunk.
+    `stream` is the upload's binary file object. Returns (pdf_hash,
+    cached_summary, final_prompt, timings); the prompt is None on a cache
+    hit. The upload can be closed once this returns.
+    """
+    timings = {}
+
+    pdf_hash = await hash_pdf(stream)
+    cached = await cached_summary(pdf_hash)
+    if cached is not None:
+        return pdf_hash, cached, None, {"mode": "cached"}
+
+    passages = await read_pdf_passages(stream, pdf_hash, timings)
+    prompt = await summary_prompt(passages, timings)
+    return pdf_hash, None, prompt, timings
+
+async def process_pdf(stream):
+    """
+    Summarizes the whole PDF. Returns (summary, per-stage timings).
+    """
+    pdf_hash, cached, prompt, timings = await prepare_pdf(stream)
+    if cached is not None:
+        return cached, timings
+
+    start = time.perf_counter()
+    summary = await _complete(prompt)
+    timings["final_seconds"] = round(time.perf_counter() - start, 4)
+
+    await answer_cache.store("pdf", pdf_hash, summary)
+    return summary, timings
+
+async def stream_pdf_summary(pdf_hash: str, cached: str, prompt: str):
+    """
+    Yields the summary for a prepared PDF token by token.
+    """
+    if cached is not None:
+        yield cached
+        return
+
+    stream = llm.stream(prompt, route="pdf", model=SUMMARY_MODEL)
+    async for token in stream:
+        yield token
+
+    await answer_cache.store("pdf", pdf_hash, stream.result.text)
@@ -0,0 +1,185 @@
+import hashlib
+import io
+import json
+import os
+import uuid
+from concurrent.futures import as_completed
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.schema import Document
+
+from backend.executors import get_process_pool
+
+# Page text extractor: "pypdf" (default), "pdfplumber" (better layout) or "pdfium" (fastest, pip install pypdfium2)
+PDF_EXTRACTOR = os.getenv("PDF_EXTRACTOR", "pypdf")
+PDF_CHUNK_SIZE = int(os.getenv("PDF_CHUNK_SIZE", "500"))
+PDF_CHUNK_OVERLAP = int(os.getenv("PDF_CHUNK_OVERLAP", "50"))
+# Extracted page text keyed by PDF hash; re-uploads and re-builds skip parsing (empty = off)
+PDF_PAGE_CACHE_DIR = os.getenv("PDF_PAGE_CACHE_DIR", "pdf_page_cache")
+PDF_PAGE_CACHE_MAX_FILES = int(os.getenv("PDF_PAGE_CACHE_MAX_FILES", "2000"))
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+# ------------------------------
+# Page extractors (each yields page text lazily)
+# ------------------------------
+
+def _open_source(source):
+    return io.BytesIO(source) if isinstance(source, bytes) else source
+
+def _pypdf_pages(source):
+    from pypdf import PdfReader
+
+    # PdfReader parses page objects on access, so pages are read one at a time
+    for page in PdfReader(_open_source(source)).pages:
+        yield page.extract_text() or ""
+
+def _pdfplumber_pages(source):
+    import pdfplumber
+
+    with pdfplumber.open(_open_source(source)) as pdf:
+        for page in pdf.pages:
+            yield page.extract_text() or ""
+            # pdfplumber keeps every parsed layout object around unless told otherwise
+            page.flush_cache()
+
+def _pdfium_pages(source):
+    import pypdfium2
+
+    pdf = pypdfium2.PdfDocument(source)
+    try:
+        for index in range(len(pdf)):
+            page = pdf[index]
+            textpage = page.get_textpage()
+            yield textpage.get_text_range()
+            textpage.close()
+            page.close()
+    finally:
+        pdf.close()
+
+EXTRACTORS = {
+    "pypdf": _pypdf_pages,
+    "pdfplumber": _pdfplumber_pages,
+    "pdfium": _pdfium_pages,
+}
+
+# ------------------------------
+# Page text cache
+# ------------------------------
+
+def pdf_sha256(source) -> str:
+    """
+    Hash of a PDF given as bytes, a path or a binary file object (rewound after).
+    """
+    if isinstance(source, bytes):
+        return hashlib.sha256(source).hexdigest()
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return pdf_sha256(f)
+    digest = hashlib.sha256()
+    source.seek(0)
+    for block in iter(lambda: source.read(HASH_CHUNK_BYTES), b""):
+        digest.update(block)
+    source.seek(0)
+    return digest.hexdigest()
+
+def _cache_path(pdf_hash: str, extractor: str):
+    if not PDF_PAGE_CACHE_DIR or not pdf_hash:
+        return None
+    return os.path.join(PDF_PAGE_CACHE_DIR, f"{pdf_hash}.{extractor}.jsonl")
+
+def has_cached_pages(pdf_hash: str, extractor: str = PDF_EXTRACTOR) -> bool:
+    path = _cache_path(pdf_hash, extractor)
+    return path is not None and os.path.exists(path)
+
+def _read_cached_pages(path: str):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+def _prune_cache():
+    entries = [entry for entry in os.scandir(PDF_PAGE_CACHE_DIR) if entry.name.endswith(".jsonl")]
+    if len(entries) <= PDF_PAGE_CACHE_MAX_FILES:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[:len(entries) - PDF_PAGE_CACHE_MAX_FILES]:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+def _caching_pages(pages, path: str):
+    """
+    Passes pages through while writing them to the cache. The entry only
+    appears once the PDF was read to the end, so a crash leaves no partial file.
+    """
+    os.makedirs(PDF_PAGE_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for text in pages:
+                f.write(json.dumps(text) + "\n")
+                yield text
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    _prune_cache()
+
+def iter_pages(source, pdf_hash: str = None, extractor: str = PDF_EXTRACTOR):
+    """
+    Yields the text of each page in order. `source` is bytes, a path or a
+    binary file object; with `pdf_hash` the text comes from (or goes to)
+    the page cache, and `source` may be None on a cache hit.
+    """
+    if extractor not in EXTRACTORS:
+        raise ValueError(f"Unknown PDF extractor '{extractor}', expected one of {tuple(EXTRACTORS)}")
+    path = _cache_path(pdf_hash, extractor)
+    if path is not None and os.path.exists(path):
+        return _read_cached_pages(path)
+    pages = EXTRACTORS[extractor](source)
+    return _caching_pages(pages, path) if path is not None else pages
+
+# ------------------------------
+# Incremental chunking
+# ------------------------------
+
+def iter_chunks(source, pdf_hash: str = None, extractor: str = PDF_EXTRACTOR, metadata: dict = None):
+    """
+    Yields chunk Documents page by page, so only one page is held in
+    memory at a time however long the PDF is. Splitting each page on its
+    own matches what `split_documents` did over the full page list.
+    """
+    splitter = RecursiveCharacterTextSplitter(chunk_size=PDF_CHUNK_SIZE, chunk_overlap=PDF_CHUNK_OVERLAP)
+    for page_number, text in enumerate(iter_pages(source, pdf_hash, extractor)):
+        for chunk in splitter.split_text(text):
+            yield Document(page_content=chunk, metadata={**(metadata or {}), "page": page_number})
+
+def load_pdf_chunks(source, pdf_hash: str = None) -> list:
+    """
+    Chunk texts of an uploaded PDF. Pure-Python and CPU-bound on a cache
+    miss; bytes pickle cheaply into the process pool.
+    """
+    return [doc.page_content for doc in iter_chunks(source, pdf_hash)]
+
+def load_pdf_file(path: str, pdf_hash: str = None):
+    """
+    Chunks one PDF on disk. Returns (path, sha256, documents).
+    Top-level so it can run in the process pool.
+    """
+    pdf_hash = pdf_hash or pdf_sha256(path)
+    return path, pdf_hash, list(iter_chunks(path, pdf_hash, metadata={"source": path}))
+
+def iter_pdf_files(files: list, parallel: bool = True):
+    """
+    Yields load_pdf_file results for [(path, sha256 or None)] as files
+    finish, parsing them across the shared process pool.
+    """
+    if not parallel or len(files) < 2:
+        for path, pdf_hash in files:
+            yield load_pdf_file(path, pdf_hash)
+        return
+    pool = get_process_pool()
+    futures = [pool.submit(load_pdf_file, path, pdf_hash) for path, pdf_hash in files]
+    for future in as_completed(futures):
+        yield future.result()
@@ -0,0 +1,131 @@
+import os
+import re
+
+from backend.summarizer import count_tokens, get_encoding
+
+# Token budget for retrieved context in RAG prompts
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1200"))
+# Longer passages are cut to this many tokens before packing (0 = no cap)
+RAG_PASSAGE_MAX_TOKENS = int(os.getenv("RAG_PASSAGE_MAX_TOKENS", "400"))
+
+# The splitter overlaps neighbouring chunks by 50 characters; shorter matches are coincidence
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 200
+# How many kept passages a new one is compared against for overlap/containment
+DEDUPE_WINDOW = 8
+
+TEXT_RAG_TEMPLATE = "Using the context below, answer the medical query:\n\n{context}\n\nQuestion: {query}"
+
+# ------------------------------
+# Deduplication
+# ------------------------------
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+def _overlap(previous: str, text: str) -> int:
+    """
+    Length of the longest suffix of `previous` that starts `text`.
+    """
+    for size in range(min(len(previous), len(text), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(text[:size]):
+            return size
+    return 0
+
+def dedupe_passages(texts: list, window: int = DEDUPE_WINDOW):
+    """
+    Drops exact and contained duplicates and strips the text a passage
+    shares with the end of an earlier one. Returns (passages, dropped),
+    where passages keep their input order and index: [(index, text)].
+    """
+    kept, seen, dropped = [], set(), 0
+    for index, text in enumerate(texts):
+        text = text.strip()
+        key = _normalize(text)
+        recent = kept[-window:]
+        if not key or key in seen or any(key in _normalize(other) for _, other in recent):
+            dropped += 1
+            continue
+        seen.add(key)
+        for _, other in reversed(recent):
+            size = _overlap(other, text)
+            if size:
+                text = text[size:].lstrip()
+                break
+        if text:
+            kept.append((index, text))
+        else:
+            dropped += 1
+    return kept, dropped
+
+# ------------------------------
+# Packing
+# ------------------------------
+
+TRUNCATION_MARKER = " …"
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    encoding = get_encoding()
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    # The marker's tokens come out of the cap, so the result still fits max_tokens;
+    # a cap too small for the marker gets a bare cut
+    marker_tokens = len(encoding.encode(TRUNCATION_MARKER))
+    marker = TRUNCATION_MARKER if max_tokens > marker_tokens else ""
+    keep = max_tokens - marker_tokens if marker else max(max_tokens, 0)
+    # A cut inside a multi-byte character decodes to U+FFFD, which costs more tokens
+    return encoding.decode(tokens[:keep]).rstrip("\ufffd").rstrip() + marker
+
+def pack_passages(texts: list, budget: int = RAG_CONTEXT_TOKENS, scores: list = None,
+                  passage_max_tokens: int = RAG_PASSAGE_MAX_TOKENS):
+    """
+    Fits ranked passages into `budget` tokens. The best passage always goes
+    in (cut to fit if it must); the rest are chosen by relevance per token.
+    `scores` defaults to reciprocal rank. Selected passages keep rank order,
+    so the most relevant text sits at the top of the prompt.
+    Returns (context, stats).
+    """
+    passages, dropped = dedupe_passages(texts)
+    if scores is None:
+        scores = [1.0 / (rank + 1) for rank in range(len(texts))]
+
+    if passage_max_tokens:
+        passages = [(index, truncate_tokens(text, passage_max_tokens)) for index, text in passages]
+    costs = {index: count_tokens(text) for index, text in passages}
+
+    chosen, used = {}, 0
+    if passages:
+        best_index, best_text = passages[0]
+        if costs[best_index] > budget:
+            best_text = truncate_tokens(best_text, budget)
+            costs[best_index] = count_tokens(best_text)
+        chosen[best_index] = best_text
+        used = costs[best_index]
+
+    by_value = sorted(passages[1:], key=lambda item: scores[item[0]] / max(costs[item[0]], 1), reverse=True)
+    for index, text in by_value:
+        if used + costs[index] <= budget:
+            chosen[index] = text
+            used += costs[index]
+
+    context = "\n\n".join(chosen[index] for index in sorted(chosen))
+    stats = {
+        "passages_in": len(texts),
+        "passages_used": len(chosen),
+        "duplicates_dropped": dropped,
+        "context_tokens": used,
+        "budget": budget,
+    }
+    return context, stats
+
+def build_rag_prompt(query: str, texts: list, template: str = TEXT_RAG_TEMPLATE,
+                     budget: int = RAG_CONTEXT_TOKENS, scores: list = None, **fields):
+    """
+    Returns (prompt, stats) with the context packed to the token budget.
+    `fields` fill any other placeholders in the template (e.g. history).
+    """
+    context, stats = pack_passages(texts, budget, scores)
+    prompt = template.format(context=context, query=query, **fields)
+    stats["prompt_tokens"] = count_tokens(prompt)
+    return prompt, stats
@@ -1,59 +1,73 @@
 import numpy as np
-import faiss
 from PIL import Image
-from transformers import CLIPProcessor, CLIPModel
-from langchain_community.vectorstores import FAISS as TextFAISS
-from langchain_openai import OpenAIEmbeddings
-from openai import OpenAI
+from backend.text_handler import retrieve_text
+from backend.index_manager import ImageIndexManager, IndexNotBuiltError
+from backend.model_registry import models
+from backend.batcher import MicroBatcher
+from backend.executors import run_in_thread
+from backend.llm_gateway import llm
+from backend.metrics import span
+from backend.prompt_builder import build_rag_prompt
 import os
 
-clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
-openai_embed = OpenAIEmbeddings()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+CLIP_MAX_BATCH = int(os.getenv("CLIP_MAX_BATCH", "16"))
+CLIP_MAX_WAIT_MS = float(os.getenv("CLIP_MAX_WAIT_MS", "10"))
 
 TEXT_INDEX_PATH = "faiss_text_index"
 IMAGE_INDEX_PATH = "faiss_image_index"
 IMAGE_META_PATH = "faiss_image_metadata.npy"
+IMAGE_PATHS_PATH = "faiss_image_paths.npy"
+
+# Loaded once per process (memory-mapped) and hot-swapped on rebuild
+image_index = ImageIndexManager(IMAGE_INDEX_PATH, IMAGE_PATHS_PATH, legacy_meta_path=IMAGE_META_PATH)
 
 # 🔍 TEXT QUERY
-def query_text_rag(text_query: str):
-    vectorstore = TextFAISS.load_local(TEXT_INDEX_PATH, openai_embed)
-    docs = vectorstore.similarity_search(text_query, k=3)
-    context = "\n".join([doc.page_content for doc in docs])
-
-    prompt = f"Use the following medical context to answer:\n\n{context}\n\nQ: {text_query}"
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.3,
-        max_tokens=500
+async def query_text_rag(text_query: str):
+    cached, docs, _, _ = await retrieve_text(text_query)
+    if cached is not None:
+        return cached
+    prompt, _ = build_rag_prompt(
+        text_query,
+        [doc.page_content for doc in docs],
+        template="Use the following medical context to answer:\n\n{context}\n\nQ: {query}",
     )
-    return response.choices[0].message.content.strip()
+    return (await llm.complete(prompt, route="text_rag")).text
 
-# 🖼️ IMAGE QUERY
-def query_image_rag(image: Image.Image, user_question: str):
-    inputs = clip_processor(images=image, return_tensors="pt")
-    image_emb = clip_model.get_image_features(**inputs).detach().numpy().astype("float32")
+# 🖼️ IMAGE EMBEDDING (micro-batched)
+def _clip_embed_batch(images: list) -> list:
+    import torch
 
-    index = faiss.read_index(IMAGE_INDEX_PATH)
-    metadata = np.load(IMAGE_META_PATH, allow_pickle=True)
+    clip_model, clip_processor = models.get("clip")
+    inputs = clip_processor(images=images, return_tensors="pt")
+    with torch.inference_mode():
+        features = clip_model.get_image_features(**inputs)
+    return list(features.numpy().astype("float32"))
 
-    _, indices = index.search(image_emb, k=3)
-    matched = [metadata[i] for i in indices[0]]
+# Concurrent queries share one CLIP forward pass
+clip_batcher = MicroBatcher("clip", _clip_embed_batch, CLIP_MAX_BATCH, CLIP_MAX_WAIT_MS)
+
+# 🖼️ IMAGE QUERY
+def _search_image_index(image_emb: np.ndarray, k: int = 3) -> list:
+    index, paths = image_index.get()
+    _, indices = index.search(image_emb[None, :], k=k)
+    return [str(paths[i]) for i in indices[0] if i >= 0]
+
+async def query_image_rag(image: Image.Image, user_question: str):
+    # Nothing to search: fail before paying for the CLIP forward pass
+    if not image_index.available():
+        raise IndexNotBuiltError(f"{image_index.name} has not been built yet")
+    with span("clip.embed"):
+        image_emb = await clip_batcher.submit(image)
+    with span("image.faiss_search"):
+        matched = await run_in_thread(_search_image_index, image_emb)
 
     # Generate GPT prompt from image context
     prompt = (
         f"The user uploaded a medical image and asked: '{user_question}'.\n"
         f"Here are related images from memory:\n" +
-        "\n".join([f"- Similar image: {os.path.basename(m['image_path'])}" for m in matched]) +
+        "\n".join([f"- Similar image: {os.path.basename(path)}" for path in matched]) +
         "\n\nGenerate a helpful and medically sound response."
     )
 
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.3,
-        max_tokens=500
-    )
-    return response.choices[0].message.content.strip()
+    return (await llm.complete(prompt, route="image_rag")).text
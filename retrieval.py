@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+
+from backend.lexical_index import is_code_query, reciprocal_rank_fusion
+from backend.model_registry import models, RERANKER_MODEL
+
+# "hybrid" (BM25 + vectors, lexical-only for code-like queries), "vector" or "lexical"
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "3"))
+# Candidates taken from each retriever before fusion / reranking
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# ------------------------------
+# Hybrid text retrieval
+# ------------------------------
+
+def use_lexical_only(query: str, mode: str = RETRIEVAL_MODE) -> bool:
+    """
+    True when the query can skip the embedding call entirely.
+    """
+    return mode == "lexical" or (mode == "hybrid" and is_code_query(query))
+
+def rerank(query: str, docs: list) -> list:
+    """
+    Reorders docs with the CPU cross-encoder (RERANKER_MODEL); a no-op when unset.
+    """
+    if not RERANKER_MODEL or len(docs) < 2:
+        return docs
+    scores = models.get("reranker").predict([(query, doc.page_content) for doc in docs])
+    return [doc for _, doc in sorted(zip(scores, docs), key=lambda pair: -pair[0])]
+
+def _vector_ids(store, query_embedding, n: int) -> list:
+    _, rows = store.index.search(np.asarray([query_embedding], dtype="float32"), n)
+    return [store.index_to_docstore_id[row] for row in rows[0] if row != -1]
+
+def search(payload, query: str, query_embedding=None, k: int = RETRIEVAL_K,
+           mode: str = RETRIEVAL_MODE, candidates: int = RETRIEVAL_CANDIDATES) -> list:
+    """
+    Top-k Documents for a query. `payload` is TextIndexManager.get()'s
+    (store, lexical). Without a query embedding only BM25 is used.
+    Blocking (FAISS, BM25, reranker), so call it from a thread.
+    """
+    store, lexical = payload
+    # Only over-fetch when a reranker will pick from the pool
+    pool = candidates if RERANKER_MODEL else k
+
+    lexical_ids = []
+    if lexical is not None and mode != "vector":
+        lexical_ids = [doc_id for doc_id, _ in lexical.search(query, candidates)]
+
+    if query_embedding is None or mode == "lexical":
+        ranked = lexical_ids
+    elif mode == "vector" or not lexical_ids:
+        ranked = _vector_ids(store, query_embedding, pool)
+    else:
+        ranked = reciprocal_rank_fusion([_vector_ids(store, query_embedding, candidates), lexical_ids], RRF_K)
+
+    docs = [store.docstore.search(doc_id) for doc_id in ranked[:pool]]
+    return rerank(query, docs)[:k]
@@ -1,10 +1,72 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 from PIL import Image
 import io
+import json
 
 API_URL = "http://localhost:8000"  # Replace with your server URL
 
+PART_TITLES = {"pdf": "📄 PDF Summary", "image": "🖼️ Image Analysis", "answer": "📚 Answer"}
+
+# ----------------------
+# Pooled HTTP session
+# ----------------------
+@st.cache_resource
+def get_session():
+    """
+    One keep-alive connection pool shared by every rerun of the script,
+    instead of a new TCP connection per request.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+http = get_session()
+
+# ----------------------
+# SSE Streaming Helper
+# ----------------------
+def stream_analysis(data, files):
+    """
+    Posts every input to /analyze/stream and renders each part (PDF summary,
+    image analysis, answer) in its own section as tokens arrive.
+    Returns {part: text} for the parts that finished.
+    """
+    sections, texts, done = {}, {}, {}
+    event = None
+
+    with http.post(f"{API_URL}/analyze/stream", data=data, files=files, stream=True) as resp:
+        if resp.status_code != 200:
+            st.error(resp.json().get("detail", "Request failed."))
+            return done
+
+        for line in resp.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                payload = json.loads(line[len("data:"):])
+                if event == "meta":
+                    for part in payload["parts"]:
+                        st.subheader(PART_TITLES.get(part, part))
+                        sections[part] = st.empty()
+                        texts[part] = ""
+                elif event == "part_done":
+                    done[payload["part"]] = payload["response"]
+                    sections[payload["part"]].success(payload["response"])
+                elif event == "part_error":
+                    sections[payload["part"]].error(payload.get("detail", "Generation failed."))
+                elif event is None:
+                    part = payload["part"]
+                    texts[part] += payload["token"]
+                    sections[part].markdown(texts[part] + "▌")
+            elif not line:
+                event = None
+
+    return done
+
 # ----------------------
 # Session Initialization
 # ----------------------
@@ -58,7 +120,7 @@ if st.sidebar.button("Submit"):
         try:
             data = {"email": email, "password": password}
             endpoint = "/login" if auth_mode == "Login" else "/register"
-            resp = requests.post(f"{API_URL}{endpoint}", data=data)
+            resp = http.post(f"{API_URL}{endpoint}", data=data)
             if resp.status_code == 200:
                 if auth_mode == "Login":
                     token = resp.json().get("access_token")
@@ -67,7 +129,7 @@ if st.sidebar.button("Submit"):
                     st.sidebar.success("Login successful ✅")
 
                     # ✅ Fetch persistent chat history
-                    hist_resp = requests.post(f"{API_URL}/history", data={
+                    hist_resp = http.post(f"{API_URL}/history", data={
                         "token": token,
                         "limit": 10
                     })
@@ -91,6 +153,11 @@ if st.session_state.token:
         st.session_state.user_email = None
         st.session_state.history = []
 
+    if st.sidebar.button("🆕 New conversation"):
+        # Follow-up questions no longer refer back to earlier answers
+        http.post(f"{API_URL}/conversation/reset", data={"token": st.session_state.token})
+        st.sidebar.info("Started a new conversation.")
+
     pdf_file = st.sidebar.file_uploader("📎 Upload PDF", type=["pdf"], help="Upload lab report or prescription")
     image_file = st.sidebar.file_uploader("🖼️ Upload Image", type=["jpg", "jpeg", "png"], help="Upload scan or rash photo")
 
@@ -112,54 +179,23 @@ if st.session_state.token:
         if not any([pdf_file, image_file, user_query]):
             st.warning("Please upload a file or ask a question.")
         else:
-            with st.spinner("Processing..."):
-                results = []
-                token_data = {"token": st.session_state.token}
-
-                # Handle PDF
-                if pdf_file:
-                    files = {"file": (pdf_file.name, pdf_file, pdf_file.type)}
-                    resp = requests.post(f"{API_URL}/upload-pdf", files=files, data=token_data)
-                    if resp.status_code == 200:
-                        response = resp.json().get("response")
-                        results.append(("📄 PDF Summary", response))
-                        st.session_state.history.append((f"PDF: {pdf_file.name}", response))
-
-                # Handle Image + Text
-                if image_file and user_query:
-                    files = {"file": (image_file.name, image_file, image_file.type)}
-                    data = {"question": user_query, "token": st.session_state.token}
-                    resp = requests.post(f"{API_URL}/upload-image", files=files, data=data)
-                    if resp.status_code == 200:
-                        response = resp.json().get("response")
-                        results.append(("🖼️ Image + Q&A (BLIP/OCR)", response))
-                        st.session_state.history.append((user_query, response))
-
-                # Handle Image Only
-                elif image_file:
-                    files = {"file": (image_file.name, image_file, image_file.type)}
-                    resp = requests.post(f"{API_URL}/upload-image", files=files, data=token_data)
-                    if resp.status_code == 200:
-                        response = resp.json().get("response")
-                        results.append(("🧠 Image Summary", response))
-                        st.session_state.history.append(("Image Summary", response))
-
-                # Handle Text Only
-                elif user_query:
-                    data = {"query": user_query, "token": st.session_state.token}
-                    resp = requests.post(f"{API_URL}/query-text-rag", data=data)
-                    if resp.status_code == 200:
-                        response = resp.json().get("response")
-                        results.append(("📚 RAG Answer", response))
-                        st.session_state.history.append((user_query, response))
-
-                # Show results
-                if results:
-                    for title, res in results:
-                        st.subheader(title)
-                        st.success(res)
-                else:
-                    st.error("Something went wrong.")
+            # One request: the backend runs the PDF, image and question pipelines concurrently
+            data = {"token": st.session_state.token, "query": user_query or ""}
+            files = {}
+            if pdf_file:
+                files["pdf"] = (pdf_file.name, pdf_file, pdf_file.type)
+            if image_file:
+                files["image"] = (image_file.name, image_file, image_file.type)
+
+            parts = stream_analysis(data, files or None)
+            answered = bool(parts)
+            if answered:
+                inputs = [f"PDF: {pdf_file.name}" if pdf_file else None, f"Image: {image_file.name}" if image_file else None, user_query]
+                response = "\n\n".join(f"**{PART_TITLES[part]}**\n{text}" for part, text in parts.items())
+                st.session_state.history.append((" | ".join(item for item in inputs if item), response))
+
+            if not answered:
+                st.error("Something went wrong.")
 
 # ----------------------
 # Button Styling
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import os
+import time
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+# Context window of the summarization model and how it is split
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4")
+SUMMARY_CONTEXT_TOKENS = int(os.getenv("SUMMARY_CONTEXT_TOKENS", "8192"))
+SUMMARY_OUTPUT_TOKENS = int(os.getenv("SUMMARY_OUTPUT_TOKENS", "500"))
+SUMMARY_MAP_OUTPUT_TOKENS = int(os.getenv("SUMMARY_MAP_OUTPUT_TOKENS", "300"))
+# Input budget per map call; smaller batches mean more, faster, parallel calls
+SUMMARY_MAP_INPUT_TOKENS = int(os.getenv("SUMMARY_MAP_INPUT_TOKENS", "3000"))
+# Documents under this many tokens skip map-reduce and go out in one call
+SUMMARY_SINGLE_CALL_TOKENS = int(os.getenv("SUMMARY_SINGLE_CALL_TOKENS", "3000"))
+SUMMARY_MAP_CONCURRENCY = int(os.getenv("SUMMARY_MAP_CONCURRENCY", "4"))
+SUMMARY_REQUESTS_PER_MINUTE = int(os.getenv("SUMMARY_REQUESTS_PER_MINUTE", "120"))
+
+MAP_PROMPT = (
+    "Summarize this section of a medical PDF. Keep every test name, value, unit, "
+    "reference range, diagnosis, medication and date:\n\n{text}"
+)
+REDUCE_PROMPT = (
+    "Combine these partial summaries of the same medical PDF into one summary. "
+    "Keep abnormal values and clinically relevant findings:\n\n{text}"
+)
+FINAL_PROMPT = "Summarize this medical PDF:\n\n{text}"
+
+# Room left for the instruction text around the packed context
+PROMPT_OVERHEAD_TOKENS = 100
+
+# Used only when the tiktoken encoding cannot be loaded
+APPROX_CHARS_PER_TOKEN = 4
+
+class ApproximateEncoding:
+    """
+    Counts about one token per APPROX_CHARS_PER_TOKEN characters. Stands in
+    for tiktoken when its encoding file is neither cached (TIKTOKEN_CACHE_DIR)
+    nor downloadable, e.g. offline; budgets are approximate but still hold.
+    """
+
+    name = "approximate"
+
+    def encode(self, text: str) -> list:
+        return [text[i:i + APPROX_CHARS_PER_TOKEN] for i in range(0, len(text), APPROX_CHARS_PER_TOKEN)]
+
+    def decode(self, tokens: list) -> str:
+        return "".join(tokens)
+
+_encoding = None
+
+def _load_encoding():
+    try:
+        return tiktoken.encoding_for_model(SUMMARY_MODEL)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+def get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = _load_encoding()
+        except Exception as e:
+            # tiktoken downloads the encoding on first use; without network, approximate
+            # rather than failing every LLM call (and only try the download once)
+            logger.warning("Could not load the tiktoken encoding (%s); token counts are approximate", e)
+            _encoding = ApproximateEncoding()
+    return _encoding
+
+def count_tokens(text: str) -> int:
+    return len(get_encoding().encode(text))
+
+# ------------------------------
+# Rate limiting
+# ------------------------------
+
+class RateLimiter:
+    """
+    Spaces calls evenly so at most `per_minute` start in any minute.
+    """
+
+    def __init__(self, per_minute: int):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+# Shared by every summarization in this process
+rate_limiter = RateLimiter(SUMMARY_REQUESTS_PER_MINUTE)
+
+# ------------------------------
+# Token-budget planner
+# ------------------------------
+
+def plan_batches(texts: list, budget: int) -> list:
+    """
+    Packs texts, in order, into batches of at most `budget` tokens.
+    A single text over budget is truncated rather than dropped.
+    """
+    encoding = get_encoding()
+    batches, current, current_tokens = [], [], 0
+
+    for text in texts:
+        tokens = encoding.encode(text)
+        if len(tokens) > budget:
+            tokens = tokens[:budget]
+            text = encoding.decode(tokens)
+        if current and current_tokens + len(tokens) > budget:
+            batches.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += len(tokens)
+
+    if current:
+        batches.append("\n\n".join(current))
+    return batches
+
+# ------------------------------
+# Map-reduce
+# ------------------------------
+
+async def _run_stage(batches: list, template: str, complete, max_tokens: int, concurrency: int) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(batch):
+        async with semaphore:
+            await rate_limiter.wait()
+            return await complete(template.format(text=batch), max_tokens)
+
+    return await asyncio.gather(*(run(batch) for batch in batches))
+
+async def build_summary_prompt(chunks: list, complete, concurrency: int = SUMMARY_MAP_CONCURRENCY):
+    """
+    Reduces a whole document to a single final prompt.
+
+    `complete(prompt, max_tokens)` is an async LLM call used for the map and
+    intermediate reduce steps; the final call is left to the caller so it can
+    be streamed. Returns (final_prompt, timings).
+    """
+    timings = {"chunks": len(chunks)}
+    start = time.perf_counter()
+
+    final_budget = SUMMARY_CONTEXT_TOKENS - SUMMARY_OUTPUT_TOKENS - PROMPT_OVERHEAD_TOKENS
+    total_tokens = sum(count_tokens(chunk) for chunk in chunks)
+    timings["document_tokens"] = total_tokens
+
+    # Early exit: short documents go straight to the final call
+    if total_tokens <= min(SUMMARY_SINGLE_CALL_TOKENS, final_budget):
+        timings["mode"] = "single"
+        timings["plan_seconds"] = round(time.perf_counter() - start, 4)
+        return FINAL_PROMPT.format(text="\n\n".join(chunks)), timings
+
+    map_budget = min(SUMMARY_MAP_INPUT_TOKENS, SUMMARY_CONTEXT_TOKENS - SUMMARY_MAP_OUTPUT_TOKENS - PROMPT_OVERHEAD_TOKENS)
+    batches = plan_batches(chunks, map_budget)
+    timings["mode"] = "map_reduce"
+    timings["map_calls"] = len(batches)
+    timings["plan_seconds"] = round(time.perf_counter() - start, 4)
+
+    stage_start = time.perf_counter()
+    summaries = await _run_stage(batches, MAP_PROMPT, complete, SUMMARY_MAP_OUTPUT_TOKENS, concurrency)
+    timings["map_seconds"] = round(time.perf_counter() - stage_start, 4)
+
+    # Hierarchical reduce until everything fits in the final prompt
+    stage_start = time.perf_counter()
+    levels = 0
+    groups = plan_batches(summaries, final_budget)
+    while len(groups) > 1:
+        levels += 1
+        summaries = await _run_stage(groups, REDUCE_PROMPT, complete, SUMMARY_MAP_OUTPUT_TOKENS, concurrency)
+        groups = plan_batches(summaries, final_budget)
+    timings["reduce_levels"] = levels
+    timings["reduce_seconds"] = round(time.perf_counter() - stage_start, 4)
+
+    return REDUCE_PROMPT.format(text=groups[0]), timings
@@ -0,0 +1,53 @@
+import importlib.util
+import os
+import sys
+import types
+
+import pytest
+import tiktoken
+
+# The modules import each other as `backend.<module>` (and `backend.models.<module>`
+# for the two model files), as laid out in the app. When this checkout is not
+# itself importable as `backend`, map both package names onto the repo root.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _alias_package(name: str, path: str):
+    package = types.ModuleType(name)
+    package.__path__ = [path]
+    sys.modules[name] = package
+
+if importlib.util.find_spec("backend") is None:
+    _alias_package("backend", ROOT)
+    _alias_package("backend.models", ROOT)
+
+# Imports must not need a live MongoDB
+os.environ.setdefault("MONGO_URI", "mongomock://localhost")
+
+# ------------------------------
+# Offline token counting
+# ------------------------------
+
+# Single tokens in the test encoding, with or without a leading space
+TEST_VOCABULARY = ["one", "two", "three", "four", "five", "six", "seven", "eight", "word", "summary"]
+
+def local_encoding() -> tiktoken.Encoding:
+    """
+    Byte-level BPE plus whole-word tokens for TEST_VOCABULARY. Needs no
+    download, unlike the real encodings, and makes token counts exact.
+    """
+    ranks = {bytes([i]): i for i in range(256)}
+    for word in TEST_VOCABULARY:
+        for piece in (word, f" {word}"):
+            ranks[piece.encode("utf-8")] = len(ranks)
+    return tiktoken.Encoding(
+        "test_local",
+        pat_str=r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+""",
+        mergeable_ranks=ranks,
+        special_tokens={},
+    )
+
+@pytest.fixture(autouse=True)
+def offline_encoding(monkeypatch):
+    from backend import summarizer
+
+    monkeypatch.setattr(summarizer, "_encoding", local_encoding())
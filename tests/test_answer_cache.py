@@ -0,0 +1,151 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from backend.answer_cache import AnswerCache, MemoryCacheBackend, MongoCacheBackend, normalize_query
+
+V1 = "text@hash:64#1"
+V2 = "text@hash:64#2"
+
+def vector(*values) -> np.ndarray:
+    return np.asarray(values, dtype="float32")
+
+TSH = vector(1.0, 0.0, 0.0)
+# Cosine ~0.995 with TSH, i.e. a rewording of the same question
+TSH_REWORDED = vector(1.0, 0.1, 0.0)
+FERRITIN = vector(0.0, 1.0, 0.0)
+
+def embedder(embedding):
+    calls = []
+
+    async def embed():
+        calls.append(1)
+        return embedding
+
+    embed.calls = calls
+    return embed
+
+def run(coro):
+    return asyncio.run(coro)
+
+# ------------------------------
+# Keys
+# ------------------------------
+
+def test_normalize_query():
+    assert normalize_query("  What is   TSH? ") == normalize_query("what is tsh") == "what is tsh"
+
+# ------------------------------
+# Exact and semantic lookups
+# ------------------------------
+
+def test_exact_hit_skips_the_embedding():
+    cache = AnswerCache(MemoryCacheBackend())
+    run(cache.store(V1, "What is TSH?", "Thyroid stimulating hormone", TSH))
+    embed = embedder(TSH)
+
+    answer, embedding = run(cache.lookup(V1, "what is tsh", embed))
+
+    assert answer == "Thyroid stimulating hormone"
+    assert embedding is None
+    assert embed.calls == []
+    assert cache.stats()["hits"] == 1
+
+def test_semantic_hit_on_a_reworded_query():
+    cache = AnswerCache(MemoryCacheBackend(), similarity_threshold=0.95)
+    run(cache.store(V1, "What is TSH?", "Thyroid stimulating hormone", TSH))
+
+    answer, embedding = run(cache.lookup(V1, "Explain the TSH test", embedder(TSH_REWORDED)))
+
+    assert answer == "Thyroid stimulating hormone"
+    assert embedding is TSH_REWORDED
+    assert cache.stats()["semantic_hits"] == 1
+
+def test_dissimilar_query_misses_and_returns_its_embedding():
+    cache = AnswerCache(MemoryCacheBackend(), similarity_threshold=0.95)
+    run(cache.store(V1, "What is TSH?", "Thyroid stimulating hormone", TSH))
+
+    answer, embedding = run(cache.lookup(V1, "Low ferritin?", embedder(FERRITIN)))
+
+    assert answer is None
+    assert embedding is FERRITIN
+    assert cache.stats()["misses"] == 1
+
+def test_namespaces_are_isolated():
+    # A new index version (or embedding model) must not serve answers retrieved from the old one
+    cache = AnswerCache(MemoryCacheBackend())
+    run(cache.store(V1, "What is TSH?", "Thyroid stimulating hormone", TSH))
+
+    exact, _ = run(cache.lookup(V2, "What is TSH?", embedder(TSH)))
+    semantic, _ = run(cache.lookup(V2, "Explain the TSH test", embedder(TSH_REWORDED)))
+
+    assert exact is None and semantic is None
+
+def test_expired_entries_miss():
+    cache = AnswerCache(MemoryCacheBackend(), ttl=-1)
+    run(cache.store(V1, "What is TSH?", "Thyroid stimulating hormone", TSH))
+
+    assert run(cache.lookup(V1, "What is TSH?", embedder(TSH)))[0] is None
+
+def test_disabled_cache_still_embeds():
+    cache = AnswerCache(None)
+    run(cache.store(V1, "What is TSH?", "Thyroid stimulating hormone", TSH))
+
+    answer, embedding = run(cache.lookup(V1, "What is TSH?", embedder(TSH)))
+
+    assert answer is None
+    assert embedding is TSH
+
+# ------------------------------
+# Backends
+# ------------------------------
+
+def test_memory_backend_evicts_least_recently_used():
+    cache = AnswerCache(MemoryCacheBackend(max_entries=2))
+    run(cache.store(V1, "a", "answer a"))
+    run(cache.store(V1, "b", "answer b"))
+    run(cache.lookup(V1, "a"))
+    run(cache.store(V1, "c", "answer c"))
+
+    assert run(cache.lookup(V1, "b"))[0] is None
+    assert run(cache.lookup(V1, "a"))[0] == "answer a"
+    assert run(cache.lookup(V1, "c"))[0] == "answer c"
+
+@pytest.fixture
+def mongo_backends():
+    """
+    Two workers' backends sharing one mock collection.
+    """
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    collection = mongomock_motor.AsyncMongoMockClient()["db"]["answer_cache"]
+    backends = [MongoCacheBackend(sync_interval=0), MongoCacheBackend(sync_interval=0)]
+    for backend in backends:
+        backend.collection = collection
+    return backends
+
+def test_mongo_semantic_hit_across_workers(mongo_backends):
+    writer, reader = (AnswerCache(backend) for backend in mongo_backends)
+
+    async def main():
+        await writer.store(V1, "What is TSH?", "Thyroid stimulating hormone", TSH)
+        return await reader.lookup(V1, "Explain the TSH test", embedder(TSH_REWORDED))
+
+    answer, _ = run(main())
+
+    assert answer == "Thyroid stimulating hormone"
+    assert reader.stats()["semantic_hits"] == 1
+
+def test_mongo_forgets_vectors_of_deleted_entries(mongo_backends):
+    backend = mongo_backends[0]
+    cache = AnswerCache(backend)
+
+    async def main():
+        await cache.store(V1, "What is TSH?", "Thyroid stimulating hormone", TSH)
+        await backend.collection.delete_many({})
+        return await cache.lookup(V1, "Explain the TSH test", embedder(TSH_REWORDED))
+
+    answer, _ = run(main())
+
+    assert answer is None
+    assert len(backend._vectors) == 0
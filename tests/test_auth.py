@@ -0,0 +1,127 @@
+import asyncio
+import time
+
+import pytest
+from passlib.context import CryptContext
+
+from backend import auth
+from backend.auth import AuthBusyError, TokenCache, create_access_token, decode_access_token
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+class CountingCollection:
+    """
+    Wraps a mock collection and counts the reads register_user makes.
+    """
+
+    def __init__(self, collection):
+        self._collection = collection
+        self.reads = 0
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    async def find_one(self, *args, **kwargs):
+        self.reads += 1
+        return await self._collection.find_one(*args, **kwargs)
+
+@pytest.fixture
+def users(monkeypatch):
+    collection = CountingCollection(mongomock_motor.AsyncMongoMockClient()["db"]["users"])
+    monkeypatch.setattr(auth, "async_users_collection", collection)
+    monkeypatch.setattr(auth, "unique_email_index", False)
+    # Cheapest bcrypt cost; the hashing itself is not under test
+    monkeypatch.setattr(auth, "pwd_context", CryptContext(schemes=["bcrypt"], bcrypt__rounds=4))
+    monkeypatch.setattr(auth, "_hash_slots", asyncio.Semaphore(auth.PASSWORD_HASH_WORKERS))
+    return collection
+
+# ------------------------------
+# Registration and login
+# ------------------------------
+
+def test_register_with_unique_index_skips_the_read(users):
+    async def main():
+        await auth.ensure_user_indexes(users)
+        return [await auth.register_user("a@example.com", "pw") for _ in range(2)]
+
+    (created, _), (duplicate, message) = asyncio.run(main())
+
+    assert created and not duplicate
+    assert message == "User already exists"
+    assert users.reads == 0
+    assert asyncio.run(users.count_documents({})) == 1
+
+def test_register_without_unique_index_reads_first(users):
+    async def main():
+        return [await auth.register_user("a@example.com", "pw") for _ in range(2)]
+
+    (created, _), (duplicate, _) = asyncio.run(main())
+
+    assert created and not duplicate
+    assert users.reads == 2
+    assert asyncio.run(users.count_documents({})) == 1
+
+def test_login(users):
+    async def main():
+        await auth.register_user("a@example.com", "right")
+        return (
+            await auth.login_user("a@example.com", "right"),
+            await auth.login_user("a@example.com", "wrong"),
+            await auth.login_user("nobody@example.com", "right"),
+        )
+
+    (ok, token), (bad_password, _), (unknown, _) = asyncio.run(main())
+
+    assert ok and not bad_password and not unknown
+    user = asyncio.run(users.find_one({"email": "a@example.com"}))
+    assert decode_access_token(token) == str(user["_id"])
+
+def test_busy_hash_pool_raises(users, monkeypatch):
+    monkeypatch.setattr(auth, "_hash_slots", asyncio.Semaphore(0))
+    monkeypatch.setattr(auth, "PASSWORD_HASH_QUEUE_TIMEOUT", 0.05)
+
+    with pytest.raises(AuthBusyError):
+        asyncio.run(auth.register_user("a@example.com", "pw"))
+
+# ------------------------------
+# Token cache
+# ------------------------------
+
+def test_token_cache_serves_until_expiry():
+    cache = TokenCache(max_entries=10)
+    cache.set("live", "u1", time.time() + 60)
+    cache.set("expired", "u2", time.time() - 1)
+
+    assert cache.get("live") == "u1"
+    assert cache.get("expired") is None
+    assert cache.get("unknown") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+def test_token_cache_evicts_least_recently_used():
+    cache = TokenCache(max_entries=2)
+    expires = time.time() + 60
+    cache.set("a", "ua", expires)
+    cache.set("b", "ub", expires)
+    cache.get("a")
+    cache.set("c", "uc", expires)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "ua"
+    assert cache.get("c") == "uc"
+
+def test_token_cache_disabled():
+    cache = TokenCache(max_entries=0)
+    cache.set("a", "ua", time.time() + 60)
+
+    assert cache.get("a") is None
+
+def test_decode_access_token_caches_verified_tokens(monkeypatch):
+    cache = TokenCache()
+    monkeypatch.setattr(auth, "token_cache", cache)
+    token = create_access_token("u1")
+
+    assert decode_access_token(token) == "u1"
+    assert decode_access_token(token) == "u1"
+    assert cache.stats()["hits"] == 1
+    assert decode_access_token(token + "x") is None
@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+import pytest
+
+from backend.batcher import MicroBatcher
+
+class Doubler:
+    """
+    Batch function that records the batches it was called with.
+    """
+
+    def __init__(self, fail: bool = False):
+        self.batches = []
+        self.fail = fail
+
+    def __call__(self, items: list) -> list:
+        self.batches.append(list(items))
+        if self.fail:
+            raise ValueError("model crashed")
+        return [item * 2 for item in items]
+
+def run(batcher: MicroBatcher, coro):
+    async def main():
+        try:
+            return await coro()
+        finally:
+            await batcher.stop()
+    return asyncio.run(main())
+
+# ------------------------------
+# Batching
+# ------------------------------
+
+def test_concurrent_requests_share_one_batch_in_order():
+    fn = Doubler()
+    batcher = MicroBatcher("test", fn, max_batch_size=8, max_wait_ms=50)
+
+    results = run(batcher, lambda: asyncio.gather(*(batcher.submit(i) for i in range(5))))
+
+    assert results == [0, 2, 4, 6, 8]
+    assert fn.batches == [[0, 1, 2, 3, 4]]
+    assert batcher.stats()["batch_size_histogram"] == {5: 1}
+
+def test_full_batches_dispatch_without_waiting():
+    fn = Doubler()
+    batcher = MicroBatcher("test", fn, max_batch_size=3, max_wait_ms=10_000)
+
+    async def main():
+        start = time.perf_counter()
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(6)))
+        return results, time.perf_counter() - start
+
+    results, elapsed = run(batcher, main)
+
+    assert results == [0, 2, 4, 6, 8, 10]
+    assert [len(batch) for batch in fn.batches] == [3, 3]
+    assert elapsed < 1
+
+def test_lone_request_waits_at_most_max_wait():
+    fn = Doubler()
+    batcher = MicroBatcher("test", fn, max_batch_size=8, max_wait_ms=20)
+
+    async def main():
+        start = time.perf_counter()
+        result = await batcher.submit(21)
+        return result, time.perf_counter() - start
+
+    result, elapsed = run(batcher, main)
+
+    assert result == 42
+    assert elapsed < 1
+    assert fn.batches == [[21]]
+
+# ------------------------------
+# Failures and cancellation
+# ------------------------------
+
+def test_batch_failure_reaches_every_caller():
+    batcher = MicroBatcher("test", Doubler(fail=True), max_batch_size=8, max_wait_ms=20)
+
+    results = run(batcher, lambda: asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True))
+
+    assert all(isinstance(result, ValueError) for result in results)
+
+def test_worker_survives_a_failed_batch():
+    fn = Doubler(fail=True)
+    batcher = MicroBatcher("test", fn, max_batch_size=8, max_wait_ms=5)
+
+    async def main():
+        with pytest.raises(ValueError):
+            await batcher.submit(1)
+        fn.fail = False
+        return await batcher.submit(2)
+
+    assert run(batcher, main) == 4
+
+def test_cancelled_requests_are_dropped_from_the_batch():
+    fn = Doubler()
+    batcher = MicroBatcher("test", fn, max_batch_size=8, max_wait_ms=50)
+
+    async def main():
+        abandoned = asyncio.ensure_future(batcher.submit(1))
+        kept = asyncio.ensure_future(batcher.submit(2))
+        await asyncio.sleep(0)
+        abandoned.cancel()
+        return await kept
+
+    assert run(batcher, main) == 4
+    assert fn.batches == [[2]]
@@ -0,0 +1,177 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend import conversation
+from backend.conversation import ConversationSession, ConversationStore
+
+class Result:
+    def __init__(self, text: str):
+        self.text = text
+
+class FakeLLM:
+    """
+    Stands in for the gateway: records fold prompts and answers with a fixed summary.
+    """
+
+    def __init__(self):
+        self.prompts = []
+        self.fail = False
+
+    async def complete(self, prompt: str, **kwargs) -> Result:
+        self.prompts.append(prompt)
+        if self.fail:
+            raise RuntimeError("upstream 503")
+        return Result(f"summary {len(self.prompts)}")
+
+@pytest.fixture
+def llm(monkeypatch):
+    fake = FakeLLM()
+    monkeypatch.setattr(conversation, "llm", fake)
+    return fake
+
+class Logs:
+    """
+    Per-user question logs, newest first like fetch_history returns them.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.loads = []
+
+    async def fetch_history(self, user_id: str, limit: int = 10, cursor: str = None, query_type: str = None):
+        self.loads.append(user_id)
+        return self.entries.get(user_id, [])[:limit], None
+
+@pytest.fixture
+def logs(monkeypatch):
+    fake = Logs()
+    monkeypatch.setattr(conversation, "fetch_history", fake.fetch_history)
+    return fake
+
+def log_entry(question: str, answer: str, query_type: str = "text", age_seconds: float = 60) -> dict:
+    return {
+        "input_summary": question,
+        "response": answer,
+        "query_type": query_type,
+        "timestamp": datetime.utcnow() - timedelta(seconds=age_seconds),
+    }
+
+def run(coro):
+    return asyncio.run(coro)
+
+# ------------------------------
+# Window and folding
+# ------------------------------
+
+def test_turns_beyond_the_window_are_folded_into_memory(llm, logs):
+    store = ConversationStore(window=2)
+
+    async def main():
+        for i in range(3):
+            await store.record("u1", f"question {i}", f"answer {i}")
+        return await store.get("u1")
+
+    session = run(main())
+
+    assert [question for question, _ in session.turns] == ["question 1", "question 2"]
+    assert session.memory == "summary 1"
+    assert session.pending is None
+    assert len(llm.prompts) == 1
+    assert "Q: question 0\nA: answer 0" in llm.prompts[0]
+    assert "question 1" not in llm.prompts[0]
+    assert store.stats()["folds"] == 1
+
+def test_folds_build_on_the_previous_summary(llm, logs):
+    store = ConversationStore(window=1)
+
+    async def main():
+        for i in range(3):
+            await store.record("u1", f"question {i}", f"answer {i}")
+        return await store.get("u1")
+
+    session = run(main())
+
+    assert session.memory == "summary 2"
+    assert "Summary so far:\nsummary 1" in llm.prompts[1]
+    assert session.render().startswith("Summary of earlier turns: summary 2")
+
+def test_failed_fold_keeps_the_turns_in_memory(llm, logs):
+    llm.fail = True
+    store = ConversationStore(window=1)
+
+    async def main():
+        await store.record("u1", "question 0", "answer 0")
+        await store.record("u1", "question 1", "answer 1")
+        return await store.get("u1")
+
+    session = run(main())
+
+    assert "question 0" in session.memory
+    assert store.stats()["fold_failures"] == 1
+
+def test_retrieval_query_carries_the_previous_question():
+    session = ConversationSession("u1", [("What is the TSH?", "2.1 mIU/L")])
+
+    assert session.retrieval_query("and the T4?") == "What is the TSH? and the T4?"
+    assert ConversationSession("u1").retrieval_query("and the T4?") == "and the T4?"
+
+# ------------------------------
+# Sessions
+# ------------------------------
+
+def test_missing_session_is_rebuilt_from_recent_logs(logs):
+    logs.entries["u1"] = [
+        log_entry("question 2", "answer 2"),
+        log_entry("scan.pdf", "pdf summary", query_type="pdf"),
+        log_entry("question 1", "answer 1"),
+        log_entry("stale question", "stale answer", age_seconds=conversation.CONVERSATION_IDLE_SECONDS + 60),
+    ]
+
+    session = run(ConversationStore(window=4).get("u1"))
+
+    assert list(session.turns) == [("question 1", "answer 1"), ("question 2", "answer 2")]
+
+def test_least_recently_used_session_is_evicted(logs):
+    store = ConversationStore(max_sessions=2)
+
+    async def main():
+        await store.get("a")
+        await store.get("b")
+        await store.get("a")
+        await store.get("c")
+        await store.get("b")
+
+    run(main())
+
+    stats = store.stats()
+    assert logs.loads == ["a", "b", "c", "b"]
+    assert stats["hits"] == 1
+    assert stats["evictions"] == 2
+    assert stats["sessions"] == 2
+
+def test_idle_session_expires(logs):
+    store = ConversationStore()
+
+    async def main():
+        session = await store.get("u1")
+        session.last_active = time.monotonic() - conversation.CONVERSATION_IDLE_SECONDS - 1
+        return await store.get("u1")
+
+    run(main())
+
+    assert store.stats()["expired"] == 1
+    assert logs.loads == ["u1", "u1"]
+
+def test_reset_starts_an_empty_conversation(llm, logs):
+    logs.entries["u1"] = [log_entry("question 1", "answer 1")]
+    store = ConversationStore()
+
+    async def main():
+        await store.get("u1")
+        store.reset("u1")
+        return await store.get("u1")
+
+    assert run(main()).is_empty()
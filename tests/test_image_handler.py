@@ -0,0 +1,104 @@
+import asyncio
+import io
+
+import pytest
+from PIL import Image, ImageDraw
+
+from backend import image_handler
+from backend.ocr import OCR_TEXT_THRESHOLD, ocr_image_bytes
+
+REPORT_TEXT = "HbA1c 7.2% TSH 2.1 mIU/L Ferritin 12 ng/mL"
+
+class Upload:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def read(self) -> bytes:
+        return self.data
+
+def png(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+def document() -> bytes:
+    image = Image.new("RGB", (400, 300), "white")
+    ImageDraw.Draw(image).text((20, 20), REPORT_TEXT, fill="black")
+    return png(image)
+
+def photo() -> bytes:
+    return png(Image.new("RGB", (400, 300), (200, 40, 40)))
+
+class FakeOCR:
+    def __init__(self):
+        self.text = REPORT_TEXT
+        self.calls = 0
+
+    async def __call__(self, image_bytes: bytes) -> str:
+        self.calls += 1
+        return self.text
+
+@pytest.fixture
+def ocr(monkeypatch):
+    """
+    Stubs OCR and BLIP; the returned FakeOCR sets the OCR text and counts calls.
+    """
+    async def fake_caption(image):
+        return "a close-up photo of a skin lesion"
+
+    fake = FakeOCR()
+    monkeypatch.setattr(image_handler, "_run_ocr", fake)
+    monkeypatch.setattr(image_handler.blip_batcher, "submit", fake_caption)
+    return fake
+
+def prepare(data: bytes):
+    return asyncio.run(image_handler.prepare_medical_image(Upload(data)))
+
+# ------------------------------
+# Routing
+# ------------------------------
+
+def test_photo_skips_ocr(ocr):
+    method, summary_input, _, timings = prepare(photo())
+
+    assert method == "BLIP"
+    assert ocr.calls == 0
+    assert summary_input.startswith("a close-up photo")
+    assert timings["method"] == "BLIP"
+    assert timings["text_score"] < OCR_TEXT_THRESHOLD
+    assert not timings["ocr_fallback"]
+    assert "ocr_ms" not in timings and "blip_ms" in timings
+
+def test_document_uses_ocr(ocr):
+    method, summary_input, gpt_input, timings = prepare(document())
+
+    assert method == "OCR"
+    assert ocr.calls == 1
+    assert summary_input == REPORT_TEXT
+    assert REPORT_TEXT in gpt_input
+    assert timings["text_score"] >= OCR_TEXT_THRESHOLD
+    assert "ocr_ms" in timings and "blip_ms" not in timings
+
+def test_document_without_readable_text_falls_back_to_blip(ocr):
+    ocr.text = "~ ~"
+
+    method, _, _, timings = prepare(document())
+
+    assert method == "BLIP"
+    assert timings["ocr_fallback"]
+
+# ------------------------------
+# OCR timeout
+# ------------------------------
+
+def test_ocr_timeout_falls_back_to_an_empty_result(monkeypatch):
+    async def timed_out(fn, *args):
+        raise RuntimeError("Tesseract process timeout")
+
+    monkeypatch.setattr(image_handler, "run_in_process", timed_out)
+
+    assert asyncio.run(image_handler._run_ocr(document())) == ""
+
+def test_ocr_budget_spent_before_tesseract_raises():
+    with pytest.raises(RuntimeError):
+        ocr_image_bytes(document(), timeout=1e-9)
@@ -0,0 +1,41 @@
+import faiss
+import numpy as np
+import pytest
+
+from backend.index_manager import ImageIndexManager, IndexNotBuiltError
+
+def image_index(tmp_path) -> ImageIndexManager:
+    return ImageIndexManager(str(tmp_path / "faiss_image_index"), str(tmp_path / "faiss_image_paths.npy"))
+
+def publish(tmp_path, n: int = 4, dim: int = 8):
+    index = faiss.IndexFlatL2(dim)
+    index.add(np.random.default_rng(0).random((n, dim), dtype="float32"))
+    faiss.write_index(index, str(tmp_path / "faiss_image_index"))
+    np.save(tmp_path / "faiss_image_paths.npy", np.array([f"img{i}.png" for i in range(n)]))
+
+# ------------------------------
+# ImageIndexManager
+# ------------------------------
+
+def test_missing_index_is_reported_as_not_built(tmp_path):
+    manager = image_index(tmp_path)
+
+    assert not manager.available()
+    with pytest.raises(IndexNotBuiltError):
+        manager.get()
+
+def test_index_without_its_path_column_is_not_built(tmp_path):
+    publish(tmp_path)
+    (tmp_path / "faiss_image_paths.npy").unlink()
+
+    assert not image_index(tmp_path).available()
+
+def test_published_index_loads(tmp_path):
+    publish(tmp_path)
+    manager = image_index(tmp_path)
+
+    index, paths = manager.get()
+
+    assert manager.available()
+    assert index.ntotal == 4
+    assert list(paths) == [f"img{i}.png" for i in range(4)]
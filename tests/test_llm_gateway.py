@@ -0,0 +1,188 @@
+import asyncio
+import socket
+import threading
+import time
+
+import pytest
+import uvicorn
+from openai import APITimeoutError, InternalServerError
+
+from backend import llm_gateway
+from backend.benchmarks import openai_stub
+from backend.llm_gateway import LLM_FALLBACK_MAX_PROMPT_TOKENS, LLMGateway, TokenBucket, track_usage
+
+LONG_PROMPT = "Explain in detail: " + "thyroid function panel results " * 100
+
+@pytest.fixture(scope="module")
+def base_url():
+    """
+    The OpenAI stub on a free local port, for the whole module.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(openai_stub.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.time() + 10
+    while not server.started:
+        assert time.time() < deadline, "stub server did not start"
+        time.sleep(0.05)
+    yield f"http://127.0.0.1:{port}/v1"
+    server.should_exit = True
+
+@pytest.fixture(autouse=True)
+def stub(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "stub")
+    monkeypatch.setattr(llm_gateway, "LLM_MAX_RETRIES", 0)
+    monkeypatch.setattr(openai_stub, "STUB_LATENCY_MS", 0)
+    monkeypatch.setattr(openai_stub, "STUB_TOKEN_MS", 0)
+    openai_stub.stub_reset()
+    return openai_stub.counters
+
+def run(gateway: LLMGateway, coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await gateway.aclose()
+    return asyncio.run(main())
+
+# ------------------------------
+# Completions and streaming
+# ------------------------------
+
+def test_complete_returns_text_and_tracks_usage(base_url):
+    gateway = LLMGateway(base_url=base_url, model="gpt-4")
+
+    async def main():
+        usage = track_usage()
+        result = await gateway.complete("What does an HbA1c of 7.2% mean?", route="text_rag")
+        return result, usage
+
+    result, usage = run(gateway, main())
+
+    assert result.text.startswith("Stub answer from gpt-4")
+    assert result.completion_tokens > 0
+    assert usage["llm_calls"] == 1
+    assert usage["completion_tokens"] == result.completion_tokens
+    assert gateway.stats()["requests"] == 1
+
+def test_stream_yields_tokens_and_a_result(base_url):
+    gateway = LLMGateway(base_url=base_url, model="gpt-4")
+    stream = gateway.stream("Summarize this lipid panel", route="pdf")
+
+    async def main():
+        return [token async for token in stream]
+
+    tokens = run(gateway, main())
+
+    assert len(tokens) > 1
+    assert stream.result.text == "".join(tokens).strip()
+    assert stream.result.completion_tokens == len(tokens)
+
+def test_identical_inflight_prompts_share_one_request(base_url, stub):
+    gateway = LLMGateway(base_url=base_url, model="gpt-4")
+
+    async def main():
+        return await asyncio.gather(*(gateway.complete("Identical prompt") for _ in range(10)))
+
+    results = run(gateway, main())
+
+    assert stub["chat"] == 1
+    assert len({result.text for result in results}) == 1
+    assert gateway.stats()["coalesced"] == 9
+
+# ------------------------------
+# Model choice
+# ------------------------------
+
+def test_short_prompts_use_the_fallback_model():
+    gateway = LLMGateway(model="gpt-4", fallback_model="gpt-4o-mini")
+
+    assert gateway.choose_model(LLM_FALLBACK_MAX_PROMPT_TOKENS) == "gpt-4o-mini"
+    assert gateway.choose_model(LLM_FALLBACK_MAX_PROMPT_TOKENS + 1) == "gpt-4"
+
+def test_explicit_model_is_never_swapped():
+    gateway = LLMGateway(model="gpt-4", fallback_model="gpt-4o-mini")
+
+    assert gateway.choose_model(10, model="gpt-4-turbo") == "gpt-4-turbo"
+    assert LLMGateway(model="gpt-4").choose_model(10) == "gpt-4"
+
+def test_short_prompt_routing_end_to_end(base_url):
+    gateway = LLMGateway(base_url=base_url, model="gpt-4", fallback_model="gpt-4o-mini")
+
+    async def main():
+        return await gateway.complete("Normal TSH range?"), await gateway.complete(LONG_PROMPT)
+
+    short, long = run(gateway, main())
+
+    assert short.model == "gpt-4o-mini"
+    assert long.model == "gpt-4"
+
+# ------------------------------
+# Retries and fallback
+# ------------------------------
+
+def test_transient_errors_are_retried(base_url, stub, monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_MAX_RETRIES", 1)
+    gateway = LLMGateway(base_url=base_url, model="gpt-4")
+
+    result = run(gateway, gateway.complete("[[flaky:1]] " + LONG_PROMPT))
+
+    assert result.model == "gpt-4"
+    assert stub["chat"] == 2
+    assert gateway.stats()["errors"] == 0
+
+def test_failing_model_falls_back_on_error(base_url):
+    gateway = LLMGateway(base_url=base_url, model="gpt-4", fallback_model="gpt-4o-mini")
+
+    result = run(gateway, gateway.complete("[[fail:gpt-4]] " + LONG_PROMPT))
+
+    assert result.model == "gpt-4o-mini"
+    assert gateway.stats()["fallbacks"] == 1
+
+def test_fallback_on_error_can_be_disabled(base_url, monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_FALLBACK_ON_ERROR", False)
+    gateway = LLMGateway(base_url=base_url, model="gpt-4", fallback_model="gpt-4o-mini")
+
+    with pytest.raises(InternalServerError):
+        run(gateway, gateway.complete("[[fail:gpt-4]] " + LONG_PROMPT))
+    assert gateway.stats()["errors"] == 1
+
+def test_error_without_fallback_model_is_raised(base_url):
+    gateway = LLMGateway(base_url=base_url, model="gpt-4")
+
+    with pytest.raises(InternalServerError):
+        run(gateway, gateway.complete("[[fail:gpt-4]] renal panel"))
+    assert gateway.stats()["errors"] == 1
+
+def test_route_timeout(base_url, monkeypatch):
+    monkeypatch.setenv("LLM_TIMEOUT_CHECK_TIMEOUT", "0.3")
+    gateway = LLMGateway(base_url=base_url, model="gpt-4")
+
+    with pytest.raises(APITimeoutError):
+        run(gateway, gateway.complete("[[sleep:2]] slow answer", route="check_timeout"))
+
+# ------------------------------
+# Rate limiting
+# ------------------------------
+
+def test_token_bucket_paces_beyond_its_burst():
+    bucket = TokenBucket(rate=20, capacity=1)
+
+    async def main():
+        start = time.perf_counter()
+        for _ in range(6):
+            await bucket.acquire()
+        return time.perf_counter() - start
+
+    # One from the full bucket, then five at 20 per second
+    assert asyncio.run(main()) >= 0.24
+    assert bucket.waited_seconds > 0
+
+def test_disabled_token_bucket_never_waits():
+    bucket = TokenBucket(rate=0, capacity=0)
+
+    asyncio.run(bucket.acquire(1000))
+
+    assert bucket.waited_seconds == 0
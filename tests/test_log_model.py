@@ -0,0 +1,124 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from backend.models.log_model import (
+    HISTORY_MAX_LIMIT, decode_cursor, encode_cursor, fetch_history, history_filter,
+)
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+START = datetime(2024, 1, 1, 9, 0, 0)
+
+def make_logs(user_id: str, n: int, query_type: str = "text", same_time: bool = False) -> list:
+    # Entry i is i minutes after START (or all at START), so higher i is newer
+    return [{
+        "user_id": user_id,
+        "query_type": query_type,
+        "input_summary": f"question {i}",
+        "response": f"answer {i}",
+        "model_used": "gpt-4o-mini",
+        "timestamp": START if same_time else START + timedelta(minutes=i),
+    } for i in range(n)]
+
+def run(coro):
+    return asyncio.run(coro)
+
+async def seeded(*groups):
+    collection = mongomock_motor.AsyncMongoMockClient()["db"]["logs"]
+    for documents in groups:
+        await collection.insert_many(documents)
+    return collection
+
+async def all_pages(user_id: str, collection, limit: int, query_type: str = None) -> list:
+    pages, cursor = [], None
+    while True:
+        entries, cursor = await fetch_history(user_id, limit, cursor, query_type, collection=collection)
+        pages.append(entries)
+        if cursor is None:
+            return pages
+
+# ------------------------------
+# Cursors
+# ------------------------------
+
+def test_cursor_round_trip():
+    entry = {"timestamp": START, "_id": ObjectId()}
+
+    assert decode_cursor(encode_cursor(entry)) == (START, entry["_id"])
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "", encode_cursor({"timestamp": START, "_id": "nope"})])
+def test_invalid_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+def test_history_filter():
+    assert history_filter("u1") == {"user_id": "u1"}
+    assert history_filter("u1", query_type="pdf") == {"user_id": "u1", "query_type": "pdf"}
+    assert "$or" in history_filter("u1", cursor=encode_cursor({"timestamp": START, "_id": "0" * 24}))
+
+# ------------------------------
+# fetch_history
+# ------------------------------
+
+def test_first_page_is_newest_first_with_a_cursor():
+    collection = run(seeded(make_logs("u1", 5)))
+
+    entries, cursor = run(fetch_history("u1", 3, collection=collection))
+
+    assert [entry["input_summary"] for entry in entries] == ["question 4", "question 3", "question 2"]
+    assert cursor is not None
+
+def test_pages_cover_every_entry_exactly_once():
+    collection = run(seeded(make_logs("u1", 7)))
+
+    pages = run(all_pages("u1", collection, limit=3))
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [entry["input_summary"] for page in pages for entry in page] == [f"question {i}" for i in range(6, -1, -1)]
+
+def test_equal_timestamps_are_split_by_id():
+    collection = run(seeded(make_logs("u1", 5, same_time=True)))
+
+    pages = run(all_pages("u1", collection, limit=2))
+    ids = [entry["_id"] for page in pages for entry in page]
+
+    assert len(ids) == 5
+    assert ids == sorted(set(ids), reverse=True)
+
+def test_exact_last_page_has_no_cursor():
+    collection = run(seeded(make_logs("u1", 4)))
+
+    entries, cursor = run(fetch_history("u1", 4, collection=collection))
+
+    assert len(entries) == 4
+    assert cursor is None
+
+def test_only_the_users_own_logs_of_the_requested_type():
+    collection = run(seeded(make_logs("u1", 3), make_logs("u1", 2, "pdf"), make_logs("u2", 4)))
+
+    text, _ = run(fetch_history("u1", 10, collection=collection))
+    pdf, _ = run(fetch_history("u1", 10, query_type="pdf", collection=collection))
+
+    assert len(text) == 5
+    assert len(pdf) == 2
+    assert {entry["query_type"] for entry in pdf} == {"pdf"}
+
+def test_entries_are_projected():
+    collection = run(seeded(make_logs("u1", 1)))
+
+    entries, _ = run(fetch_history("u1", collection=collection))
+
+    assert set(entries[0]) == {"_id", "timestamp", "query_type", "input_summary", "response"}
+
+def test_limit_is_clamped():
+    collection = run(seeded(make_logs("u1", HISTORY_MAX_LIMIT + 5)))
+
+    smallest, _ = run(fetch_history("u1", 0, collection=collection))
+    largest, cursor = run(fetch_history("u1", HISTORY_MAX_LIMIT * 10, collection=collection))
+
+    assert len(smallest) == 1
+    assert len(largest) == HISTORY_MAX_LIMIT
+    assert cursor is not None
@@ -0,0 +1,148 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend import metrics as metrics_module
+from backend.metrics import (
+    LatencyHistogram, MetricsRegistry, RequestContextMiddleware, current_request_id, metrics,
+)
+from backend.models.log_model import LogWriter
+
+# ------------------------------
+# Histograms
+# ------------------------------
+
+def test_histogram_buckets_and_percentiles():
+    histogram = LatencyHistogram(buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(seconds)
+
+    assert histogram.bucket_counts == [1, 2]
+    assert histogram.count == 4
+    assert histogram.percentiles() == {"p50": 0.5, "p95": 5.0, "p99": 5.0}
+
+def test_empty_histogram_percentiles():
+    assert LatencyHistogram().percentiles() == {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+
+def test_stats_report_milliseconds():
+    registry = MetricsRegistry()
+    registry.observe("pdf.parse", 0.2)
+    registry.observe("pdf.parse", 0.4)
+
+    assert registry.stats()["pdf.parse"]["count"] == 2
+    assert registry.stats()["pdf.parse"]["mean_ms"] == pytest.approx(300.0)
+
+# ------------------------------
+# Prometheus exposition
+# ------------------------------
+
+def test_render_prometheus_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    registry.observe("llm.text_rag", 0.003)
+    registry.observe("llm.text_rag", 0.2)
+
+    text = registry.render_prometheus()
+
+    assert 'app_stage_seconds_bucket{stage="llm.text_rag",le="0.005"} 1' in text
+    assert 'app_stage_seconds_bucket{stage="llm.text_rag",le="0.25"} 2' in text
+    assert 'app_stage_seconds_bucket{stage="llm.text_rag",le="+Inf"} 2' in text
+    assert 'app_stage_seconds_count{stage="llm.text_rag"} 2' in text
+
+def test_render_prometheus_escapes_labels():
+    registry = MetricsRegistry()
+    registry.observe('http.GET /a"b\\c\nd', 0.1)
+
+    text = registry.render_prometheus()
+
+    assert 'stage="http.GET /a\\"b\\\\c\\nd"' in text
+    # A raw newline would end the sample line early
+    assert "\nd" not in text
+
+def test_render_prometheus_flattens_numeric_extra_stats():
+    text = MetricsRegistry().render_prometheus({
+        "text-index": {"loaded": True, "vectors": 12, "index_type": "flat", "cache": {"hit.rate": 0.5}},
+    })
+
+    assert "app_text_index_loaded 1" in text
+    assert "app_text_index_vectors 12" in text
+    assert "app_text_index_cache_hit_rate 0.5" in text
+    assert "index_type" not in text
+
+# ------------------------------
+# Request context
+# ------------------------------
+
+@pytest.fixture
+def client(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(metrics_module, "metrics", registry)
+    monkeypatch.setattr(metrics_module, "SLOW_REQUEST_MS", 0)
+
+    app = FastAPI()
+    app.add_middleware(RequestContextMiddleware)
+
+    @app.get("/echo")
+    def echo():
+        with registry.span("echo.work"):
+            return {"request_id": current_request_id()}
+
+    client = TestClient(app)
+    client.registry = registry
+    return client
+
+def test_request_id_is_generated_and_echoed(client):
+    response = client.get("/echo")
+
+    assert response.headers["x-request-id"] == response.json()["request_id"]
+    assert len(response.json()["request_id"]) == 32
+
+def test_incoming_request_id_is_reused_and_capped(client):
+    response = client.get("/echo", headers={"X-Request-ID": "r" * 100})
+
+    assert response.json()["request_id"] == "r" * 64
+    assert response.headers["x-request-id"] == "r" * 64
+
+def test_requests_are_timed_per_route(client):
+    client.get("/echo")
+    client.get("/missing")
+
+    stages = client.registry.stats()
+    assert stages["http.GET /echo"]["count"] == 1
+    assert stages["echo.work"]["count"] == 1
+    assert stages["http.unmatched"]["count"] == 1
+    assert not any("/missing" in stage for stage in stages)
+
+def test_background_worker_does_not_record_into_request_spans():
+    class Collection:
+        async def insert_many(self, documents, ordered=True):
+            pass
+
+    async def main():
+        spans = metrics_module._RequestSpans()
+        metrics_module._request_spans.set(spans)
+        # The worker is started from inside "the request"
+        writer = LogWriter(Collection(), flush_interval=0.01)
+        await writer.put({"query": "TSH"})
+        await writer.stop()
+        return spans, writer
+
+    spans, writer = asyncio.run(main())
+
+    assert writer.written == 1
+    assert metrics.stats()["mongo.log_flush"]["count"] >= 1
+    assert spans == []
+
+def test_finished_request_spans_stop_collecting():
+    spans = metrics_module._RequestSpans()
+    token = metrics_module._request_spans.set(spans)
+    try:
+        registry = MetricsRegistry()
+        registry.observe("during", 0.1)
+        spans.active = False
+        registry.observe("after", 0.1)
+    finally:
+        metrics_module._request_spans.reset(token)
+
+    assert spans == [("during", 0.1)]
@@ -0,0 +1,132 @@
+from backend.prompt_builder import (
+    TEXT_RAG_TEMPLATE, build_rag_prompt, dedupe_passages, pack_passages, truncate_tokens,
+)
+from backend.summarizer import count_tokens
+
+# Each is a single token in the test encoding (conftest.local_encoding)
+WORDS = ["one", "two", "three", "four", "five", "six", "seven", "eight"]
+
+def words(n: int, word: str) -> str:
+    # Exactly n tokens
+    return word + f" {word}" * (n - 1)
+
+# ------------------------------
+# dedupe_passages
+# ------------------------------
+
+def test_dedupe_drops_exact_duplicates_ignoring_case_and_spacing():
+    passages, dropped = dedupe_passages(["TSH is 2.1 mIU/L", "tsh  is 2.1\nmIU/L", "Ferritin 12"])
+
+    assert passages == [(0, "TSH is 2.1 mIU/L"), (2, "Ferritin 12")]
+    assert dropped == 1
+
+def test_dedupe_drops_passages_contained_in_recent_ones():
+    passages, dropped = dedupe_passages(["HbA1c 7.2% on 3 March, above target", "HbA1c 7.2%"])
+
+    assert [index for index, _ in passages] == [0]
+    assert dropped == 1
+
+def test_dedupe_strips_splitter_overlap():
+    shared = "the overlap shared by both chunks"
+    first = f"Patient reports fatigue and {shared}"
+    second = f"{shared} then the rest of the second chunk"
+
+    passages, dropped = dedupe_passages([first, second])
+
+    assert passages == [(0, first), (1, "then the rest of the second chunk")]
+    assert dropped == 0
+
+def test_dedupe_ignores_short_coincidental_overlap():
+    passages, _ = dedupe_passages(["Result: normal", "normal range given"])
+
+    assert passages[1] == (1, "normal range given")
+
+def test_dedupe_window_limits_containment_checks():
+    texts = ["alpha beta gamma delta", "x", "y", "alpha beta"]
+
+    assert len(dedupe_passages(texts, window=8)[0]) == 3
+    assert len(dedupe_passages(texts, window=1)[0]) == 4
+
+def test_dedupe_drops_empty_passages():
+    passages, dropped = dedupe_passages(["", "   ", "TSH 2.1"])
+
+    assert passages == [(2, "TSH 2.1")]
+    assert dropped == 2
+
+# ------------------------------
+# pack_passages
+# ------------------------------
+
+def test_pack_keeps_everything_that_fits_in_rank_order():
+    texts = [words(10, word) for word in WORDS[:3]]
+
+    context, stats = pack_passages(texts, budget=100)
+
+    assert context == "\n\n".join(texts)
+    assert stats["passages_used"] == 3
+    assert stats["context_tokens"] == 30
+
+def test_pack_stays_within_budget_and_prefers_value_per_token():
+    # Rank 2 is long; ranks 3 and 4 fit instead of it
+    texts = [words(40, "one"), words(50, "two"), words(15, "three"), words(15, "four")]
+
+    context, stats = pack_passages(texts, budget=80, passage_max_tokens=0)
+
+    assert stats["context_tokens"] <= 80
+    assert context.split("\n\n") == [texts[0], texts[2], texts[3]]
+
+def test_pack_always_includes_the_best_passage_cut_to_fit():
+    context, stats = pack_passages([words(300, "one"), words(10, "two")], budget=50, passage_max_tokens=0)
+
+    assert context.startswith("one one")
+    assert stats["passages_used"] == 1
+    assert stats["context_tokens"] <= 50
+
+def test_pack_caps_each_passage():
+    context, _ = pack_passages([words(100, "one")], budget=1000, passage_max_tokens=20)
+
+    assert context == truncate_tokens(words(100, "one"), 20)
+    assert context.endswith(" …")
+
+def test_truncate_tokens_stays_within_the_cap():
+    text = "HbA1c 7.2% on 3 March; TSH 2.1 mIU/L, ferritin 12 ng/mL — review in 3 months. " * 5
+
+    for max_tokens in (1, 5, 17, 40):
+        assert count_tokens(truncate_tokens(text, max_tokens)) <= max_tokens
+    assert truncate_tokens("TSH 2.1", 10) == "TSH 2.1"
+
+def test_pack_uses_explicit_scores():
+    texts = [words(10, "one"), words(30, "two"), words(30, "three")]
+
+    # Room for the best passage and one more; the scores pick rank 3 over rank 2
+    context, _ = pack_passages(texts, budget=45, scores=[1.0, 0.1, 0.9], passage_max_tokens=0)
+
+    assert context.split("\n\n") == [texts[0], texts[2]]
+
+def test_pack_counts_duplicates():
+    _, stats = pack_passages(["TSH 2.1", "TSH 2.1", "Ferritin 12"], budget=100)
+
+    assert stats["passages_in"] == 3
+    assert stats["duplicates_dropped"] == 1
+    assert stats["passages_used"] == 2
+
+def test_pack_empty():
+    context, stats = pack_passages([], budget=100)
+
+    assert context == ""
+    assert stats["context_tokens"] == 0
+
+# ------------------------------
+# build_rag_prompt
+# ------------------------------
+
+def test_build_rag_prompt_fills_template_and_extra_fields():
+    prompt, stats = build_rag_prompt("What is TSH?", ["TSH 2.1"], "{history}|{context}|{query}", history="earlier")
+
+    assert prompt == "earlier|TSH 2.1|What is TSH?"
+    assert stats["prompt_tokens"] == count_tokens(prompt)
+
+def test_build_rag_prompt_default_template():
+    prompt, _ = build_rag_prompt("What is TSH?", ["TSH 2.1"])
+
+    assert prompt == TEXT_RAG_TEMPLATE.format(context="TSH 2.1", query="What is TSH?")
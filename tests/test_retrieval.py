@@ -0,0 +1,138 @@
+import pytest
+
+from backend import retrieval
+from backend.lexical_index import BM25Index, is_code_query, reciprocal_rank_fusion, tokenize
+
+DOCS = [
+    ("d0", "Type 2 diabetes without complications is coded E11.9."),
+    ("d1", "HbA1c above 7% suggests poor glycaemic control in diabetes."),
+    ("d2", "TSH is the first-line test for hypothyroidism; TSH above 4.5 is raised."),
+    ("d3", "Ferritin below 30 ng/mL indicates iron deficiency anaemia."),
+    ("d4", "LDL cholesterol target after myocardial infarction is below 1.4 mmol/L."),
+]
+
+# ------------------------------
+# Tokenization
+# ------------------------------
+
+def test_tokenize_keeps_codes_and_their_parts():
+    assert tokenize("What is E11.9?") == ["e11.9", "e11", "9"]
+    assert tokenize("HbA1c and 5-FU") == ["hba1c", "5-fu", "5", "fu"]
+
+def test_is_code_query():
+    assert is_code_query("E11.9")
+    assert is_code_query("HbA1c range")
+    assert is_code_query("LDL")
+    assert not is_code_query("what does a raised thyroid stimulating hormone mean")
+    assert not is_code_query("normal range")
+
+# ------------------------------
+# BM25
+# ------------------------------
+
+def test_bm25_ranks_matching_docs_best_first():
+    index = BM25Index.build(DOCS)
+
+    hits = index.search("TSH hypothyroidism", k=3)
+
+    assert [doc_id for doc_id, _ in hits] == ["d2"]
+    assert hits[0][1] > 0
+
+def test_bm25_rare_terms_outweigh_common_ones():
+    index = BM25Index.build(DOCS)
+
+    # "diabetes" is in two docs, "e11.9" in one
+    hits = index.search("diabetes E11.9", k=5)
+
+    assert [doc_id for doc_id, _ in hits] == ["d0", "d1"]
+
+def test_bm25_parent_code_matches_compound_code():
+    index = BM25Index.build(DOCS)
+
+    assert [doc_id for doc_id, _ in index.search("E11", k=5)] == ["d0"]
+
+def test_bm25_no_match_and_empty_index():
+    assert BM25Index.build(DOCS).search("appendicitis") == []
+    assert BM25Index.build([]).search("TSH") == []
+
+def test_bm25_respects_k():
+    index = BM25Index.build(DOCS)
+
+    assert len(index.search("below above", k=2)) == 2
+
+def test_bm25_save_and_load_round_trip(tmp_path):
+    index = BM25Index.build(DOCS)
+    index.save(str(tmp_path))
+
+    loaded = BM25Index.load(str(tmp_path))
+
+    assert loaded.doc_ids == index.doc_ids
+    assert loaded.search("ferritin") == index.search("ferritin")
+
+# ------------------------------
+# Reciprocal rank fusion
+# ------------------------------
+
+def test_rrf_prefers_docs_ranked_well_by_both():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "a"]], k=60)
+
+    assert fused[0] == "b"
+    assert set(fused) == {"a", "b", "c"}
+
+def test_rrf_agreement_beats_a_single_first_place():
+    fused = reciprocal_rank_fusion([["x", "shared"], ["y", "shared"]], k=1)
+
+    # shared: 1/3 + 1/3 beats x or y alone: 1/2
+    assert fused[0] == "shared"
+
+def test_rrf_empty():
+    assert reciprocal_rank_fusion([[], []]) == []
+
+# ------------------------------
+# search()
+# ------------------------------
+
+@pytest.fixture
+def payload():
+    from langchain_community.vectorstores import FAISS
+
+    from backend.embeddings import HashEmbeddingProvider
+
+    embeddings = HashEmbeddingProvider(dim=256)
+    store = FAISS.from_texts([text for _, text in DOCS], embeddings, ids=[doc_id for doc_id, _ in DOCS])
+    return (store, BM25Index.build(DOCS)), embeddings
+
+@pytest.fixture(autouse=True)
+def no_reranker(monkeypatch):
+    monkeypatch.setattr(retrieval, "RERANKER_MODEL", "")
+
+def test_search_without_embedding_is_lexical_only(payload):
+    (store, lexical), _ = payload
+
+    docs = retrieval.search((store, lexical), "E11.9", query_embedding=None, k=3, mode="hybrid")
+
+    assert [doc.page_content for doc in docs] == [DOCS[0][1]]
+
+def test_hybrid_search_fuses_both_retrievers(payload):
+    (store, lexical), embeddings = payload
+    query = "ferritin iron deficiency"
+
+    docs = retrieval.search((store, lexical), query, embeddings.embed_query(query), k=3, mode="hybrid")
+
+    assert len(docs) == 3
+    assert docs[0].page_content == DOCS[3][1]
+
+def test_vector_mode_ignores_the_lexical_index(payload):
+    (store, _), embeddings = payload
+    query = "LDL cholesterol target"
+
+    docs = retrieval.search((store, None), query, embeddings.embed_query(query), k=2, mode="vector")
+
+    assert len(docs) == 2
+    assert docs[0].page_content == DOCS[4][1]
+
+def test_use_lexical_only():
+    assert retrieval.use_lexical_only("E11.9", mode="hybrid")
+    assert not retrieval.use_lexical_only("what does a raised TSH mean for my thyroid", mode="hybrid")
+    assert retrieval.use_lexical_only("anything", mode="lexical")
+    assert not retrieval.use_lexical_only("E11.9", mode="vector")
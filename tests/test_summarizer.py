@@ -0,0 +1,151 @@
+import asyncio
+
+import pytest
+
+from backend import summarizer
+from backend.summarizer import (
+    ApproximateEncoding, RateLimiter, build_summary_prompt, count_tokens, get_encoding, plan_batches,
+)
+
+
+# Each is a single token with or without a leading space
+WORDS = ["one", "two", "three", "four", "five", "six", "seven", "eight"]
+
+def words(n: int, word: str = "word") -> str:
+    # Exactly n tokens
+    return word + f" {word}" * (n - 1)
+
+
+class FakeLLM:
+    def __init__(self, reply_tokens: int = 20):
+        self.prompts = []
+        self.reply_tokens = reply_tokens
+
+    async def __call__(self, prompt: str, max_tokens: int) -> str:
+        self.prompts.append(prompt)
+        return words(self.reply_tokens, "summary")
+
+
+@pytest.fixture(autouse=True)
+def no_rate_limit(monkeypatch):
+    monkeypatch.setattr(summarizer, "rate_limiter", RateLimiter(0))
+
+# ------------------------------
+# plan_batches
+# ------------------------------
+
+def test_plan_batches_packs_in_order_within_budget():
+    texts = [words(40, word) for word in WORDS[:5]]
+    batches = plan_batches(texts, budget=100)
+
+    assert len(batches) == 3
+    assert "\n\n".join(batches) == "\n\n".join(texts)
+    for batch in batches:
+        assert sum(count_tokens(text) for text in batch.split("\n\n")) <= 100
+
+def test_plan_batches_truncates_oversized_text():
+    batches = plan_batches([words(10), words(250), words(10)], budget=100)
+
+    assert len(batches) == 3
+    assert len(get_encoding().encode(batches[1])) == 100
+
+def test_plan_batches_empty():
+    assert plan_batches([], budget=100) == []
+
+# ------------------------------
+# build_summary_prompt
+# ------------------------------
+
+def test_short_document_uses_a_single_call():
+    llm = FakeLLM()
+    prompt, timings = asyncio.run(build_summary_prompt(["HbA1c 7.2%", "TSH 2.1"], llm))
+
+    assert timings["mode"] == "single"
+    assert llm.prompts == []
+    assert prompt == summarizer.FINAL_PROMPT.format(text="HbA1c 7.2%\n\nTSH 2.1")
+
+def test_long_document_maps_every_batch(monkeypatch):
+    monkeypatch.setattr(summarizer, "SUMMARY_SINGLE_CALL_TOKENS", 100)
+    monkeypatch.setattr(summarizer, "SUMMARY_MAP_INPUT_TOKENS", 100)
+    llm = FakeLLM()
+    chunks = [words(60, word) for word in WORDS[:6]]
+
+    prompt, timings = asyncio.run(build_summary_prompt(chunks, llm))
+
+    assert timings["mode"] == "map_reduce"
+    assert timings["map_calls"] == len(plan_batches(chunks, 100)) == len(llm.prompts) == 6
+    assert timings["reduce_levels"] == 0
+    assert prompt.startswith(summarizer.REDUCE_PROMPT.format(text=""))
+    assert prompt.split("\n\n", 1)[1].split() == ["summary"] * (6 * llm.reply_tokens)
+
+def test_reduces_until_summaries_fit_the_final_prompt(monkeypatch):
+    monkeypatch.setattr(summarizer, "SUMMARY_SINGLE_CALL_TOKENS", 100)
+    monkeypatch.setattr(summarizer, "SUMMARY_MAP_INPUT_TOKENS", 100)
+    # Final budget: 700 - 500 output - 100 overhead = 100 tokens, i.e. two 40-token summaries
+    monkeypatch.setattr(summarizer, "SUMMARY_CONTEXT_TOKENS", 700)
+    llm = FakeLLM(reply_tokens=40)
+    chunks = [words(60, word) for word in WORDS]
+
+    prompt, timings = asyncio.run(build_summary_prompt(chunks, llm))
+
+    # 8 map calls, then 8 -> 4 -> 2 summaries fit after two reduce levels
+    assert timings["map_calls"] == 8
+    assert timings["reduce_levels"] == 2
+    assert len(llm.prompts) == 8 + 4 + 2
+    assert count_tokens(prompt.split("\n\n", 1)[1]) <= 700 - summarizer.SUMMARY_OUTPUT_TOKENS - summarizer.PROMPT_OVERHEAD_TOKENS
+
+# ------------------------------
+# RateLimiter
+# ------------------------------
+
+def test_rate_limiter_spaces_calls():
+    async def start_times():
+        limiter = RateLimiter(per_minute=600)  # one call per 0.1 s
+        loop = asyncio.get_running_loop()
+        origin = loop.time()
+
+        async def call():
+            await limiter.wait()
+            return loop.time() - origin
+
+        return sorted(await asyncio.gather(*(call() for _ in range(3))))
+
+    first, second, third = asyncio.run(start_times())
+    assert first < 0.05
+    assert second >= 0.09
+    assert third >= 0.19
+
+def test_rate_limiter_disabled_never_waits():
+    async def elapsed():
+        limiter = RateLimiter(per_minute=0)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(100):
+            await limiter.wait()
+        return loop.time() - start
+
+    assert asyncio.run(elapsed()) < 0.05
+
+# ------------------------------
+# Encoding
+# ------------------------------
+
+def test_unloadable_encoding_falls_back_to_an_estimate(monkeypatch):
+    def offline():
+        raise ConnectionError("no network")
+
+    monkeypatch.setattr(summarizer, "_encoding", None)
+    monkeypatch.setattr(summarizer, "_load_encoding", offline)
+
+    assert isinstance(get_encoding(), ApproximateEncoding)
+    assert count_tokens("x" * 40) == 10
+    # Only tried once
+    monkeypatch.setattr(summarizer, "_load_encoding", lambda: pytest.fail("reloaded"))
+    assert count_tokens("abcde") == 2
+
+def test_approximate_encoding_round_trips_prefixes():
+    encoding = ApproximateEncoding()
+    tokens = encoding.encode("TSH 2.1 mIU/L")
+
+    assert encoding.decode(tokens) == "TSH 2.1 mIU/L"
+    assert encoding.decode(tokens[:2]) == "TSH 2.1 "
@@ -0,0 +1,157 @@
+import os
+
+import pytest
+from langchain.schema import Document
+
+from backend import text_indexer
+from backend.embeddings import HashEmbeddingProvider
+from backend.index_manager import read_index_manifest, read_index_version
+from backend.text_indexer import build_text_index_incremental, chunk_id
+
+class CountingEmbeddings(HashEmbeddingProvider):
+    def __init__(self, **kwargs):
+        super().__init__(dim=64, **kwargs)
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return super().embed_documents(texts)
+
+@pytest.fixture
+def parsed(monkeypatch):
+    """
+    Stands in for PDF parsing: each "PDF" is plain text whose paragraphs are
+    its chunks. Records which files were parsed.
+    """
+    seen = []
+
+    def fake_iter_pdf_files(files, parallel=True):
+        for path, sha in files:
+            seen.append(os.path.basename(path))
+            with open(path, encoding="utf-8") as f:
+                chunks = [part.strip() for part in f.read().split("\n\n") if part.strip()]
+            yield path, sha, [Document(page_content=chunk, metadata={"source": path}) for chunk in chunks]
+
+    monkeypatch.setattr(text_indexer, "iter_pdf_files", fake_iter_pdf_files)
+    return seen
+
+@pytest.fixture
+def dirs(tmp_path):
+    pdf_dir = tmp_path / "pdfs"
+    pdf_dir.mkdir()
+    return pdf_dir, str(tmp_path / "index")
+
+def write_pdf(pdf_dir, name: str, *chunks: str):
+    (pdf_dir / name).write_text("\n\n".join(chunks), encoding="utf-8")
+
+def build(pdf_dir, index_path, embeddings, **kwargs):
+    return build_text_index_incremental(str(pdf_dir), embeddings, index_path, **kwargs)
+
+def stored_ids(store) -> set:
+    return set(store.index_to_docstore_id.values())
+
+# ------------------------------
+# Manifest
+# ------------------------------
+
+def test_first_build_records_every_file(parsed, dirs):
+    pdf_dir, index_path = dirs
+    write_pdf(pdf_dir, "a.pdf", "TSH 2.1", "Ferritin 12")
+    write_pdf(pdf_dir, "b.pdf", "HbA1c 7.2")
+    (pdf_dir / "notes.txt").write_text("not a pdf")
+    embeddings = CountingEmbeddings()
+
+    store = build(pdf_dir, index_path, embeddings)
+
+    files = read_index_manifest(index_path)["files"]
+    assert list(files) == ["a.pdf", "b.pdf"]
+    assert files["a.pdf"]["chunks"] == [chunk_id("TSH 2.1"), chunk_id("Ferritin 12")]
+    assert files["a.pdf"]["sha256"] == text_indexer.pdf_sha256(str(pdf_dir / "a.pdf"))
+    assert sorted(embeddings.embedded) == ["Ferritin 12", "HbA1c 7.2", "TSH 2.1"]
+    assert stored_ids(store) == {chunk_id(text) for text in ("TSH 2.1", "Ferritin 12", "HbA1c 7.2")}
+
+def test_unchanged_files_are_not_parsed_or_republished(parsed, dirs):
+    pdf_dir, index_path = dirs
+    write_pdf(pdf_dir, "a.pdf", "TSH 2.1")
+    build(pdf_dir, index_path, CountingEmbeddings())
+    version = read_index_version(index_path)["version"]
+    parsed.clear()
+    embeddings = CountingEmbeddings()
+
+    build(pdf_dir, index_path, embeddings)
+
+    assert parsed == []
+    assert embeddings.embedded == []
+    assert read_index_version(index_path)["version"] == version
+
+def test_changed_file_embeds_only_new_chunks(parsed, dirs):
+    pdf_dir, index_path = dirs
+    write_pdf(pdf_dir, "a.pdf", "TSH 2.1", "Ferritin 12")
+    write_pdf(pdf_dir, "b.pdf", "HbA1c 7.2")
+    build(pdf_dir, index_path, CountingEmbeddings())
+    parsed.clear()
+    write_pdf(pdf_dir, "a.pdf", "TSH 2.1", "Ferritin 30")
+    embeddings = CountingEmbeddings()
+
+    store = build(pdf_dir, index_path, embeddings)
+
+    assert parsed == ["a.pdf"]
+    assert embeddings.embedded == ["Ferritin 30"]
+    assert chunk_id("Ferritin 12") not in stored_ids(store)
+    assert read_index_manifest(index_path)["files"]["a.pdf"]["chunks"] == [chunk_id("TSH 2.1"), chunk_id("Ferritin 30")]
+
+def test_removed_file_drops_chunks_no_other_file_needs(parsed, dirs):
+    pdf_dir, index_path = dirs
+    write_pdf(pdf_dir, "a.pdf", "TSH 2.1", "Shared guidance")
+    write_pdf(pdf_dir, "b.pdf", "Shared guidance")
+    build(pdf_dir, index_path, CountingEmbeddings())
+    os.remove(pdf_dir / "a.pdf")
+
+    store = build(pdf_dir, index_path, CountingEmbeddings())
+
+    assert list(read_index_manifest(index_path)["files"]) == ["b.pdf"]
+    assert stored_ids(store) == {chunk_id("Shared guidance")}
+
+def test_identical_chunks_are_embedded_once(parsed, dirs):
+    pdf_dir, index_path = dirs
+    write_pdf(pdf_dir, "a.pdf", "Shared guidance")
+    write_pdf(pdf_dir, "b.pdf", "Shared guidance")
+    embeddings = CountingEmbeddings()
+
+    store = build(pdf_dir, index_path, embeddings)
+
+    assert embeddings.embedded == ["Shared guidance"]
+    assert store.index.ntotal == 1
+
+def test_file_whose_chunks_are_missing_is_reparsed(parsed, dirs):
+    pdf_dir, index_path = dirs
+    write_pdf(pdf_dir, "a.pdf", "TSH 2.1")
+    store = build(pdf_dir, index_path, CountingEmbeddings())
+    # Same hash in the manifest, but the vector is gone from the store
+    store.delete([chunk_id("TSH 2.1")])
+    store.save_local(f"{index_path}.build")
+    parsed.clear()
+    embeddings = CountingEmbeddings()
+
+    build(pdf_dir, index_path, embeddings)
+
+    assert parsed == ["a.pdf"]
+    assert embeddings.embedded == ["TSH 2.1"]
+
+def test_another_embedding_model_forces_a_rebuild(parsed, dirs):
+    pdf_dir, index_path = dirs
+    write_pdf(pdf_dir, "a.pdf", "TSH 2.1")
+    build(pdf_dir, index_path, CountingEmbeddings())
+    parsed.clear()
+    embeddings = HashEmbeddingProvider(dim=32)
+
+    store = build(pdf_dir, index_path, embeddings)
+
+    assert parsed == ["a.pdf"]
+    assert store.index.d == 32
+    assert read_index_version(index_path)["embedding_model"] == "hash:32"
+
+def test_no_pdfs(parsed, dirs):
+    pdf_dir, index_path = dirs
+
+    assert build(pdf_dir, index_path, CountingEmbeddings()) is None
@@ -1,29 +1,117 @@
-from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
-from openai import OpenAI
-import os
+from backend.index_manager import TextIndexManager, TEXT_INDEX_PATH
+from backend.answer_cache import answer_cache
+from backend.embeddings import create_embedding_provider
+from backend.executors import run_in_thread
+from backend.retrieval import search, use_lexical_only
+from backend.llm_gateway import llm
+from backend.metrics import span
+from backend.prompt_builder import build_rag_prompt, TEXT_RAG_TEMPLATE
+from backend.conversation import conversations, with_history
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-embedding_model = OpenAIEmbeddings()
+# EMBEDDING_PROVIDER picks OpenAI, a local CPU model or the offline hash embedder
+embedding_model = create_embedding_provider()
+# Loaded once per process and hot-swapped when a new index is published
+text_index = TextIndexManager(TEXT_INDEX_PATH, embedding_model)
 
-def process_text_rag(query: str) -> str:
+def cache_namespace(index_version) -> str:
+    # Cached answers (and their embeddings) are only comparable within one embedding
+    # model, and only valid for the corpus they were retrieved from
+    return f"text@{embedding_model.model_id}#{index_version}"
+
+async def _embed_query(query: str):
+    with span("text.embed"):
+        return await embedding_model.aembed_query(query)
+
+async def retrieve_text(query: str, use_cache: bool = True):
+    """
+    Cache lookup and hybrid retrieval. Returns (cached_answer, docs,
+    query_embedding, namespace); `namespace` is where an answer built from
+    these docs is cached, or None with use_cache=False (the caller's prompt
+    differs from a plain text RAG prompt, so its answers are not shared).
+    Code-like queries ("E11.9", "HbA1c") try BM25 alone first and skip the
+    embedding call; they only fall back to it when BM25 finds nothing.
+    """
+    payload, index_version = await run_in_thread(text_index.get_versioned)
+    namespace = cache_namespace(index_version) if use_cache else None
+
+    if use_lexical_only(query):
+        if use_cache:
+            with span("text.cache_lookup"):
+                cached, _ = await answer_cache.lookup(namespace, query)
+            if cached is not None:
+                return cached, None, None, namespace
+        with span("text.search"):
+            docs = await run_in_thread(search, payload, query)
+        if docs:
+            return None, docs, None, namespace
+
+    if use_cache:
+        # The query embedding is needed for the semantic cache check and the search;
+        # the span includes text.embed when the exact-match lookup misses
+        with span("text.cache_lookup"):
+            cached, query_embedding = await answer_cache.lookup(namespace, query, embed=lambda: _embed_query(query))
+        if cached is not None:
+            return cached, None, None, namespace
+    else:
+        query_embedding = await _embed_query(query)
+
+    with span("text.search"):
+        docs = await run_in_thread(search, payload, query, query_embedding)
+    return None, docs, query_embedding, namespace
+
+async def prepare_text_rag(query: str, user_id: str = None):
+    """
+    Cache lookup and retrieval. Returns (cached_answer, prompt, query_embedding,
+    namespace); prompt is None on a cache hit, and the answer is cached under
+    `namespace` unless it is None. With user_id the prompt carries the
+    user's conversation so far, and such answers are not cached.
+    """
+    session = await conversations.get(user_id) if user_id else None
+    if session is None or session.is_empty():
+        cached, docs, query_embedding, namespace = await retrieve_text(query)
+        if cached is not None:
+            return cached, None, None, None
+        template, fields = TEXT_RAG_TEMPLATE, {}
+    else:
+        _, docs, query_embedding, namespace = await retrieve_text(session.retrieval_query(query), use_cache=False)
+        template, fields = with_history(TEXT_RAG_TEMPLATE), {"history": session.render()}
+
+    # Deduplicated and packed to RAG_CONTEXT_TOKENS, best passages first
+    with span("text.prompt"):
+        prompt, _ = build_rag_prompt(query, [doc.page_content for doc in docs], template, **fields)
+    return None, prompt, query_embedding, namespace
+
+async def process_text_rag(query: str, user_id: str = None) -> str:
     """
     Performs text-based RAG using FAISS and returns GPT-4 response.
     """
-    vectorstore = FAISS.load_local(
-    "faiss_text_index",
-    embedding_model,
-    allow_dangerous_deserialization=True)
-    docs = vectorstore.similarity_search(query, k=3)
-    context = "\n\n".join([doc.page_content for doc in docs])
+    cached, prompt, query_embedding, namespace = await prepare_text_rag(query, user_id)
+    if cached is not None:
+        answer = cached
+    else:
+        answer = (await llm.complete(prompt, route="text_rag")).text
+        if namespace is not None:
+            await answer_cache.store(namespace, query, answer, query_embedding)
 
-    prompt = f"Using the context below, answer the medical query:\n\n{context}\n\nQuestion: {query}"
+    if user_id:
+        await conversations.record(user_id, query, answer)
+    return answer
 
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.3,
-        max_tokens=500
-    )
+async def stream_text_rag(query: str, user_id: str = None):
+    """
+    Same as process_text_rag but yields GPT-4 tokens as they arrive.
+    """
+    cached, prompt, query_embedding, namespace = await prepare_text_rag(query, user_id)
+    if cached is not None:
+        yield cached
+        answer = cached
+    else:
+        stream = llm.stream(prompt, route="text_rag")
+        async for token in stream:
+            yield token
+        answer = stream.result.text
+        if namespace is not None:
+            await answer_cache.store(namespace, query, answer, query_embedding)
 
-    return response.choices[0].message.content.strip()
+    if user_id:
+        await conversations.record(user_id, query, answer)
@@ -0,0 +1,168 @@
+import hashlib
+import os
+import shutil
+import time
+
+from langchain_community.vectorstores import FAISS as TextFAISS
+
+from backend.index_manager import TEXT_INDEX_PATH, publish_text_index, read_index_manifest, read_index_version
+from backend.index_factory import TEXT_INDEX_TYPE, build_index, index_kind, reconstruct_all
+from backend.embeddings import LEGACY_EMBEDDING_MODEL, embedding_model_id
+from backend.pdf_ingest import iter_pdf_files, pdf_sha256
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+# Save a resumable checkpoint after this many embedded batches
+INDEX_CHECKPOINT_EVERY = int(os.getenv("INDEX_CHECKPOINT_EVERY", "4"))
+
+# ------------------------------
+# Hashing and chunking
+# ------------------------------
+
+def chunk_id(text: str) -> str:
+    # Content-addressed, so identical chunks in different PDFs are embedded once
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+# ------------------------------
+# Store helpers
+# ------------------------------
+
+def _load_store(path: str, embeddings):
+    if not os.path.exists(os.path.join(path, "index.faiss")):
+        return None
+    return TextFAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+
+def _serving_store(vectorstore, kind: str):
+    """
+    The store to publish: the exact working store itself, or a copy whose
+    index is rebuilt as an ANN index over the same vector order.
+    """
+    if kind == "flat" or vectorstore.index.ntotal == 0:
+        return vectorstore
+    ann_index = build_index(kind, reconstruct_all(vectorstore.index))
+    return TextFAISS(vectorstore.embeddings, ann_index, vectorstore.docstore, dict(vectorstore.index_to_docstore_id))
+
+def _store_ids(vectorstore) -> set:
+    return set(vectorstore.index_to_docstore_id.values()) if vectorstore is not None else set()
+
+def _add_batch(vectorstore, embeddings, batch):
+    texts = [doc.page_content for _, doc in batch]
+    metadatas = [doc.metadata for _, doc in batch]
+    ids = [cid for cid, _ in batch]
+    vectors = embeddings.embed_documents(texts)
+
+    if vectorstore is None:
+        return TextFAISS.from_embeddings(list(zip(texts, vectors)), embeddings, metadatas=metadatas, ids=ids)
+    vectorstore.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+    return vectorstore
+
+# ------------------------------
+# Incremental build
+# ------------------------------
+
+def build_text_index_incremental(pdf_dir: str, embeddings, index_path: str = TEXT_INDEX_PATH,
+                                 rebuild: bool = False, kind: str = TEXT_INDEX_TYPE):
+    """
+    Brings `index_path` in line with the PDFs in `pdf_dir`, embedding only
+    chunks that are not already indexed and dropping vectors for chunks no
+    file produces any more.
+
+    Edits happen on an exact (flat) working store in `<index_path>.build`,
+    which doubles as the checkpoint: an interrupted build resumes from it.
+    For ANN `kind`s the working store is kept and the published index is
+    derived from it, since IVF-PQ vectors cannot be recovered exactly and
+    HNSW does not support deletion.
+    """
+    start = time.perf_counter()
+    work_path = f"{index_path}.build"
+
+    published = read_index_version(index_path)
+    if published and not rebuild:
+        built_with = published.get("embedding_model", LEGACY_EMBEDDING_MODEL)
+        if built_with != embedding_model_id(embeddings):
+            # Vectors from another model cannot be mixed with new ones
+            print(f"⚠️ Index was built with '{built_with}', now using '{embedding_model_id(embeddings)}'; rebuilding")
+            rebuild = True
+
+    manifest = None if rebuild else read_index_manifest(index_path)
+    vectorstore = None
+    if rebuild:
+        shutil.rmtree(work_path, ignore_errors=True)
+    elif os.path.exists(os.path.join(work_path, "index.faiss")):
+        print(f"♻️ Using working store: {work_path}")
+        vectorstore = _load_store(work_path, embeddings)
+    else:
+        vectorstore = _load_store(index_path, embeddings)
+        if vectorstore is not None and index_kind(vectorstore.index) != "flat":
+            print("⚠️ Published index is approximate and has no working store; rebuilding")
+            vectorstore, manifest = None, None
+        elif vectorstore is not None and manifest is None:
+            print("⚠️ Existing index has no manifest; its vectors will be replaced")
+
+    known_files = (manifest or {}).get("files", {})
+    existing = _store_ids(vectorstore)
+
+    # 1. Work out which files changed since the last published build
+    files = {}
+    changed = []
+    for fname in sorted(os.listdir(pdf_dir)):
+        if not fname.endswith(".pdf"):
+            continue
+        sha = pdf_sha256(os.path.join(pdf_dir, fname))
+        previous = known_files.get(fname)
+        # Unchanged and fully present in the store: nothing to read or embed
+        if previous and previous["sha256"] == sha and existing.issuperset(previous["chunks"]):
+            files[fname] = previous
+            continue
+        changed.append((os.path.join(pdf_dir, fname), sha))
+
+    # Changed files are parsed across the process pool; page text is cached by hash
+    pending_docs = {}
+    for path, sha, docs in iter_pdf_files(changed):
+        print(f"📄 Loaded PDF: {os.path.basename(path)} ({len(docs)} chunks)")
+        ids = [chunk_id(doc.page_content) for doc in docs]
+        files[os.path.basename(path)] = {"sha256": sha, "chunks": ids}
+        pending_docs.update(zip(ids, docs))
+    # Completion order varies; keep the manifest sorted by file name
+    files = dict(sorted(files.items()))
+
+    removed = sorted(set(known_files) - set(files))
+    for fname in removed:
+        print(f"🗑️ Removed PDF: {fname}")
+
+    # 2. Diff the chunk ids every file needs against what the store holds
+    needed = {cid for entry in files.values() for cid in entry["chunks"]}
+    to_delete = sorted(existing - needed)
+    to_add = [(cid, pending_docs[cid]) for cid in sorted(needed - existing)]
+
+    print(f"✂️ {len(needed)} chunks needed: {len(to_add)} to embed, {len(to_delete)} to delete")
+
+    if to_delete:
+        vectorstore.delete(to_delete)
+
+    # 3. Embed the new chunks in batches, checkpointing as we go
+    for batch_number, offset in enumerate(range(0, len(to_add), EMBED_BATCH_SIZE), start=1):
+        batch = to_add[offset:offset + EMBED_BATCH_SIZE]
+        vectorstore = _add_batch(vectorstore, embeddings, batch)
+        print(f"🧮 Embedded {min(offset + EMBED_BATCH_SIZE, len(to_add))}/{len(to_add)} chunks")
+        if batch_number % INDEX_CHECKPOINT_EVERY == 0:
+            vectorstore.save_local(work_path)
+
+    if vectorstore is None:
+        print(f"⚠️ No PDFs to index in {pdf_dir}")
+        return None
+
+    # 4. Publish in the layout text_handler loads
+    published_kind = (published or {}).get("index_type", "flat")
+    unchanged = not to_add and not to_delete and manifest is not None and files == known_files and published_kind == kind
+    if unchanged:
+        print("✅ Text index already up to date")
+    else:
+        publish_text_index(_serving_store(vectorstore, kind), index_path, manifest={"files": files}, index_type=kind)
+        print(f"✅ Text index ({kind}) published to: {index_path} ({time.perf_counter() - start:.1f}s)")
+
+    # A flat published index is its own working store; ANN builds keep the exact copy
+    if kind == "flat":
+        shutil.rmtree(work_path, ignore_errors=True)
+    else:
+        vectorstore.save_local(work_path)
+    return vectorstore
@@ -22,4 +22,7 @@ class QueryLog(BaseModel):
     input_summary: Optional[str] = None
     model_used: Optional[str] = "gpt-4"
     response: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    request_id: Optional[str] = None
     timestamp: datetime = datetime.utcnow()
\ No newline at end of file
@@ -1,9 +1,96 @@
 import uuid
 import os
 from PIL import Image
-from fastapi import UploadFile
+from fastapi import UploadFile, HTTPException
+from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
 from typing import Tuple
 import io
+import json
+from backend.executors import run_in_thread
+
+# Largest accepted upload, and the size past which an upload spills from memory to disk
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(100 * 1024 * 1024)))
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(16 * 1024 * 1024)))
+# Multipart boundaries and the other form fields ride on top of the file itself
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+def _set_spool_size(parser_class, size: int):
+    # Starlette streams multipart files into a SpooledTemporaryFile of this size;
+    # the setting is `spool_max_size` since 0.36 and `max_file_size` before
+    for name in ("spool_max_size", "max_file_size"):
+        if hasattr(parser_class, name):
+            setattr(parser_class, name, size)
+            return
+    raise RuntimeError("Unsupported Starlette version: cannot set the multipart spool size")
+
+try:
+    from starlette.formparsers import MultiPartParser
+except ImportError:
+    pass
+else:
+    _set_spool_size(MultiPartParser, UPLOAD_SPOOL_BYTES)
+
+# Reject oversized request bodies while they stream in, before they are spooled
+class UploadLimitMiddleware:
+    def __init__(self, app, max_bytes: int = UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and int(content_length) > self.max_bytes:
+            response = JSONResponse({"detail": "Upload too large"}, status_code=413)
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail="Upload too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+# Size of an upload without reading it
+def upload_size(uploaded_file: UploadFile) -> int:
+    if getattr(uploaded_file, "size", None) is not None:
+        return uploaded_file.size
+    f = uploaded_file.file
+    position = f.tell()
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    f.seek(position)
+    return size
+
+# True while a spooled upload still lives in memory (has not spilled to disk)
+def is_in_memory(fileobj) -> bool:
+    # A SpooledTemporaryFile wraps a BytesIO until it rolls over to a real file
+    return isinstance(getattr(fileobj, "_file", fileobj), io.BytesIO)
+
+# Filesystem path of an upload's spool file, if it has one (rolled-over spools are usually unnamed)
+def spool_path(fileobj):
+    name = getattr(getattr(fileobj, "_file", fileobj), "name", None)
+    return name if isinstance(name, str) and os.path.isfile(name) else None
+
+# Use the upload's own spooled buffer directly (no copy) and always clean it up
+@asynccontextmanager
+async def open_upload(uploaded_file: UploadFile, max_bytes: int = UPLOAD_MAX_BYTES):
+    try:
+        if upload_size(uploaded_file) > max_bytes:
+            raise HTTPException(status_code=413, detail="Upload too large")
+        uploaded_file.file.seek(0)
+        yield uploaded_file.file
+    finally:
+        # Closing a spilled SpooledTemporaryFile deletes its disk copy
+        await uploaded_file.close()
 
 # Save uploaded file temporarily and return the path
 async def save_upload_file(uploaded_file: UploadFile, folder: str = "temp") -> str:
@@ -12,11 +99,14 @@ async def save_upload_file(uploaded_file: UploadFile, folder: str = "temp") -> s
     file_path = os.path.join(folder, unique_name)
 
     contents = await uploaded_file.read()
-    with open(file_path, "wb") as f:
-        f.write(contents)
+    await run_in_thread(write_bytes, file_path, contents)
 
     return file_path
 
+def write_bytes(file_path: str, contents: bytes):
+    with open(file_path, "wb") as f:
+        f.write(contents)
+
 # Generate unique filename to avoid collisions
 def generate_unique_filename(filename: str) -> str:
     ext = get_file_extension(filename)
@@ -30,6 +120,21 @@ def get_file_extension(filename: str) -> str:
 def load_image_pil(image_bytes: bytes) -> Image.Image:
     return Image.open(io.BytesIO(image_bytes)).convert("RGB")
 
+# Format one Server-Sent Event
+def sse_event(data: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+# Current resident set size of this process in bytes
+def current_rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        # ru_maxrss is the peak (KiB on Linux), the best we have off /proc
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
 if __name__ == "__main__":
     print("✅ utils.py loaded successfully!")
     print("Available function:", save_upload_file)